@@ -10,10 +10,24 @@ from google_images_search import GoogleImagesSearch
 import requests
 from io import BytesIO
 from PIL import Image, ImageTk, UnidentifiedImageError
-import csv
 from ttkthemes import ThemedStyle
 import math
 import os
+import itertools
+from contextlib import nullcontext
+from car_search import find_matching_row_ids, find_ranked_row_ids, get_executed_statement, get_search_query, write_rows_as_csv
+from connection_pool import get_connection_pool
+from data_profile import format_column_profile, get_completeness, get_data_profile, get_search_data_profile
+from model_index import get_loaded_model_index, get_model_index
+from facets import get_facet_counts
+from live_filter import LiveFilter
+from result_cache import iterate_rows_by_id
+from search_executor import SearchExecutor, run_in_gui_thread
+from search_spec import BODY_CATEGORY_CHECKBOXES, COUNTRY_CHECKBOXES, CYLINDER_COUNT_CHECKBOXES, SearchSpec, get_search_spec
+from similar_cars import find_cars_like
+from statistics_catalog import get_brand_catalog, get_column_range
+from text_search import ensure_text_index, rank_text_matches
+from tracing import trace_span
 
 
 # initial paramaters
@@ -112,21 +126,6 @@ variable_names = [
     "Charging Time (h): "
     ]
 
-# List of car categories and corresponding keywords
-car_body_categories = {
-    "Roadster": ["Roadster", "Speedster"],
-    "Coupe": ["Coupe", "Fastback", "Hardtop"],
-    "Hatchback": ["Hatchback", "Liftback"],
-    "Spyder": ["Spyder", "Spider"],
-    "Cabriolet": ["Cabriolet"],
-    "Sedan": ["Sedan", "Targa"],
-    "Wagon": ["Wagon"],
-    "SUV": ["SUV", "Crossover"],
-    "Pickup": ["Pickup"],
-    "Van": ["Van", "Minivan"],
-    "Limousine": ["Limousine"],
-    }
-
 Basic_variable_names = ["Make: ", "Model: ", "From Year: ", "To Year: ", "Car Series: ", "Trim: ", "Curb Weight (kg): ",
                         "Full Weight (kg): ", "Engine HP: ", "Transmission: "]
 # Turns the variable_names list into a 2D array, marking the Basic_Variable_Names which are shown in simple searches
@@ -142,11 +141,8 @@ for i, g in enumerate(variable_names):
 # Returns True for valid access, False for error
 def is_valid_sqlite3_database(file_path):
     try:
-        conn = sqlite3.connect(file_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        cursor = get_connection_pool(file_path).execute("SELECT name FROM sqlite_master WHERE type='table';")
         cursor.fetchall()
-        conn.close()
         # Check if the file has read access
         if os.access(file_path, os.R_OK):
             # print("Read access is granted.")
@@ -163,86 +159,44 @@ def apply_ttk_theme():
     style.set_theme('clam')
 
 
-# Method to categorize car models based on keywords
-# Used in the program to search cars by keywords such as "Coupe" or "Hatchback", used in "sort_car_series_column_by_keywords"
-def categorize_model(model_name, categories):
-    for category, keywords in categories.items():
-        for keyword in keywords:
-            if keyword.lower() in model_name.lower():
-                return category
-    return None
-
-
-# Method to sort and categorize car series column in the database
-# Returns a 2D array of all the cars that fit under a certain keyword
-def sort_car_series_column_by_keywords(database_path, table_name, categories):
-    try:
-        results = {}
-        with sqlite3.connect(database_path) as connection:
-            cursor = connection.cursor()
-
-            # Select car series column from the database
-            cursor.execute(f"SELECT DISTINCT series FROM {table_name}")
-            car_series_rows = cursor.fetchall()
-
-            # Create an empty dictionary to store categorized models
-            categorized_models = {category: [] for category in categories}
-
-            # Iterate through the car series rows and categorize the models
-            for row in car_series_rows:
-                car_series = row[0]
-                category = categorize_model(car_series, categories)
-                if category:
-                    categorized_models[category].append(car_series)
-
-            # Store the categorized models in the 'results' dictionary
-            for category, models in categorized_models.items():
-                results[category] = models
-
-        # print(results)
-        return results  # Return the results as a dictionary
-
-    except sqlite3.Error as e:
-        print(f"SQLite error: {e}")
-        return {}  # Return an empty dictionary in case of an error
-
-
 # Method takes a brand and shows all the models under said brand, used to help the user find models after selecting their brand,
 #   This is because (at time of writing) the 68,000 unique models in the database are overwhelming to look at
 # Returns the unique models of the chosen brand (make)
 def search_by_brand_show_model_only(database_path, table_name, brand_string):
     try:
-        with sqlite3.connect(database_path) as connection:
-            # Connects to the SQL database
-            # Creates a cursor to interact with the database
-            cursor = connection.cursor()
-            # strip leading and trailing whitespace from seaerch words
-            brand_list = [brand.strip() for brand in brand_string.split(',')]
-            model_list = []
-            # Constructs a search query for the database
-            # Distinct means that only unique models are chosen
-            search_query = f"SELECT DISTINCT model FROM {table_name} WHERE make IN ({','.join(['?'] * len(brand_list))})"
-            # Executes the search query
-            cursor.execute(search_query, brand_list)
-            # fetches all matching rows
-            rows = cursor.fetchall()
-            if len(rows) > 0:
-                # print("Column Names:", column_names)
-                # Puts them in a set, sets ignore any duplicates automatically
-                unique_models = set()
-                # print each matching row
-                for row in rows:
-                    unique_models.add(row[0])
-                else:
-                    # Uncomment for debugging purposes
-                    # print("Finished search")
-                    pass
-                # the sorted command automatically sorts them alphanumerically
-                for model in sorted(unique_models):
-                    model_list.append(model)
-                    # print(model)
+        # strip leading and trailing whitespace from seaerch words
+        brand_list = [brand.strip() for brand in brand_string.split(',')]
+        model_list = []
+
+        # The model index holds the sorted models of every brand and also matches partial brand names, so no query is needed
+        model_index = get_model_index(database_path, table_name)
+        if model_index is not None:
+            return model_index.get_models(brand_string)
+
+        # Constructs a search query for the database
+        # Distinct means that only unique models are chosen
+        search_query = f"SELECT DISTINCT model FROM {table_name} WHERE make IN ({','.join(['?'] * len(brand_list))})"
+        # Executes the search query on the shared connection
+        cursor = get_connection_pool(database_path).execute(search_query, brand_list)
+        # fetches all matching rows
+        rows = cursor.fetchall()
+        if len(rows) > 0:
+            # print("Column Names:", column_names)
+            # Puts them in a set, sets ignore any duplicates automatically
+            unique_models = set()
+            # print each matching row
+            for row in rows:
+                unique_models.add(row[0])
+            else:
+                # Uncomment for debugging purposes
+                # print("Finished search")
+                pass
+            # the sorted command automatically sorts them alphanumerically
+            for model in sorted(unique_models):
+                model_list.append(model)
+                # print(model)
 
-            return model_list
+        return model_list
 
     except sqlite3.Error as e:
         print("An error occured:", e)
@@ -250,18 +204,11 @@ def search_by_brand_show_model_only(database_path, table_name, brand_string):
 
 
 # Returns either the min or the max year in the database out of all the cars based on the min_max_flag
+# All the get_min_max_* methods are served from the statistics catalog, which computes every range in a single pass
+#   and only scans the table again when the database file changes
 def get_min_max_year(database_path, table_names, min_max_flag):
     try:
-        with sqlite3.connect(database_path) as connection:
-            cursor = connection.cursor()
-            if min_max_flag == "min":
-                search_query = (f"SELECT MIN(year_from) FROM {table_names}")
-            elif min_max_flag == "max":
-                search_query = (f"SELECT MAX(year_to) FROM {table_names}")
-            cursor.execute(search_query)
-            result = cursor.fetchone()
-            if result and result[0] is not None:
-                return round(result[0])
+        return get_column_range(database_path, table_names, "year", min_max_flag)
     except sqlite3.Error as e:
         print("An error occurred while fetching min and max years:", e)
         return 1000
@@ -271,75 +218,31 @@ def get_min_max_year(database_path, table_names, min_max_flag):
 # Data returned by the method is self-explanatory in the method's name
 def get_min_max_seating_capacity(min_max_flag, database_path, table_names):
     try:
-        with sqlite3.connect(database_path) as connection:
-            cursor = connection.cursor()
-            if min_max_flag == "min":
-                search_query = f"SELECT MIN(number_of_seats) FROM {table_names}"
-            elif min_max_flag == "max":
-                search_query = f"SELECT MAX(number_of_seats) FROM {table_names}"
-            cursor.execute(search_query)
-            result = cursor.fetchone()
-            if result and result[0] is not None:
-                seats_num = result[0]
-                # Split the string by commas and convert the parts to integers
-                numbers = [int(number.strip()) for number in seats_num.split(',')]
-                # Find the maximum number among the extracted integers
-            if min_max_flag == "min":
-                return min(numbers)
-            elif min_max_flag == "max":
-                return max(numbers)
+        return get_column_range(database_path, table_names, "seating_capacity", min_max_flag)
     except sqlite3.Error as e:
-        print("An error occurred while fetching min and max years:", e)
+        print("An error occurred while fetching min and max seating capacity:", e)
         return 1
 
 
 def get_min_max_engine_hp(min_max_flag, database_path, table_names):
     try:
-        with sqlite3.connect(database_path) as connection:
-            cursor = connection.cursor()
-            if min_max_flag == "min":
-                search_query = (f"SELECT MIN(engine_hp) FROM {table_names}")
-            elif min_max_flag == "max":
-                search_query = (f"SELECT MAX(engine_hp) FROM {table_names}")
-            cursor.execute(search_query)
-            result = cursor.fetchone()
-            if result and result[0] is not None:
-                return result[0]
+        return get_column_range(database_path, table_names, "engine_hp", min_max_flag)
     except sqlite3.Error as e:
-        print("An error occurred while fetching min and max years:", e)
+        print("An error occurred while fetching min and max engine hp:", e)
         return 0
 
 
 def get_min_max_curb_weight(min_max_flag, database_path, table_names):
     try:
-        with sqlite3.connect(database_path) as connection:
-            cursor = connection.cursor()
-            if min_max_flag == "min":
-                search_query = (f"SELECT MIN(curb_weight_kg) FROM {table_names}")
-            elif min_max_flag == "max":
-                search_query = (f"SELECT MAX(curb_weight_kg) FROM {table_names}")
-            cursor.execute(search_query)
-            result = cursor.fetchone()
-            if result and result[0] is not None:
-                return result[0]
+        return get_column_range(database_path, table_names, "curb_weight", min_max_flag)
     except sqlite3.Error as e:
-        print("An error occurred while fetching min and max years:", e)
+        print("An error occurred while fetching min and max curb weight:", e)
         return 0
 
 
 def get_min_max_power_to_weight_ratio(min_max_flag, database_path, table_name):
-    min_max_column = "engine_hp / NULLIF(curb_weight_kg, 0)"  # Calculate power-to-weight ratio
     try:
-        with sqlite3.connect(database_path) as connection:
-            cursor = connection.cursor()
-            if min_max_flag == "min":
-                search_query = f"SELECT MIN({min_max_column}) FROM {table_name}"
-            elif min_max_flag == "max":
-                search_query = f"SELECT MAX({min_max_column}) FROM {table_name}"
-            cursor.execute(search_query)
-            result = cursor.fetchone()
-            if result and result[0] is not None:
-                return round(result[0], 2)
+        return get_column_range(database_path, table_name, "power_to_weight_ratio", min_max_flag)
     except sqlite3.Error as e:
         print(f"An error occurred while fetching {min_max_flag} power-to-weight ratio:", e)
         return None
@@ -347,35 +250,15 @@ def get_min_max_power_to_weight_ratio(min_max_flag, database_path, table_name):
 
 def get_min_max_displacement(min_max_flag, database_path, table_names):
     try:
-        with sqlite3.connect(database_path) as connection:
-            cursor = connection.cursor()
-            if min_max_flag == "min":
-                search_query = (f"SELECT MIN(capacity_cm3) FROM {table_names}")
-            elif min_max_flag == "max":
-                search_query = (f"SELECT MAX(capacity_cm3) FROM {table_names}")
-            cursor.execute(search_query)
-            result = cursor.fetchone()
-            if result and result[0] is not None:
-                return result[0]
+        return get_column_range(database_path, table_names, "displacement", min_max_flag)
     except sqlite3.Error as e:
-        print("An error occurred while fetching min and max years:", e)
+        print("An error occurred while fetching min and max displacement:", e)
         return 0
 
 
 def get_min_max_top_speed(min_max_flag, database_path, table_names):
     try:
-        with sqlite3.connect(database_path) as connection:
-            cursor = connection.cursor()
-            if min_max_flag == "min":
-                search_query = (f"SELECT MIN(CAST(max_speed_km_per_h AS REAL)) FROM {table_names} WHERE "
-                                f"max_speed_km_per_h NOT LIKE '%[^0-9.]%'")
-            elif min_max_flag == "max":
-                search_query = (f"SELECT MAX(CAST(max_speed_km_per_h AS REAL)) FROM {table_names} WHERE "
-                                f"max_speed_km_per_h NOT LIKE '%[^0-9.]%'")
-            cursor.execute(search_query)
-            result = cursor.fetchone()
-            if result and result[0] is not None:
-                return result[0]
+        return get_column_range(database_path, table_names, "top_speed", min_max_flag)
     except sqlite3.Error as e:
         print("An error occurred while fetching min top speed:", e)
         return 0  # Return default value in case of an error
@@ -386,6 +269,28 @@ class CarSortGUI:
         self.root = root
         self.root.title("Car Sorting")
 
+        # Streamed results still to be shown, for every results box
+        self.result_streams = {}
+        # Stream whose next page is being read, for every results box
+        self.loading_result_pages = {}
+        # Runs the searches on a worker thread, so the window keeps responding while the database is busy
+        self.search_executor = SearchExecutor(root)
+        # Brands shown in the brand dropdowns, loaded once and shared by both pages
+        self.brand_names = print_brand_names_only(database_path, table_names)
+        # Pending debounced model dropdown updates, for every dropdown
+        self.model_lookup_timers = {}
+        # The model index is loaded in the background, so it is ready by the time the user types a brand
+        self.search_executor.submit("model index", lambda: get_model_index(database_path, table_names))
+        # The keyword index is built on the worker too, before any search, as building it writes to the database file
+        self.search_executor.submit("text index", lambda: ensure_text_index(database_path, table_names))
+        # Checkboxes showing the number of cars they would find, as (checkbutton, text, group, value), and the last counts
+        self.facet_checkbuttons = []
+        self.facet_counts = None
+        self.filter_update_timer = None
+        # Live results of the advanced page, kept between updates so that narrowing a filter refines the previous cars
+        self.live_filter = LiveFilter(database_path, table_names)
+        self.live_results_var = tkinter.IntVar(value=0)
+
         # Initialize fuel type vars
         self.fuel_type_gasoline_var = tkinter.IntVar(value=1)
         self.fuel_type_diesel_var = tkinter.IntVar(value=1)
@@ -479,6 +384,13 @@ class CarSortGUI:
         self.create_main_page()
         self.create_advanced_page()
 
+        # The checkbox counts follow every change of the checkboxes of the advanced page (the sliders update them too)
+        for checkboxes in self.get_checkbox_variables().values():
+            for variable, _ in checkboxes:
+                variable.trace_add("write", self.schedule_filter_update)
+        self.add_facet_checkbuttons(self.advanced_frame)
+        self.schedule_filter_update()
+
         # Initially, show the main page
         self.show_main_page()
 
@@ -502,7 +414,7 @@ class CarSortGUI:
         self.max_year_slider.set(get_min_max_year(database_path, table_names, "max"))
 
         self.brand_label = ttk.Label(self.main_frame, text="Brand:")
-        self.brand_dropdown = ttk.Combobox(self.main_frame, values=print_brand_names_only(database_path, table_names), height=20)
+        self.brand_dropdown = ttk.Combobox(self.main_frame, values=self.brand_names, height=20)
         # This code makes it so that if the user types or selects the Brand drop-down box, the model dropdown gets automatically updated
         #   to include the models offered by said brands
         self.brand_dropdown.bind("<<ComboboxSelected>>", self.update_model_dropdown)
@@ -511,6 +423,12 @@ class CarSortGUI:
         # The model dropdown box is initialized as empty, its contents are decided by what brand is chosen by the user
         self.model_label = ttk.Label(self.main_frame, text="Model:")
         self.model_dropdown = ttk.Combobox(self.main_frame, values=[], height=20)
+        # A misspelled model is replaced by the closest models in the dropdown
+        self.model_dropdown.bind("<KeyRelease>", lambda event: self.update_model_suggestions("model suggestions", self.model_dropdown, self.brand_dropdown, event))
+
+        # Free text, such as "GT3 RS" or "Type R", found in the make, model, series, generation or trim of the cars
+        self.text_label = ttk.Label(self.main_frame, text="Keywords:")
+        self.text_entry = ttk.Entry(self.main_frame, width=23)
 
         self.results_label = ttk.Label(self.main_frame, text="Results:")
         self.results_text = tkinter.Text(self.main_frame, height=20, width=60)
@@ -521,7 +439,7 @@ class CarSortGUI:
         self.go_to_website = ttk.Button(self.main_frame, text="Go to Website", command=lambda: self.go_to_make_website('basic'))
 
         self.search_button = ttk.Button(self.main_frame, text="Search")
-        self.search_button["command"] = lambda: self.search_by_model(database_path, table_names, self.brand_dropdown.get(), self.model_dropdown.get(), round(self.min_year_slider.get()), round(self.max_year_slider.get()), variable_names, "simple")
+        self.search_button["command"] = lambda: self.search_by_model(database_path, table_names, self.brand_dropdown.get(), self.model_dropdown.get(), round(self.min_year_slider.get()), round(self.max_year_slider.get()), variable_names, "simple", self.text_entry.get())
 
         # Add the "See Advanced" button
         self.see_advanced_button = ttk.Button(self.main_frame, text="See Advanced", command=self.show_advanced_page)
@@ -536,6 +454,8 @@ class CarSortGUI:
         self.brand_dropdown.grid()
         self.model_label.grid()
         self.model_dropdown.grid()
+        self.text_label.grid()
+        self.text_entry.grid()
         self.results_label.grid()
         self.results_text.grid()
         self.find_image_button.grid()
@@ -545,58 +465,290 @@ class CarSortGUI:
         self.see_advanced_button.grid()
 
     # noinspection PyTypeChecker
-    def search_by_model(self, database_path, table_names, brand, model, year_from, year_to, variable_names, complexity):
-        results, count, *_ = search_by_model(database_path, table_names, brand, model, year_from, year_to, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, variable_names, complexity, None, None, None, None)
-
-        if results and results != "T" and count != 'h':
-            # Clear the existing text in the Text widget
-            self.results_text.delete(1.0, tkinter.END)
-            # Insert the results into the Text widget
-            self.results_text.insert(tkinter.END, results)
-            self.results_label.config(text=f"Results: {count}")
-        else:
-            # If no results were found, show a message
-            self.results_text.delete(1.0, tkinter.END)
-            self.results_text.insert(tkinter.END, "No data found for this search, OR, an error occured")
+    def search_by_model(self, database_path, table_names, brand, model, year_from, year_to, variable_names, complexity, text=None):
+        search_spec = SearchSpec(brand, model, text, year=(year_from, year_to))
+
+        # Shows the results on the Tk thread once the search is done
+        def show_results(search_result):
+            results, count, *_ = search_result
+            if results and results != "T" and count != 'h' and count != 0:
+                # Shows the first page straight away, the rest is added while scrolling
+                self.show_streamed_results(self.results_text, self.results_label, results, count)
+            else:
+                # If no results were found, show a message
+                self.result_streams.pop(self.results_text, None)
+                self.results_text.delete(1.0, tkinter.END)
+                self.results_text.insert(tkinter.END, "No data found for this search, OR, an error occured")
 
-    # This method calls the search_by_model method and formats the data appropriately, updating the correct GUI elements to allow the data to be displayed to the user
-    def search_by_model_advanced_page(self, database_path, table_names, brand, model, year_from, year_to, seating_capacity_min, seating_capacity_max, engine_hp_min, engine_hp_max, curb_weight_kg_min, curb_weight_kg_max, power_to_weight_ratio_min, power_to_weight_ratio_max, displacement_min, displacement_max, top_speed_min, top_speed_max, engine_front_bool, engine_mid_bool, engine_rear_bool, gasoline_bool, diesel_bool, hybrid_bool, electric_bool, other_fuel_type_bool, fwd_drivetrain_bool, rwd_drivetrain_bool, awd_drivetrain_bool, car_type_roadster_bool, car_type_coupe_bool, car_type_hatchback_bool, car_type_spyder_bool, car_type_cabriolet_bool, car_type_sedan_bool, car_type_wagon_bool, car_type_suv_bool, car_type_pickup_bool, car_type_van_bool, car_type_limousine_bool, manual_transmission_bool, automatic_transmission_bool, Bore_Stroke_Undersquare_bool, Bore_Stroke_Square_bool, Bore_Stroke_Oversquare_bool, United_Kingdom_bool, Japan_bool, Germany_bool, Italy_bool, France_bool, United_States_bool, Belgium_bool, Romania_bool, South_Korea_bool, Russia_bool, Switzerland_bool, China_bool, India_bool, Latvia_bool, Fictional_bool, Malaysia_bool, Netherlands_bool, Poland_bool, Czech_Republic_bool, Spain_bool, Australia_bool, Iran_bool, Sweden_bool, Austria_bool, Ukraine_bool, Taiwan_bool, Luxembourg_bool, Brazil_bool, Uzbekistan_bool, Croatia_bool, Turkey_bool, Serbia_bool, Kazakhstan_bool, _8_cylinders_bool, _4_cylinders_bool, _6_cylinders_bool, _5_cylinders_bool, _2_cylinders_bool, _12_cylinders_bool, _3_cylinders_bool, _10_cylinders_bool, _1_cylinders_bool, _7_cylinders_bool, _16_cylinders_bool, V_type_engine_layout_bool, Inline_engine_layout_bool, Opposed_engine_layout_bool, W_type_engine_layout_bool, Rotary_engine_layout_bool, variable_names, complexity, csv_export_boolean, query_export_boolean, query_import_boolean, query):
-        results, count, *_ = search_by_model(database_path, table_names, brand, model, year_from, year_to, seating_capacity_min, seating_capacity_max, engine_hp_min, engine_hp_max, curb_weight_kg_min, curb_weight_kg_max, power_to_weight_ratio_min, power_to_weight_ratio_max, displacement_min, displacement_max, top_speed_min, top_speed_max, engine_front_bool, engine_mid_bool, engine_rear_bool, gasoline_bool, diesel_bool, hybrid_bool, electric_bool, other_fuel_type_bool, fwd_drivetrain_bool, rwd_drivetrain_bool, awd_drivetrain_bool, car_type_roadster_bool, car_type_coupe_bool, car_type_hatchback_bool, car_type_spyder_bool, car_type_cabriolet_bool, car_type_sedan_bool, car_type_wagon_bool, car_type_suv_bool, car_type_pickup_bool, car_type_van_bool, car_type_limousine_bool, manual_transmission_bool, automatic_transmission_bool, Bore_Stroke_Undersquare_bool, Bore_Stroke_Square_bool, Bore_Stroke_Oversquare_bool, United_Kingdom_bool, Japan_bool, Germany_bool, Italy_bool, France_bool, United_States_bool, Belgium_bool, Romania_bool, South_Korea_bool, Russia_bool, Switzerland_bool, China_bool, India_bool, Latvia_bool, Fictional_bool, Malaysia_bool, Netherlands_bool, Poland_bool, Czech_Republic_bool, Spain_bool, Australia_bool, Iran_bool, Sweden_bool, Austria_bool, Ukraine_bool, Taiwan_bool, Luxembourg_bool, Brazil_bool, Uzbekistan_bool, Croatia_bool, Turkey_bool, Serbia_bool, Kazakhstan_bool, _8_cylinders_bool, _4_cylinders_bool, _6_cylinders_bool, _5_cylinders_bool, _2_cylinders_bool, _12_cylinders_bool, _3_cylinders_bool, _10_cylinders_bool, _1_cylinders_bool, _7_cylinders_bool, _16_cylinders_bool, V_type_engine_layout_bool, Inline_engine_layout_bool, Opposed_engine_layout_bool, W_type_engine_layout_bool, Rotary_engine_layout_bool, variable_names, complexity, csv_export_boolean, query_export_boolean, query_import_boolean, query)
+        with trace_span("basic search button"):
+            self.start_search(self.results_label, lambda: search_cars(database_path, table_names, search_spec, variable_names, complexity, stream_results=True),
+                              show_results)
 
-        if results and results != "T" and count != 'h':
-            # Clear the existing text in the Text widget
-            self.results_text2.delete(1.0, tkinter.END)
-            # Insert the results into the Text widget
-            self.results_text2.insert(tkinter.END, results)
-            self.results_label2.config(text=f"Results: {count}")
+    # This method calls the search_by_model method and formats the data appropriately, updating the correct GUI elements to allow the data to be displayed to the user
+    def search_by_model_advanced_page(self, variable_names, complexity, csv_export_boolean, query_export_boolean, query_import_boolean, query):
+        with trace_span("advanced search button", complexity=complexity):
+            search_spec = self.get_advanced_search_spec()
+            self.start_search(self.results_label2, lambda: search_cars(database_path, table_names, search_spec, variable_names, complexity, csv_export_boolean,
+                                                                       query_export_boolean, query_import_boolean, query, stream_results=True),
+                              self.show_advanced_search_results)
+
+    # Shows the results of a search of the advanced page, called on the Tk thread once the search is done
+    def show_advanced_search_results(self, search_result):
+        results, count, *_ = search_result
+        if results and results != "T" and count != 'h' and count != 0:
+            if isinstance(results, str):
+                # Exports and imported queries are not streamed, they come back as a single string
+                self.result_streams.pop(self.results_text2, None)
+                with trace_span("insert results", rows=count):
+                    # Clear the existing text in the Text widget
+                    self.results_text2.delete(1.0, tkinter.END)
+                    # Insert the results into the Text widget
+                    self.results_text2.insert(tkinter.END, results)
+                self.results_label2.config(text=f"Results: {count}")
+            else:
+                self.show_streamed_results(self.results_text2, self.results_label2, results, count)
         else:
             # If no results were found, show a message
+            self.result_streams.pop(self.results_text2, None)
             self.results_text2.delete(1.0, tkinter.END)
             self.results_text2.insert(tkinter.END, "No data found for this search, OR, an error occured")
             self.results_label2.config(text=f"Results:")
 
+    # Searches again with the current filters of the advanced page, refining the previous live results when the filters only narrowed
+    def update_live_results(self):
+        search_spec = self.get_advanced_search_spec()
+
+        def search():
+            with trace_span("live filter") as span:
+                row_ids = rank_text_matches(database_path, table_names, search_spec.text, self.live_filter.update(search_spec))
+                span.set(rows=len(row_ids), refined=self.live_filter.counters["refined"])
+            return format_car_rows(iterate_rows_by_id(database_path, table_names, row_ids), variable_names, "advanced"), len(row_ids)
+
+        self.start_search(self.results_label2, search, self.show_advanced_search_results)
+
+    # Shows the cars of other models most like the chosen brand and model (its cars in the chosen years), the most similar first
+    # Only the cars the sliders and checkboxes allow are shown (see similar_cars)
+    def show_similar_cars(self):
+        brand = self.brand_dropdown2.get()
+        model = self.model_dropdown2.get()
+        if not brand or not model:
+            messagebox.showwarning("Missing Information", "Please choose both Brand and Model.")
+            return
+        search_spec = self.get_advanced_search_spec()
+
+        def search():
+            with trace_span("similar cars") as span:
+                model_row_ids = find_matching_row_ids(database_path, table_names, SearchSpec(brand, model, year=search_spec.year))
+                # The other years of the chosen model are not other cars either
+                similar_cars = find_cars_like(database_path, table_names, model_row_ids, SIMILAR_CARS_SHOWN,
+                                              search_spec=search_spec.replace(brand=None, model=None, text=None),
+                                              excluded_row_ids=find_matching_row_ids(database_path, table_names, SearchSpec(brand, model)))
+                row_ids = [row_id for row_id, _ in similar_cars or []]
+                span.set(rows=len(row_ids))
+            return format_car_rows(iterate_rows_by_id(database_path, table_names, row_ids), variable_names, "advanced"), len(row_ids)
+
+        self.start_search(self.results_label2, search, self.show_advanced_search_results)
+
+    # Returns the checkbox variables of the advanced page as {checkbox group: [(IntVar, value), ...]} (see CHECKBOX_GROUPS)
+    def get_checkbox_variables(self):
+        return {
+            "engine_type": [(self.fuel_type_gasoline_var, "Gasoline"), (self.fuel_type_diesel_var, "Diesel"), (self.fuel_type_hybrid_var, "Hybrid"),
+                            (self.fuel_type_electric_var, "Electric"), (self.fuel_type_other_var, "Other")],
+            "engine_placement": [(self.engine_placement_front_var, "Front"), (self.engine_placement_mid_var, "Mid"), (self.engine_placement_rear_var, "Rear")],
+            "drive_wheels": [(self.drivetrain_fwd_var, "FWD"), (self.drivetrain_rwd_var, "RWD"), (self.drivetrain_awd_var, "AWD")],
+            "transmission": [(self.transmission_manual_var, "Manual"), (self.transmission_automatic_var, "Automatic")],
+            "cylinder_layout": [(self.V_type_var, "V-type"), (self.Inline_var, "Inline"), (self.Opposed_var, "Opposed"), (self.W_type_var, "W-type"),
+                                (self.Rotary_var, "Rotary")],
+            "body_category": [(getattr(self, f"car_type_{category.lower()}_var"), category) for _, category in BODY_CATEGORY_CHECKBOXES],
+            "bore_stroke": [(self.bore_stroke_ratio_undersquare_var, "undersquare"), (self.bore_stroke_ratio_square_var, "square"),
+                            (self.bore_stroke_ratio_oversquare_var, "oversquare")],
+            "country_of_origin": [(getattr(self, f"{country.replace(' ', '_')}_var"), country) for _, country in COUNTRY_CHECKBOXES],
+            "number_of_cylinders": [(getattr(self, f"_{count}_var"), count) for _, count in CYLINDER_COUNT_CHECKBOXES],
+            }
+
+    # Builds the search of the advanced page from its sliders and checkboxes
+    def get_advanced_search_spec(self):
+        checked_values = {group_name: [value for variable, value in checkboxes if variable.get() == 1]
+                          for group_name, checkboxes in self.get_checkbox_variables().items()}
+        return SearchSpec(
+            self.brand_dropdown2.get(), self.model_dropdown2.get(), self.text_entry2.get(),
+            year=(round(self.min_year_slider2.get()), round(self.max_year_slider2.get())),
+            seating_capacity=(round(self.min_seating_capacity_slider.get()), round(self.max_seating_capacity_slider.get())),
+            engine_hp=(round(self.min_horsepower_slider.get()), round(self.max_horsepower_slider.get())),
+            curb_weight=(round(self.min_weight_slider.get()), round(self.max_weight_slider.get())),
+            power_to_weight_ratio=(round(self.min_powertoweight_slider.get(), 2), round(self.max_powertoweight_slider.get(), 2)),
+            displacement=(round(self.min_displacement_slider.get()), round(self.max_displacement_slider.get())),
+            top_speed=(round(self.min_top_speed_slider.get()), round(self.max_top_speed_slider.get())),
+            **checked_values)
+
+    # Shows the number of cars next to the checkboxes of a frame, for the checkboxes that belong to a checkbox group
+    def add_facet_checkbuttons(self, frame):
+        facet_values = {str(variable): (group_name, value) for group_name, checkboxes in self.get_checkbox_variables().items()
+                        for variable, value in checkboxes}
+        for widget in frame.winfo_children():
+            if isinstance(widget, ttk.Checkbutton) and str(widget.cget("variable")) in facet_values:
+                group_name, value = facet_values[str(widget.cget("variable"))]
+                self.facet_checkbuttons.append((widget, widget.cget("text"), group_name, value))
+        if self.facet_counts is not None:
+            self.show_facet_counts(self.facet_counts)
+
+    # Updates the checkbox counts (and the live results, when turned on) once the filters stop changing for FILTER_UPDATE_DELAY_MS
+    def schedule_filter_update(self, *_):
+        if self.filter_update_timer is not None:
+            self.root.after_cancel(self.filter_update_timer)
+        self.filter_update_timer = self.root.after(FILTER_UPDATE_DELAY_MS, self.update_filter_results)
+
+    def update_filter_results(self):
+        self.filter_update_timer = None
+        self.update_facet_counts()
+        if self.live_results_var.get() == 1:
+            self.update_live_results()
+
+    # Counts the cars of every checkbox for the current filters on the worker thread, a newer count replaces this one
+    def update_facet_counts(self):
+        search_spec = self.get_advanced_search_spec()
+        self.search_executor.submit("facets", lambda: get_facet_counts(database_path, table_names, search_spec),
+                                    on_done=self.show_facet_counts)
+
+    # Writes the counts next to the checkboxes, forgetting the checkboxes of closed windows
+    def show_facet_counts(self, facet_counts):
+        self.facet_counts = facet_counts
+        self.facet_checkbuttons = [facet_checkbutton for facet_checkbutton in self.facet_checkbuttons if facet_checkbutton[0].winfo_exists()]
+        for checkbutton, text, group_name, value in self.facet_checkbuttons:
+            checkbutton.configure(text=f"{text} ({facet_counts[group_name][value]})")
+
+    # Runs a search on the worker thread, replacing (and interrupting) the search that is still running, if any
+    # The results label shows how long the search has been running until show_results is called with its result
+    def start_search(self, results_label, search, show_results):
+        def show_error(error):
+            print("An error occurred while searching:", error)
+            results_label.config(text="Results:")
+
+        self.search_executor.submit("search", search, on_done=show_results, on_error=show_error,
+                                    on_progress=lambda elapsed: results_label.config(text=f"Searching... {elapsed:.1f} s"))
+
+    # Stops the running search, called whenever a slider moves as its result would no longer match the sliders
+    def cancel_search(self):
+        if self.search_executor.is_busy("search"):
+            self.search_executor.cancel("search")
+            self.results_label.config(text="Results:")
+            self.results_label2.config(text="Results:")
+
+    # Shows the first page of a streamed search in a results box, the next pages are added as the user scrolls down
+    # Only the cars that are shown are ever fetched and formatted, so a broad search does not stall the window
+    def show_streamed_results(self, results_text, results_label, formatted_cars, count):
+        results_text.delete(1.0, tkinter.END)
+        results_label.config(text=f"Results: {count}")
+        self.result_streams[results_text] = formatted_cars
+        self.show_next_results_page(results_text)
+        # The Text widget reports the visible part of its content through yscrollcommand, used to know when the end is near
+        results_text.configure(yscrollcommand=lambda first, last: self.on_results_scrolled(results_text, last))
+
+    # Adds the next page of cars at the end of a results box
+    # The page is read on the worker thread, which owns the cursor of the stream
+    def show_next_results_page(self, results_text):
+        formatted_cars = self.result_streams.get(results_text)
+        if formatted_cars is None or self.loading_result_pages.get(results_text) is formatted_cars:
+            return
+        self.loading_result_pages[results_text] = formatted_cars
+
+        def read_page():
+            try:
+                # The cars are fetched (the "fetch rows" spans inside) and formatted as the page is read
+                with trace_span("read and format results page") as span:
+                    page = list(itertools.islice(formatted_cars, RESULTS_PAGE_SIZE))
+                    span.set(rows=len(page))
+                return page
+            except sqlite3.Error as e:
+                print("An error occurred while reading the results:", e)
+                return []
+
+        def add_page(page):
+            self.loading_result_pages.pop(results_text, None)
+            if self.result_streams.get(results_text) is not formatted_cars:
+                # A newer search replaced this one while the page was read
+                return
+            if len(page) < RESULTS_PAGE_SIZE:
+                # Every car is shown, the stream is done
+                self.result_streams.pop(results_text, None)
+            with trace_span("insert results page", rows=len(page)):
+                results_text.insert(tkinter.END, "".join(page))
+
+        self.search_executor.submit(("results page", str(results_text)), read_page, on_done=add_page)
+
+    # Called by the results box whenever it scrolls or its content changes, with the fraction of the content seen so far
+    def on_results_scrolled(self, results_text, last):
+        if float(last) > 0.9 and self.result_streams.get(results_text) is not None:
+            # Added once Tk is idle, as the Text widget should not be changed while it is redrawing
+            results_text.after_idle(self.show_next_results_page, results_text)
+
     # This method updates the model dropdown based on what brand is chosen, using the search_by_brand_show_model_only method
     def update_model_dropdown(self, event):
+        if event is not None and event.type == tkinter.EventType.KeyRelease:
+            # While typing, the dropdown is only updated once the user pauses
+            self.debounce_model_lookup("models", self.update_model_dropdown)
+            return
         selected_brand = self.brand_dropdown.get()
         if selected_brand.strip() != '':
-            models = search_by_brand_show_model_only(database_path, table_names, selected_brand)
-            self.model_dropdown['values'] = models
+            model_index = get_loaded_model_index(database_path, table_names)
+            if model_index is not None:
+                self.search_executor.cancel("models")
+                self.model_dropdown['values'] = model_index.get_models(selected_brand)
+                # A misspelled brand lists the closest brands, a brand spelled right lists them all again
+                self.brand_dropdown['values'] = model_index.get_suggested_makes(selected_brand) or self.brand_names
+            else:
+                # The index is not loaded yet, it is built on the worker thread and a newer lookup replaces this one
+                self.search_executor.submit("models", lambda: search_by_brand_show_model_only(database_path, table_names, selected_brand),
+                                            on_done=lambda models: self.model_dropdown.configure(values=models))
         else:
+            self.search_executor.cancel("models")
             self.model_dropdown['values'] = None
             self.model_dropdown.set("")
 
+    # Lists the models closest in spelling to the typed model (among the models of the chosen brands), once the user pauses typing
+    # A model spelled like one of the models of the brands lists the models of the brands again
+    def update_model_suggestions(self, name, model_dropdown, brand_dropdown, event=None):
+        if event is not None:
+            self.debounce_model_lookup(name, lambda _: self.update_model_suggestions(name, model_dropdown, brand_dropdown))
+            return
+        model_index = get_loaded_model_index(database_path, table_names)
+        typed_model = model_dropdown.get().strip()
+        if model_index is None or typed_model == "":
+            return
+        brand_models = model_index.get_models(brand_dropdown.get()) if brand_dropdown.get().strip() != "" else []
+        if typed_model in brand_models:
+            model_dropdown['values'] = brand_models
+        else:
+            model_dropdown['values'] = model_index.get_similar_models(typed_model, brand_dropdown.get())
+
+    # Calls update_model_dropdown(None) once no key was pressed for MODEL_LOOKUP_DELAY_MS, a new key press restarts the wait
+    def debounce_model_lookup(self, name, update_model_dropdown):
+        if name in self.model_lookup_timers:
+            self.root.after_cancel(self.model_lookup_timers[name])
+
+        def run_lookup():
+            del self.model_lookup_timers[name]
+            update_model_dropdown(None)
+
+        self.model_lookup_timers[name] = self.root.after(MODEL_LOOKUP_DELAY_MS, run_lookup)
+
     # Method to update year labels
     def update_year_labels(self, event):
+        self.cancel_search()
         self.min_year_label["text"] = f"Min Year: {round(self.min_year_slider.get())}"
         self.max_year_label["text"] = f"Max Year: {round(self.max_year_slider.get())}"
 
     # Method to update year labels on the advanced page
     def update_year_labels_advanced_page(self, event):
+        self.cancel_search()
+        self.schedule_filter_update()
         self.min_year_label2["text"] = f"Min Year: {round(self.min_year_slider2.get())}"
         self.max_year_label2["text"] = f"Max Year: {round(self.max_year_slider2.get())}"
 
     # Method to update seats labels
     def update_seats_label_advanced_page(self, event):
+        self.cancel_search()
+        self.schedule_filter_update()
         self.min_seating_capacity_label[
             "text"] = f"Min Seating Capacity: {round(self.min_seating_capacity_slider.get())}"
         self.max_seating_capacity_label[
@@ -604,26 +756,36 @@ class CarSortGUI:
 
     # Method to update horsepower labels on the advanced page
     def update_engine_hp_label_advanced_page(self, event):
+        self.cancel_search()
+        self.schedule_filter_update()
         self.min_horsepower_label["text"] = f"Min Horsepower: {round(self.min_horsepower_slider.get())}"
         self.max_horsepower_label["text"] = f"Max Horsepower: {round(self.max_horsepower_slider.get())}"
 
     # Method to update curb weight labels on the advanced page
     def update_curb_weight_kg_advanced_page(self, event):
+        self.cancel_search()
+        self.schedule_filter_update()
         self.min_weight_label["text"] = f"Min Weight (Kg): {round(self.min_weight_slider.get())}"
         self.max_weight_label["text"] = f"Max Weight (Kg): {round(self.max_weight_slider.get())}"
 
     # Method to update power:weight ratio labels on the advanced page
     def update_powertoweight_advanced_page(self, event):
+        self.cancel_search()
+        self.schedule_filter_update()
         self.min_powertoweight_label["text"] = f"Min HP / Weight Ratio: {round(self.min_powertoweight_slider.get(), 2)}"
         self.max_powertoweight_label["text"] = f"Max HP / Weight Ratio: {round(self.max_powertoweight_slider.get(), 2)}"
 
     # Method to update displacement labels on the advanced page
     def update_displacement_advanced_page(self, event):
+        self.cancel_search()
+        self.schedule_filter_update()
         self.min_displacement_label["text"] = f"Min Displacement (cm3): {round(self.min_displacement_slider.get())}"
         self.max_displacement_label["text"] = f"Max Displacement (cm3): {round(self.max_displacement_slider.get())}"
 
     # Method to update top speed labels on the advanced page
     def update_top_speed_advanced_page(self, event):
+        self.cancel_search()
+        self.schedule_filter_update()
         self.min_top_speed_label["text"] = f"Min Top Speed (Km/h): {round(self.min_top_speed_slider.get())}"
         self.max_top_speed_label["text"] = f"Max Top Speed (Km/h): {round(self.max_top_speed_slider.get())}"
 
@@ -632,9 +794,7 @@ class CarSortGUI:
     def update_all_sliders_advanced_page(self, event):
         self.min_powertoweight_label["text"] = f"Min HP / Weight Ratio: {round(self.min_powertoweight_slider.get(), 2)}"
         self.max_powertoweight_label["text"] = f"Max HP / Weight Ratio: {round(self.max_powertoweight_slider.get(), 2)}"
-        selected_brand = self.brand_dropdown.get()
-        models = search_by_brand_show_model_only(database_path, table_names, selected_brand)
-        self.model_dropdown['values'] = models
+        self.update_model_dropdown(None)
         self.min_year_label["text"] = f"Min Year: {round(self.min_year_slider.get())}"
         self.max_year_label["text"] = f"Max Year: {round(self.max_year_slider.get())}"
         self.min_year_label2["text"] = f"Min Year: {round(self.min_year_slider2.get())}"
@@ -686,20 +846,23 @@ class CarSortGUI:
 
         self.brand_dropdown2.set("")
         self.model_dropdown2.set("")
-        self.min_year_slider2.set(get_min_max_year(database_path, table_names, "min"))
-        self.max_year_slider2.set(get_min_max_year(database_path, table_names, "max"))
-        self.min_seating_capacity_slider.set(get_min_max_seating_capacity("min", database_path, table_names))
-        self.max_seating_capacity_slider.set(get_min_max_seating_capacity("max", database_path, table_names))
-        self.min_weight_slider.set(get_min_max_curb_weight('min', database_path, table_names))
-        self.max_weight_slider.set(get_min_max_curb_weight('max', database_path, table_names))
-        self.min_horsepower_slider.set(get_min_max_engine_hp('min', database_path, table_names))
-        self.max_horsepower_slider.set(get_min_max_engine_hp('max', database_path, table_names))
-        self.min_powertoweight_slider.set(get_min_max_power_to_weight_ratio('min', database_path, table_names))
-        self.max_powertoweight_slider.set(get_min_max_power_to_weight_ratio('max', database_path, table_names))
-        self.min_displacement_slider.set(get_min_max_displacement('min', database_path, table_names))
-        self.max_displacement_slider.set(get_min_max_displacement('max', database_path, table_names))
-        self.min_top_speed_slider.set(get_min_max_top_speed('min', database_path, table_names))
-        self.max_top_speed_slider.set(get_min_max_top_speed('max', database_path, table_names))
+        self.text_entry2.delete(0, tkinter.END)
+        # The slider limits come from the get_min_max_* helpers
+        with trace_span("reset sliders"):
+            self.min_year_slider2.set(get_min_max_year(database_path, table_names, "min"))
+            self.max_year_slider2.set(get_min_max_year(database_path, table_names, "max"))
+            self.min_seating_capacity_slider.set(get_min_max_seating_capacity("min", database_path, table_names))
+            self.max_seating_capacity_slider.set(get_min_max_seating_capacity("max", database_path, table_names))
+            self.min_weight_slider.set(get_min_max_curb_weight('min', database_path, table_names))
+            self.max_weight_slider.set(get_min_max_curb_weight('max', database_path, table_names))
+            self.min_horsepower_slider.set(get_min_max_engine_hp('min', database_path, table_names))
+            self.max_horsepower_slider.set(get_min_max_engine_hp('max', database_path, table_names))
+            self.min_powertoweight_slider.set(get_min_max_power_to_weight_ratio('min', database_path, table_names))
+            self.max_powertoweight_slider.set(get_min_max_power_to_weight_ratio('max', database_path, table_names))
+            self.min_displacement_slider.set(get_min_max_displacement('min', database_path, table_names))
+            self.max_displacement_slider.set(get_min_max_displacement('max', database_path, table_names))
+            self.min_top_speed_slider.set(get_min_max_top_speed('min', database_path, table_names))
+            self.max_top_speed_slider.set(get_min_max_top_speed('max', database_path, table_names))
 
         # update after resetting
         self.update_all_sliders_advanced_page(self)
@@ -740,16 +903,7 @@ class CarSortGUI:
         # Method that allows the user to import an SQL query, which then is directly executed
         def execute_sql_query():
             query = self.sql_query_textbox.get("1.0", tkinter.END)
-            self.search_by_model_advanced_page(database_path, table_names, self.brand_dropdown2.get(), self.model_dropdown2.get(), round(self.min_year_slider2.get()), round(self.max_year_slider2.get()), round(self.min_seating_capacity_slider.get()), round(self.max_seating_capacity_slider.get()),
-                round(self.min_horsepower_slider.get()), round(self.max_horsepower_slider.get()), round(self.min_weight_slider.get()), round(self.max_weight_slider.get()), round(self.min_powertoweight_slider.get(), 2), round(self.max_powertoweight_slider.get(), 2), round(self.min_displacement_slider.get()),
-                round(self.max_displacement_slider.get()), round(self.min_top_speed_slider.get()), round(self.max_top_speed_slider.get()), self.engine_placement_front_var.get(), self.engine_placement_mid_var.get(), self.engine_placement_rear_var.get(), self.fuel_type_gasoline_var.get(),
-                self.fuel_type_diesel_var.get(), self.fuel_type_hybrid_var.get(), self.fuel_type_electric_var.get(), self.fuel_type_other_var.get(), self.drivetrain_fwd_var.get(), self.drivetrain_rwd_var.get(), self.drivetrain_awd_var.get(), self.car_type_roadster_var.get(), self.car_type_coupe_var.get(),
-                self.car_type_hatchback_var.get(), self.car_type_spyder_var.get(), self.car_type_cabriolet_var.get(), self.car_type_sedan_var.get(), self.car_type_wagon_var.get(), self.car_type_suv_var.get(), self.car_type_pickup_var.get(), self.car_type_van_var.get(), self.car_type_limousine_var.get(),
-                self.transmission_manual_var.get(), self.transmission_automatic_var.get(), self.bore_stroke_ratio_undersquare_var.get(), self.bore_stroke_ratio_square_var.get(), self.bore_stroke_ratio_oversquare_var.get(), self.United_Kingdom_var.get(), self.Japan_var.get(), self.Germany_var.get(),
-                self.Italy_var.get(), self.France_var.get(), self.United_States_var.get(), self.Belgium_var.get(), self.Romania_var.get(), self.South_Korea_var.get(), self.Russia_var.get(), self.Switzerland_var.get(), self.China_var.get(), self.India_var.get(), self.Latvia_var.get(), self.Fictional_var.get(),
-                self.Malaysia_var.get(), self.Netherlands_var.get(), self.Poland_var.get(), self.Czech_Republic_var.get(), self.Spain_var.get(), self.Australia_var.get(), self.Iran_var.get(), self.Sweden_var.get(), self.Austria_var.get(), self.Ukraine_var.get(), self.Taiwan_var.get(), self.Luxembourg_var.get(),
-                self.Brazil_var.get(), self.Uzbekistan_var.get(), self.Croatia_var.get(), self.Turkey_var.get(), self.Serbia_var.get(), self.Kazakhstan_var.get(), self._8_var.get(), self._4_var.get(), self._6_var.get(), self._5_var.get(), self._2_var.get(), self._12_var.get(), self._3_var.get(), self._10_var.get(),
-                self._1_var.get(), self._7_var.get(), self._16_var.get(), self.V_type_var.get(), self.Inline_var.get(), self.Opposed_var.get(), self.W_type_var.get(), self.Rotary_var.get(), variable_names, "advanced", 0, 0, 1, query)
+            self.search_by_model_advanced_page(variable_names, "advanced", 0, 0, 1, query)
 
         # Clears the SQL Query dialogue box
         def clear_text():
@@ -763,13 +917,19 @@ class CarSortGUI:
         self.return_button = ttk.Button(self.advanced_frame, text="Return to Basic Search", command=self.show_main_page)
 
         self.brand_label2 = ttk.Label(self.advanced_frame, text="Brand:")
-        self.brand_dropdown2 = ttk.Combobox(self.advanced_frame, values=print_brand_names_only(database_path, table_names))
+        self.brand_dropdown2 = ttk.Combobox(self.advanced_frame, values=self.brand_names)
         self.brand_dropdown2.bind("<<ComboboxSelected>>", self.update_model_dropdown2)
         self.brand_dropdown2.bind("<KeyRelease>", self.update_model_dropdown2)
 
         self.model_label2 = ttk.Label(self.advanced_frame, text="Model:")
         self.model_dropdown2 = ttk.Combobox(self.advanced_frame, values=[])
-        # self.model_dropdown2.bind("<KeyRelease>", self.update_model_dropdown)
+        self.model_dropdown2.bind("<<ComboboxSelected>>", self.schedule_filter_update)
+        self.model_dropdown2.bind("<KeyRelease>", lambda event: self.update_model_suggestions("model suggestions2", self.model_dropdown2, self.brand_dropdown2, event))
+
+        # The live results and the checkbox counts follow the keywords as they are typed
+        self.text_label2 = ttk.Label(self.advanced_frame, text="Keywords:")
+        self.text_entry2 = ttk.Entry(self.advanced_frame, width=23)
+        self.text_entry2.bind("<KeyRelease>", self.schedule_filter_update)
 
         # Add detailed search elements (sliders, checkboxes, etc.)
         self.min_year_label2 = ttk.Label(self.advanced_frame, text=f"Min Year: {get_min_max_year(database_path, table_names, 'min')}")
@@ -855,10 +1015,10 @@ class CarSortGUI:
         self.go_to_website = ttk.Button(self.advanced_frame, text="Go to Website", command=lambda: self.go_to_make_website('advanced'))
 
         self.export_to_CSV_button = ttk.Button(self.advanced_frame, text="Export to CSV")
-        self.export_to_CSV_button["command"] = lambda: self.search_by_model_advanced_page(database_path, table_names, self.brand_dropdown2.get(), self.model_dropdown2.get(), round(self.min_year_slider2.get()), round(self.max_year_slider2.get()), round(self.min_seating_capacity_slider.get()), round(self.max_seating_capacity_slider.get()), round(self.min_horsepower_slider.get()), round(self.max_horsepower_slider.get()), round(self.min_weight_slider.get()), round(self.max_weight_slider.get()), round(self.min_powertoweight_slider.get(), 2), round(self.max_powertoweight_slider.get(), 2), round(self.min_displacement_slider.get()), round(self.max_displacement_slider.get()), round(self.min_top_speed_slider.get()), round(self.max_top_speed_slider.get()), self.engine_placement_front_var.get(), self.engine_placement_mid_var.get(), self.engine_placement_rear_var.get(), self.fuel_type_gasoline_var.get(), self.fuel_type_diesel_var.get(), self.fuel_type_hybrid_var.get(), self.fuel_type_electric_var.get(), self.fuel_type_other_var.get(), self.drivetrain_fwd_var.get(), self.drivetrain_rwd_var.get(), self.drivetrain_awd_var.get(), self.car_type_roadster_var.get(), self.car_type_coupe_var.get(), self.car_type_hatchback_var.get(), self.car_type_spyder_var.get(), self.car_type_cabriolet_var.get(), self.car_type_sedan_var.get(), self.car_type_wagon_var.get(), self.car_type_suv_var.get(), self.car_type_pickup_var.get(), self.car_type_van_var.get(), self.car_type_limousine_var.get(), self.transmission_manual_var.get(), self.transmission_automatic_var.get(), self.bore_stroke_ratio_undersquare_var.get(), self.bore_stroke_ratio_square_var.get(), self.bore_stroke_ratio_oversquare_var.get(), self.United_Kingdom_var.get(), self.Japan_var.get(), self.Germany_var.get(), self.Italy_var.get(), self.France_var.get(), self.United_States_var.get(), self.Belgium_var.get(), self.Romania_var.get(), self.South_Korea_var.get(), self.Russia_var.get(), self.Switzerland_var.get(), self.China_var.get(), self.India_var.get(), self.Latvia_var.get(), self.Fictional_var.get(), self.Malaysia_var.get(), self.Netherlands_var.get(), self.Poland_var.get(), self.Czech_Republic_var.get(), self.Spain_var.get(), self.Australia_var.get(), self.Iran_var.get(), self.Sweden_var.get(), self.Austria_var.get(), self.Ukraine_var.get(), self.Taiwan_var.get(), self.Luxembourg_var.get(), self.Brazil_var.get(), self.Uzbekistan_var.get(), self.Croatia_var.get(), self.Turkey_var.get(), self.Serbia_var.get(), self.Kazakhstan_var.get(), self._8_var.get(), self._4_var.get(), self._6_var.get(), self._5_var.get(), self._2_var.get(), self._12_var.get(), self._3_var.get(), self._10_var.get(), self._1_var.get(), self._7_var.get(), self._16_var.get(), self.V_type_var.get(), self.Inline_var.get(), self.Opposed_var.get(), self.W_type_var.get(), self.Rotary_var.get(), variable_names, "advanced", 1, 0, 0, None)
+        self.export_to_CSV_button["command"] = lambda: self.search_by_model_advanced_page(variable_names, "advanced", 1, 0, 0, None)
 
         self.export_sql_query_button = ttk.Button(self.advanced_frame, text="Save Search")
-        self.export_sql_query_button["command"] = lambda: self.search_by_model_advanced_page(database_path, table_names, self.brand_dropdown2.get(), self.model_dropdown2.get(), round(self.min_year_slider2.get()), round(self.max_year_slider2.get()), round(self.min_seating_capacity_slider.get()), round(self.max_seating_capacity_slider.get()), round(self.min_horsepower_slider.get()), round(self.max_horsepower_slider.get()), round(self.min_weight_slider.get()), round(self.max_weight_slider.get()), round(self.min_powertoweight_slider.get(), 2), round(self.max_powertoweight_slider.get(), 2), round(self.min_displacement_slider.get()), round(self.max_displacement_slider.get()), round(self.min_top_speed_slider.get()), round(self.max_top_speed_slider.get()), self.engine_placement_front_var.get(), self.engine_placement_mid_var.get(), self.engine_placement_rear_var.get(), self.fuel_type_gasoline_var.get(), self.fuel_type_diesel_var.get(), self.fuel_type_hybrid_var.get(), self.fuel_type_electric_var.get(), self.fuel_type_other_var.get(), self.drivetrain_fwd_var.get(), self.drivetrain_rwd_var.get(), self.drivetrain_awd_var.get(), self.car_type_roadster_var.get(), self.car_type_coupe_var.get(), self.car_type_hatchback_var.get(), self.car_type_spyder_var.get(), self.car_type_cabriolet_var.get(), self.car_type_sedan_var.get(), self.car_type_wagon_var.get(), self.car_type_suv_var.get(), self.car_type_pickup_var.get(), self.car_type_van_var.get(), self.car_type_limousine_var.get(), self.transmission_manual_var.get(), self.transmission_automatic_var.get(), self.bore_stroke_ratio_undersquare_var.get(), self.bore_stroke_ratio_square_var.get(), self.bore_stroke_ratio_oversquare_var.get(), self.United_Kingdom_var.get(), self.Japan_var.get(), self.Germany_var.get(), self.Italy_var.get(), self.France_var.get(), self.United_States_var.get(), self.Belgium_var.get(), self.Romania_var.get(), self.South_Korea_var.get(), self.Russia_var.get(), self.Switzerland_var.get(), self.China_var.get(), self.India_var.get(), self.Latvia_var.get(), self.Fictional_var.get(), self.Malaysia_var.get(), self.Netherlands_var.get(), self.Poland_var.get(), self.Czech_Republic_var.get(), self.Spain_var.get(), self.Australia_var.get(), self.Iran_var.get(), self.Sweden_var.get(), self.Austria_var.get(), self.Ukraine_var.get(), self.Taiwan_var.get(), self.Luxembourg_var.get(), self.Brazil_var.get(), self.Uzbekistan_var.get(), self.Croatia_var.get(), self.Turkey_var.get(), self.Serbia_var.get(), self.Kazakhstan_var.get(), self._8_var.get(), self._4_var.get(), self._6_var.get(), self._5_var.get(), self._2_var.get(), self._12_var.get(), self._3_var.get(), self._10_var.get(), self._1_var.get(), self._7_var.get(), self._16_var.get(), self.V_type_var.get(), self.Inline_var.get(), self.Opposed_var.get(), self.W_type_var.get(), self.Rotary_var.get(), variable_names, "advanced", 0, 1, 0, None)
+        self.export_sql_query_button["command"] = lambda: self.search_by_model_advanced_page(variable_names, "advanced", 0, 1, 0, None)
 
         self.sql_query_textbox = tkinter.Text(self.advanced_frame, height=1, width=10)
         self.execute_button = ttk.Button(self.advanced_frame, text="Import Search", command=execute_sql_query)
@@ -871,10 +1031,16 @@ class CarSortGUI:
         self.show_percentage_of_logged_data = ttk.Button(self.advanced_frame, text="Show Data %",
                                                          command=self.display_percentage_of_logged_data)
         self.search_basic_override_button = ttk.Button(self.advanced_frame, text="Basic Search Override")
-        self.search_basic_override_button["command"] = lambda: self.search_by_model_advanced_page(database_path, table_names, self.brand_dropdown2.get(), self.model_dropdown2.get(), round(self.min_year_slider2.get()), round(self.max_year_slider2.get()), round(self.min_seating_capacity_slider.get()), round(self.max_seating_capacity_slider.get()), round(self.min_horsepower_slider.get()), round(self.max_horsepower_slider.get()), round(self.min_weight_slider.get()), round(self.max_weight_slider.get()), round(self.min_powertoweight_slider.get(), 2), round(self.max_powertoweight_slider.get(), 2), round(self.min_displacement_slider.get()), round(self.max_displacement_slider.get()), round(self.min_top_speed_slider.get()), round(self.max_top_speed_slider.get()), self.engine_placement_front_var.get(), self.engine_placement_mid_var.get(), self.engine_placement_rear_var.get(), self.fuel_type_gasoline_var.get(), self.fuel_type_diesel_var.get(), self.fuel_type_hybrid_var.get(), self.fuel_type_electric_var.get(), self.fuel_type_other_var.get(), self.drivetrain_fwd_var.get(), self.drivetrain_rwd_var.get(), self.drivetrain_awd_var.get(), self.car_type_roadster_var.get(), self.car_type_coupe_var.get(), self.car_type_hatchback_var.get(), self.car_type_spyder_var.get(), self.car_type_cabriolet_var.get(), self.car_type_sedan_var.get(), self.car_type_wagon_var.get(), self.car_type_suv_var.get(), self.car_type_pickup_var.get(), self.car_type_van_var.get(), self.car_type_limousine_var.get(), self.transmission_manual_var.get(), self.transmission_automatic_var.get(), self.bore_stroke_ratio_undersquare_var.get(), self.bore_stroke_ratio_square_var.get(), self.bore_stroke_ratio_oversquare_var.get(), self.United_Kingdom_var.get(), self.Japan_var.get(), self.Germany_var.get(), self.Italy_var.get(), self.France_var.get(), self.United_States_var.get(), self.Belgium_var.get(), self.Romania_var.get(), self.South_Korea_var.get(), self.Russia_var.get(), self.Switzerland_var.get(), self.China_var.get(), self.India_var.get(), self.Latvia_var.get(), self.Fictional_var.get(), self.Malaysia_var.get(), self.Netherlands_var.get(), self.Poland_var.get(), self.Czech_Republic_var.get(), self.Spain_var.get(), self.Australia_var.get(), self.Iran_var.get(), self.Sweden_var.get(), self.Austria_var.get(), self.Ukraine_var.get(), self.Taiwan_var.get(), self.Luxembourg_var.get(), self.Brazil_var.get(), self.Uzbekistan_var.get(), self.Croatia_var.get(), self.Turkey_var.get(), self.Serbia_var.get(), self.Kazakhstan_var.get(), self._8_var.get(), self._4_var.get(), self._6_var.get(), self._5_var.get(), self._2_var.get(), self._12_var.get(), self._3_var.get(), self._10_var.get(), self._1_var.get(), self._7_var.get(), self._16_var.get(), self.V_type_var.get(), self.Inline_var.get(), self.Opposed_var.get(), self.W_type_var.get(), self.Rotary_var.get(), variable_names, "simple", 0, 0, 0, None)
+        self.search_basic_override_button["command"] = lambda: self.search_by_model_advanced_page(variable_names, "simple", 0, 0, 0, None)
+
+        self.similar_cars_button = ttk.Button(self.advanced_frame, text="Similar Cars", command=self.show_similar_cars)
 
         self.search_advanced_button = ttk.Button(self.advanced_frame, text="Advanced Search")
-        self.search_advanced_button["command"] = lambda: self.search_by_model_advanced_page(database_path, table_names, self.brand_dropdown2.get(), self.model_dropdown2.get(), round(self.min_year_slider2.get()), round(self.max_year_slider2.get()), round(self.min_seating_capacity_slider.get()), round(self.max_seating_capacity_slider.get()), round(self.min_horsepower_slider.get()), round(self.max_horsepower_slider.get()), round(self.min_weight_slider.get()), round(self.max_weight_slider.get()), round(self.min_powertoweight_slider.get(), 2), round(self.max_powertoweight_slider.get(), 2), round(self.min_displacement_slider.get()), round(self.max_displacement_slider.get()), round(self.min_top_speed_slider.get()), round(self.max_top_speed_slider.get()), self.engine_placement_front_var.get(), self.engine_placement_mid_var.get(), self.engine_placement_rear_var.get(), self.fuel_type_gasoline_var.get(), self.fuel_type_diesel_var.get(), self.fuel_type_hybrid_var.get(), self.fuel_type_electric_var.get(), self.fuel_type_other_var.get(), self.drivetrain_fwd_var.get(), self.drivetrain_rwd_var.get(), self.drivetrain_awd_var.get(), self.car_type_roadster_var.get(), self.car_type_coupe_var.get(), self.car_type_hatchback_var.get(), self.car_type_spyder_var.get(), self.car_type_cabriolet_var.get(), self.car_type_sedan_var.get(), self.car_type_wagon_var.get(), self.car_type_suv_var.get(), self.car_type_pickup_var.get(), self.car_type_van_var.get(), self.car_type_limousine_var.get(), self.transmission_manual_var.get(), self.transmission_automatic_var.get(), self.bore_stroke_ratio_undersquare_var.get(), self.bore_stroke_ratio_square_var.get(), self.bore_stroke_ratio_oversquare_var.get(), self.United_Kingdom_var.get(), self.Japan_var.get(), self.Germany_var.get(), self.Italy_var.get(), self.France_var.get(), self.United_States_var.get(), self.Belgium_var.get(), self.Romania_var.get(), self.South_Korea_var.get(), self.Russia_var.get(), self.Switzerland_var.get(), self.China_var.get(), self.India_var.get(), self.Latvia_var.get(), self.Fictional_var.get(), self.Malaysia_var.get(), self.Netherlands_var.get(), self.Poland_var.get(), self.Czech_Republic_var.get(), self.Spain_var.get(), self.Australia_var.get(), self.Iran_var.get(), self.Sweden_var.get(), self.Austria_var.get(), self.Ukraine_var.get(), self.Taiwan_var.get(), self.Luxembourg_var.get(), self.Brazil_var.get(), self.Uzbekistan_var.get(), self.Croatia_var.get(), self.Turkey_var.get(), self.Serbia_var.get(), self.Kazakhstan_var.get(), self._8_var.get(), self._4_var.get(), self._6_var.get(), self._5_var.get(), self._2_var.get(), self._12_var.get(), self._3_var.get(), self._10_var.get(), self._1_var.get(), self._7_var.get(), self._16_var.get(), self.V_type_var.get(), self.Inline_var.get(), self.Opposed_var.get(), self.W_type_var.get(), self.Rotary_var.get(), variable_names, "advanced", 0, 0, 0, None)
+        self.search_advanced_button["command"] = lambda: self.search_by_model_advanced_page(variable_names, "advanced", 0, 0, 0, None)
+
+        # Searches again whenever a slider or checkbox changes, without pressing "Advanced Search"
+        self.live_results_checkbutton = ttk.Checkbutton(self.advanced_frame, text="Live Results", variable=self.live_results_var,
+                                                        command=self.schedule_filter_update)
 
         self.results_label2 = ttk.Label(self.advanced_frame, text="Results:")
         self.results_text2 = tkinter.Text(self.advanced_frame, height=30, width=50)
@@ -887,6 +1053,8 @@ class CarSortGUI:
         self.brand_dropdown2.grid()
         self.model_label2.grid()
         self.model_dropdown2.grid()
+        self.text_label2.grid()
+        self.text_entry2.grid()
         self.min_year_label2.grid()
         self.min_year_slider2.grid()
         self.max_year_label2.grid()
@@ -957,6 +1125,8 @@ class CarSortGUI:
         self.show_percentage_of_logged_data.grid(column=3, row=30)
         self.find_image_button.grid(column=4, row=28)
         self.go_to_website.grid(column=4, row=29)
+        self.similar_cars_button.grid(column=3, row=31)
+        self.live_results_checkbutton.grid(column=3, row=32)
         self.search_advanced_button.grid(column=3, row=33)
         self.search_basic_override_button.grid(column=3, row=34)
         self.export_to_CSV_button.grid(column=4, row=30)
@@ -973,48 +1143,48 @@ class CarSortGUI:
     # This method shows the percentage of commonly used data logged in cars. This is important, as if a user were to sort a car by its
     #   horsepower properties, they should be aware that a few cars will get left out, as they don't have said information logged in their row
     def display_percentage_of_logged_data(self):
-
-        columns = [
-            "year_from", "year_to", "series", "number_of_seats",
-            "curb_weight_kg", "cylinder_layout", "number_of_cylinders", "engine_type",
-            "cylinder_bore_mm", "stroke_cycle_mm", "engine_placement",
-            "capacity_cm3", "engine_hp", "drive_wheels", "transmission", "max_speed_km_per_h",
-            ]
-
-        column_counts = {}
-
-        with sqlite3.connect(database_path) as connection:
-            cursor = connection.cursor()
-            # Get the total number of records in the database
-            cursor.execute("SELECT COUNT(*) FROM car_db_metric")
-            total_records = cursor.fetchone()[0]
-
-            # Execute the SQL queries and calculate percentages
-            for column in columns:
-                query = f"SELECT COUNT({column}) FROM car_db_metric WHERE {column} IS NOT NULL;"
-                cursor.execute(query)
-                result = cursor.fetchone()[0]
-                percentage = (result / total_records) * 100 if total_records > 0 else 0
-                column_counts[column] = percentage
-
-            # Sort the results based on the percentages
-            sorted_columns = sorted(column_counts.items(), key=lambda x: x[1], reverse=True)
-
-            # Create a new Tkinter window for displaying the percentages
-            popup = Toplevel(self.root)
-            popup.title("% of Cars Containing Data;")
-
-            # Create a text widget to display the results
-            text_widget = tkinter.Text(popup, height=20, width=50)
-            text_widget.pack()
-
-            # Insert the sorted results with percentages into the text widget
-            for column, percentage in sorted_columns:
-                text_widget.insert(tkinter.END, f"{column}: {percentage:.2f}%\n")
-
+        # Create a new Tkinter window for displaying the percentages
+        popup = Toplevel(self.root)
+        popup.title("% of Cars Containing Data;")
+
+        # Create a text widget to display the results
+        text_widget = tkinter.Text(popup, height=20, width=70)
+        text_widget.pack()
+
+        # Shows the completeness of the cars of the current search instead of the whole table
+        current_search_var = tkinter.IntVar(value=0)
+        ttk.Checkbutton(popup, text="Only Cars of the Current Search", variable=current_search_var,
+                        command=lambda: self.update_data_profile(text_widget, current_search_var.get() == 1)).pack()
+
+        self.update_data_profile(text_widget, False)
+
+    # Profiles every column in a single pass on the worker thread, for the whole table (kept in the statistics catalog)
+    #   or for the cars matching the current filters of the advanced page, then lists the columns in the text widget
+    def update_data_profile(self, text_widget, current_search_only):
+        search_spec = self.get_advanced_search_spec()
+
+        def profile():
+            if current_search_only:
+                return get_search_data_profile(database_path, table_names, search_spec)
+            return get_data_profile(database_path, table_names)
+
+        def show_data_profile(data_profile):
+            if not text_widget.winfo_exists():
+                return
+            text_widget.configure(state='normal')
+            text_widget.delete(1.0, tkinter.END)
+            text_widget.insert(tkinter.END, f"{data_profile['row_count']} cars\n")
+            # Insert the columns, the most complete first, with their number of distinct values and range
+            for column, percentage, column_profile in get_completeness(data_profile):
+                text_widget.insert(tkinter.END, format_column_profile(column, percentage, column_profile) + "\n")
             # Disable text editing in the text widget
             text_widget.configure(state='disabled')
 
+        def show_error(error):
+            print("An error occurred while profiling the data:", error)
+
+        self.search_executor.submit("data profile", profile, on_done=show_data_profile, on_error=show_error)
+
     # Opens the countries of origin page, so that the user can use checkboxes to select cars by countries of manufacturing
     def create_country_of_origin_page(self):
         # Create a new window for country of origin information
@@ -1063,6 +1233,8 @@ class CarSortGUI:
                 var = getattr(self, f"{country.replace(' ', '_')}_var")
                 ttk.Checkbutton(countries_frame_inner, text=country, variable=var).grid(row=idx, column=1, sticky='w')
 
+            self.add_facet_checkbuttons(countries_frame_inner)
+
             # Create a frame for the buttons
             button_frame = ttk.Frame(countries_frame_inner)
             button_frame.grid(row=num_countries // 2 + 1, columnspan=2, pady=10)
@@ -1131,6 +1303,7 @@ class CarSortGUI:
                 valid_layout_name = layout.replace(' ', '_').replace('-', '_')
                 var = getattr(self, f"{valid_layout_name}_var")
                 ttk.Checkbutton(engine_layout_selector_frame_inner, text=layout, variable=var).grid(row=idx, column=1, sticky='w')
+            self.add_facet_checkbuttons(engine_layout_selector_frame_inner)
             # Create a frame for the buttons
             button_frame = ttk.Frame(engine_layout_selector_frame_inner)
 
@@ -1377,11 +1550,24 @@ class CarSortGUI:
 
     # Updates the model dropdown for the advanced page
     def update_model_dropdown2(self, event):
+        if event is not None and event.type == tkinter.EventType.KeyRelease:
+            # While typing, the dropdown is only updated once the user pauses
+            self.debounce_model_lookup("models2", self.update_model_dropdown2)
+            return
+        self.schedule_filter_update()
         selected_brand = self.brand_dropdown2.get()
         if selected_brand.strip() != '':
-            models = search_by_brand_show_model_only(database_path, table_names, selected_brand)
-            self.model_dropdown2['values'] = models
+            model_index = get_loaded_model_index(database_path, table_names)
+            if model_index is not None:
+                self.search_executor.cancel("models2")
+                self.model_dropdown2['values'] = model_index.get_models(selected_brand)
+                self.brand_dropdown2['values'] = model_index.get_suggested_makes(selected_brand) or self.brand_names
+            else:
+                # The index is not loaded yet, it is built on the worker thread and a newer lookup replaces this one
+                self.search_executor.submit("models2", lambda: search_by_brand_show_model_only(database_path, table_names, selected_brand),
+                                            on_done=lambda models: self.model_dropdown2.configure(values=models))
         else:
+            self.search_executor.cancel("models2")
             self.model_dropdown2['values'] = None
             self.model_dropdown2.set("")
 
@@ -1412,19 +1598,16 @@ class CarSortGUI:
         website_url = None  # Initialize website_url with None
         success_flag = False  # Initialize success_flag with False
 
-        with sqlite3.connect(database_path) as connection:
-            cursor = connection.cursor()
-            # Add quotes around the {brand} placeholder in the SQL query
-            search_query = f"SELECT website FROM {table_names} WHERE make = '{brand}'"
-            cursor.execute(search_query)
-            result = cursor.fetchone()
-            if result and result[0] is not None and result[0] != '':
-                website_url = result[0]
-                webbrowser.open(website_url)  # Opens the website in default browser
-                success_flag = True  # Indicates success
-            else:
-                messagebox.showwarning("Website not found", "No website found for the selected brand.")
-                success_flag = False  # Indicates failure
+        # The brand is passed as a parameter, so brands with quotes in their name work and the statement can be reused
+        search_query = f"SELECT website FROM {table_names} WHERE make = ?"
+        result = get_connection_pool(database_path).execute(search_query, (brand,)).fetchone()
+        if result and result[0] is not None and result[0] != '':
+            website_url = result[0]
+            webbrowser.open(website_url)  # Opens the website in default browser
+            success_flag = True  # Indicates success
+        else:
+            messagebox.showwarning("Website not found", "No website found for the selected brand.")
+            success_flag = False  # Indicates failure
 
         if success_flag:
             return success_flag
@@ -1438,625 +1621,119 @@ class CarSortGUI:
 #  Function used to show all brands (makes), used in brand dropdown boxes
 def print_brand_names_only(database_path, table_name):
     try:
-        with sqlite3.connect(database_path) as connection:
-            # Connects to the SQL database and create a cursor
-            cursor = connection.cursor()
-            cursor.execute(f"SELECT make FROM {table_name}")
-            rows = cursor.fetchall()
-
-            brandlist = []
-
-            if rows:
-
-                # Sets automatically exclude duplicates
-                unique_brands = set()
-
-                # Add rows but without parentheses or similar
-                for row in rows:
-                    unique_brands.add(row[0])
-
-                # Sort the list alphanumerically so that it can be printed
-                for brand in sorted(unique_brands):
-                    brandlist.append(brand)
-
-            return brandlist  # Return the list of brand names
+        # The brand catalog is computed with a single GROUP BY when the database changes and then read from the catalog file,
+        #   so the table is not scanned on startup
+        return [brand for brand, car_count, model_count in get_brand_catalog(database_path, table_name)]
 
     except Exception as e:
         print(f"An error has occurred: {str(e)}")
         return []
 
 
+# Number of cars added to a results box at a time
+RESULTS_PAGE_SIZE = 50
+# Pause in typing (ms) after which the model dropdown is updated
+MODEL_LOOKUP_DELAY_MS = 150
+# Pause in changing the filters (ms) after which the checkbox counts and the live results are updated
+FILTER_UPDATE_DELAY_MS = 150
+# Number of cars shown by "Similar Cars"
+SIMILAR_CARS_SHOWN = 50
+
+
+# Formats a single car the way it is shown in the results box
+# Simple searches only show the basic variables, advanced ones show everything and put the RPM next to the HP and the torque
+def format_car_row(row, variable_names, complexity):
+    formatted_car = ""
+    skip_counter = 0
+    for i in range(1, len(variable_names)):
+        if skip_counter > 0:
+            skip_counter -= 1
+            continue
+
+        if complexity == "simple" and row[i] is not None:
+            if variable_names[i - 1][1] is True:
+                formatted_car += f"{variable_names[i - 1][0]}{row[i]}\n"
+        elif complexity == "advanced" and row[i] is not None:
+            if (variable_names[i - 1][0] == 'Engine HP: ') and (
+                    variable_names[i - 1 + 1][0] == 'Engine HP RPM: ') and (row[i] is not None) and (
+                    row[i + 1] is not None):
+                formatted_car += f"{variable_names[i - 1][0]}{row[i]} @ {row[i + 1]} RPM\n"
+                skip_counter += 1
+            if (variable_names[i - 1][0] == 'Maximum Torque (N*m): ') and (
+                    variable_names[i - 1 + 1][0] == 'Turnover of Maximum Torque (rpm): ') and (
+                    row[i] is not None) and (row[i + 1] is not None):
+                formatted_car += f"{variable_names[i - 1][0]}{row[i]} @ {row[i + 1]} RPM\n"
+                skip_counter += 1
+            if skip_counter == 0:
+                formatted_car += f"{variable_names[i - 1][0]}{row[i]}\n"
+    formatted_car += "~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~\n"
+    return formatted_car
+
+
+# Formats the cars one by one as they are asked for, so a big search is never formatted all at once
+def format_car_rows(rows, variable_names, complexity):
+    for row in rows:
+        yield format_car_row(row, variable_names, complexity)
+
+
 # The search_by_model function is always called to search, it's one function that manages everything and returns the results in a formatted string and the amount of cars found.
-def search_by_model(database_path, table_name, brand, model, year_from, year_to, seating_capacity_min, seating_capacity_max, engine_hp_min, engine_hp_max, curb_weight_kg_min, curb_weight_kg_max, min_power_to_weight_ratio, max_power_to_weight_ratio, displacement_min, displacement_max, top_speed_min, top_speed_max, engine_front_bool, engine_mid_bool, engine_rear_bool, gasoline_bool, diesel_bool, hybrid_bool, electric_bool, other_fuel_type_bool, drivetrain_fwd_bool, drivetrain_rwd_bool, drivetrain_awd_bool, car_type_roadster_bool, car_type_coupe_bool, car_type_hatchback_bool, car_type_spyder_bool, car_type_cabriolet_bool, car_type_sedan_bool, car_type_wagon_bool, car_type_suv_bool, car_type_pickup_bool, car_type_van_bool, car_type_limousine_bool, manual_transmission_bool, automatic_transmission_bool, Bore_Stroke_Undersquare_bool, Bore_Stroke_Square_bool, Bore_Stroke_Oversquare_bool, United_Kingdom_bool, Japan_bool, Germany_bool, Italy_bool, France_bool, United_States_bool, Belgium_bool, Romania_bool, South_Korea_bool, Russia_bool, Switzerland_bool, China_bool, India_bool, Latvia_bool, Fictional_bool, Malaysia_bool, Netherlands_bool, Poland_bool, Czech_Republic_bool, Spain_bool, Australia_bool, Iran_bool, Sweden_bool, Austria_bool, Ukraine_bool, Taiwan_bool, Luxembourg_bool, Brazil_bool, Uzbekistan_bool, Croatia_bool, Turkey_bool, Serbia_bool, Kazakhstan_bool, _8_cylinders_bool, _4_cylinders_bool, _6_cylinders_bool, _5_cylinders_bool, _2_cylinders_bool, _12_cylinders_bool, _3_cylinders_bool, _10_cylinders_bool, _1_cylinders_bool, _7_cylinders_bool, _16_cylinders_bool, V_type_engine_layout_bool, Inline_engine_layout_bool, Opposed_engine_layout_bool, W_type_engine_layout_bool, Rotary_engine_layout_bool, variable_names, complexity, export_results_to_csv_bool, query_export_bool, query_import_boolean, query):
+# Kept for callers that pass every filter as its own argument, the search itself is described by a SearchSpec and run by search_cars
+def search_by_model(database_path, table_name, brand, model, year_from, year_to, seating_capacity_min, seating_capacity_max, engine_hp_min, engine_hp_max, curb_weight_kg_min, curb_weight_kg_max, min_power_to_weight_ratio, max_power_to_weight_ratio, displacement_min, displacement_max, top_speed_min, top_speed_max, engine_front_bool, engine_mid_bool, engine_rear_bool, gasoline_bool, diesel_bool, hybrid_bool, electric_bool, other_fuel_type_bool, drivetrain_fwd_bool, drivetrain_rwd_bool, drivetrain_awd_bool, car_type_roadster_bool, car_type_coupe_bool, car_type_hatchback_bool, car_type_spyder_bool, car_type_cabriolet_bool, car_type_sedan_bool, car_type_wagon_bool, car_type_suv_bool, car_type_pickup_bool, car_type_van_bool, car_type_limousine_bool, manual_transmission_bool, automatic_transmission_bool, Bore_Stroke_Undersquare_bool, Bore_Stroke_Square_bool, Bore_Stroke_Oversquare_bool, United_Kingdom_bool, Japan_bool, Germany_bool, Italy_bool, France_bool, United_States_bool, Belgium_bool, Romania_bool, South_Korea_bool, Russia_bool, Switzerland_bool, China_bool, India_bool, Latvia_bool, Fictional_bool, Malaysia_bool, Netherlands_bool, Poland_bool, Czech_Republic_bool, Spain_bool, Australia_bool, Iran_bool, Sweden_bool, Austria_bool, Ukraine_bool, Taiwan_bool, Luxembourg_bool, Brazil_bool, Uzbekistan_bool, Croatia_bool, Turkey_bool, Serbia_bool, Kazakhstan_bool, _8_cylinders_bool, _4_cylinders_bool, _6_cylinders_bool, _5_cylinders_bool, _2_cylinders_bool, _12_cylinders_bool, _3_cylinders_bool, _10_cylinders_bool, _1_cylinders_bool, _7_cylinders_bool, _16_cylinders_bool, V_type_engine_layout_bool, Inline_engine_layout_bool, Opposed_engine_layout_bool, W_type_engine_layout_bool, Rotary_engine_layout_bool, variable_names, complexity, export_results_to_csv_bool, query_export_bool, query_import_boolean, query, stream_results=False):
+    # locals() holds the arguments by name at this point
+    search_spec = get_search_spec(locals())
+    return search_cars(database_path, table_name, search_spec, variable_names, complexity, export_results_to_csv_bool, query_export_bool,
+                       query_import_boolean, query, stream_results)
+
+
+# Runs a search and returns the formatted cars and their number, or an error message
+# The flags export the results to a CSV file, show the SQL of the search, or run an imported query instead of the search
+# With stream_results the cars come back as a generator that formats them as they are read (except for exports and imports)
+def search_cars(database_path, table_name, search_spec, variable_names, complexity, export_results_to_csv_bool=0, query_export_bool=0,
+                query_import_boolean=0, query=None, stream_results=False):
     # If the user wishes to export their results to a csv, this function opens a file and writes the data
     def export_results_to_csv(file_path, rows):
         try:
             with open(file_path, mode='w', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow([i[0] for i in cursor.description])  # Write headers
-                writer.writerows(rows)  # Write query results
+                write_rows_as_csv(file, [i[0] for i in cursor.description], rows)
             return True
         except Exception as e:
             print("Error occurred while exporting to CSV:", e)
             return False
 
-    parameters = {
-        'database_path': database_path,
-        'table_name': table_name,
-        'brand': brand,
-        'model': model,
-        'year_from': year_from,
-        'year_to': year_to,
-        'seating_capacity_min': seating_capacity_min,
-        'seating_capacity_max': seating_capacity_max,
-        'engine_hp_min': engine_hp_min,
-        'engine_hp_max': engine_hp_max,
-        'curb_weight_kg_min': curb_weight_kg_min,
-        'curb_weight_kg_max': curb_weight_kg_max,
-        'min_power_to_weight_ratio': min_power_to_weight_ratio,
-        'max_power_to_weight_ratio': max_power_to_weight_ratio,
-        'displacement_min': displacement_min,
-        'displacement_max': displacement_max,
-        'top_speed_min': top_speed_min,
-        'top_speed_max': top_speed_max,
-        'engine_front_bool': engine_front_bool,
-        'engine_mid_bool': engine_mid_bool,
-        'engine_rear_bool': engine_rear_bool,
-        'gasoline_bool': gasoline_bool,
-        'diesel_bool': diesel_bool,
-        'hybrid_bool': hybrid_bool,
-        'electric_bool': electric_bool,
-        'other_fuel_type_bool': other_fuel_type_bool,
-        'drivetrain_fwd_bool': drivetrain_fwd_bool,
-        'drivetrain_rwd_bool': drivetrain_rwd_bool,
-        'drivetrain_awd_bool': drivetrain_awd_bool,
-        'car_type_coupe_bool': car_type_coupe_bool,
-        'car_type_roadster_bool': car_type_roadster_bool,
-        'car_type_hatchback_bool': car_type_hatchback_bool,
-        'car_type_spyder_bool': car_type_spyder_bool,
-        'car_type_cabriolet_bool': car_type_cabriolet_bool,
-        'car_type_sedan_bool': car_type_sedan_bool,
-        'car_type_wagon_bool': car_type_wagon_bool,
-        'car_type_suv_bool': car_type_suv_bool,
-        'car_type_pickup_bool': car_type_pickup_bool,
-        'car_type_van_bool': car_type_van_bool,
-        'car_type_limousine_bool': car_type_limousine_bool,
-        'manual_transmission_bool': manual_transmission_bool,
-        'automatic_transmission_bool': automatic_transmission_bool,
-        'Bore_Stroke_Undersquare_bool': Bore_Stroke_Undersquare_bool,
-        'Bore_Stroke_Square_bool': Bore_Stroke_Square_bool,
-        'Bore_Stroke_Oversquare_bool': Bore_Stroke_Oversquare_bool,
-        'United_Kingdom_bool': United_Kingdom_bool,
-        'Japan_bool': Japan_bool,
-        'Germany_bool': Germany_bool,
-        'Italy_bool': Italy_bool,
-        'France_bool': France_bool,
-        'United_States_bool': United_States_bool,
-        'Belgium_bool': Belgium_bool,
-        'Romania_bool': Romania_bool,
-        'South_Korea_bool': South_Korea_bool,
-        'Russia_bool': Russia_bool,
-        'Switzerland_bool': Switzerland_bool,
-        'China_bool': China_bool,
-        'India_bool': India_bool,
-        'Latvia_bool': Latvia_bool,
-        'Fictional_bool': Fictional_bool,
-        'Malaysia_bool': Malaysia_bool,
-        'Netherlands_bool': Netherlands_bool,
-        'Poland_bool': Poland_bool,
-        'Czech_Republic_bool': Czech_Republic_bool,
-        'Spain_bool': Spain_bool,
-        'Australia_bool': Australia_bool,
-        'Iran_bool': Iran_bool,
-        'Sweden_bool': Sweden_bool,
-        'Austria_bool': Austria_bool,
-        'Ukraine_bool': Ukraine_bool,
-        'Taiwan_bool': Taiwan_bool,
-        'Luxembourg_bool': Luxembourg_bool,
-        'Brazil_bool': Brazil_bool,
-        'Uzbekistan_bool': Uzbekistan_bool,
-        'Croatia_bool': Croatia_bool,
-        'Turkey_bool': Turkey_bool,
-        'Serbia_bool': Serbia_bool,
-        'Kazakhstan_bool': Kazakhstan_bool,
-        '_1_cylinders_bool': _1_cylinders_bool,
-        '_2_cylinders_bool': _2_cylinders_bool,
-        '_3_cylinders_bool': _3_cylinders_bool,
-        '_4_cylinders_bool': _4_cylinders_bool,
-        '_5_cylinders_bool': _5_cylinders_bool,
-        '_6_cylinders_bool': _6_cylinders_bool,
-        '_7_cylinders_bool': _7_cylinders_bool,
-        '_8_cylinders_bool': _8_cylinders_bool,
-        '_10_cylinders_bool': _10_cylinders_bool,
-        '_12_cylinders_bool': _12_cylinders_bool,
-        '_16_cylinders_bool': _16_cylinders_bool,
-        'V_type_engine_layout_bool': V_type_engine_layout_bool,
-        'Inline_engine_layout_bool': Inline_engine_layout_bool,
-        'Opposed_engine_layout_bool': Opposed_engine_layout_bool,
-        'W_type_engine_layout_bool': W_type_engine_layout_bool,
-        'Rotary_engine_layout_bool': Rotary_engine_layout_bool,
-        'variable_names': variable_names,
-        'complexity': complexity,
-        'export_results_to_csv_bool': export_results_to_csv_bool,
-        'query_export_bool': query_export_bool,
-        'query_import_boolean': query_import_boolean,
-        'query': query,
-
-        }
-
-    # Uncomment for debugging purposes
-    # print("Parameters:")
-    # for param_name, param_value in parameters.items():
-    # print(f"{param_name}: {param_value}")
-
-    # This large amount of conditionals all append to arrays which later form a single SQL query as a string, executing the search in one go
-    #   This makes the program extremely fast and efficient, as SQL has a logarithmic search time, and performing a single search is very fast
+    year_from, year_to = search_spec.year
+    if year_from is not None and year_to is not None and year_from > year_to:
+        run_in_gui_thread(messagebox.showerror, "Error", "'Year From' must be less than 'Year To'")
+
     try:
-        with sqlite3.connect(database_path) as connection:
-            cursor = connection.cursor()
+        # Imported queries and the exports need the SQL query itself, so they always run in SQLite without the cache
+        searched_by_row_ids = query_import_boolean != 1 and query_export_bool != 1 and export_results_to_csv_bool != 1
+        connection_pool = get_connection_pool(database_path)
+        # Only the SQL queries need a cursor held open here, a search by rowid may first write the derived table
+        #   or the text index to the database, and reads the cars through cursors of its own
+        with connection_pool.open_cursor() if not searched_by_row_ids else nullcontext() as cursor:
 
             # Base query
             base_query = f"SELECT * FROM {table_name}"
 
-            # Call the method and store the result
-            result = sort_car_series_column_by_keywords(database_path, table_names, car_body_categories)
-
-            # and_paramaters and _and conditions are for searches that should be cars that have x and x and x (such as a V8 AND 400 horsepower AND less than 1200 kilos)
-            # or paramater are conditions that can be or such as Japanese Or Italian OR German car
-            and_paramaters = []
-            and_conditions = []
-            or_paramaters = []
-            or_conditions = []
-
-            if brand is not None and brand.strip() != "":
-                and_conditions.append("make = ?")
-                and_paramaters.append(brand)
-            if model is not None and model.strip() != "":
-                and_conditions.append("model = ?")
-                and_paramaters.append(model)
-            if year_from > year_to:
-                messagebox.showerror("Error", "'Year From' must be less than 'Year To'")
-            if year_from is not None and year_from != get_min_max_year(database_path, table_names, "min"):
-                and_conditions.append("year_from >= ? AND year_from != 0.0")
-                and_paramaters.append(year_from)
-            if year_to is not None and year_to != get_min_max_year(database_path, table_names, "max"):
-                and_conditions.append("year_to <= ? AND year_to != 0.0")
-                and_paramaters.append(year_to)
-            if seating_capacity_min is not None and seating_capacity_min != get_min_max_seating_capacity("min", database_path, table_names) and seating_capacity_max is not None and seating_capacity_max != get_min_max_seating_capacity("max", database_path, table_names):
-                and_conditions.append("CAST(number_of_seats AS INTEGER) >= ? AND CAST(number_of_seats AS INTEGER) <= ?")
-                and_paramaters.extend([int(round(seating_capacity_min)), int(round(seating_capacity_max))])
-            elif seating_capacity_min is not None and seating_capacity_min != get_min_max_seating_capacity("min", database_path, table_names):
-                and_conditions.append("CAST(number_of_seats AS INTEGER) >= ?")
-                and_paramaters.append(int(round(seating_capacity_min)))
-            elif seating_capacity_max is not None and seating_capacity_max != get_min_max_seating_capacity("max", database_path, table_names):
-                and_conditions.append("CAST(number_of_seats AS INTEGER) <= ?")
-                and_paramaters.append(int(round(seating_capacity_max)))
-            if engine_hp_min is not None and engine_hp_min != get_min_max_engine_hp("min", database_path, table_names):
-                and_conditions.append("engine_hp >= ?")
-                and_paramaters.append(int(engine_hp_min))
-            if engine_hp_max is not None and engine_hp_max != get_min_max_engine_hp("max", database_path, table_names):
-                and_conditions.append("engine_hp <= ?")
-                and_paramaters.append(int(engine_hp_max))
-            if curb_weight_kg_min is not None and curb_weight_kg_min != get_min_max_curb_weight("min", database_path, table_names):
-                and_conditions.append("curb_weight_kg >= ?")
-                and_paramaters.append(int(curb_weight_kg_min))
-            if curb_weight_kg_max is not None and curb_weight_kg_max != get_min_max_curb_weight("max", database_path, table_names):
-                and_conditions.append("curb_weight_kg <= ?")
-                and_paramaters.append(int(curb_weight_kg_max))
-            if min_power_to_weight_ratio is not None and min_power_to_weight_ratio != get_min_max_power_to_weight_ratio(
-                    "min", database_path, table_names):
-                and_conditions.append("engine_hp / NULLIF(curb_weight_kg, 0) >= ?")
-                and_paramaters.append(min_power_to_weight_ratio)
-            if max_power_to_weight_ratio is not None and max_power_to_weight_ratio != get_min_max_power_to_weight_ratio(
-                    "max", database_path, table_names):
-                and_conditions.append("engine_hp / NULLIF(curb_weight_kg, 0) <= ?")
-                and_paramaters.append(max_power_to_weight_ratio)
-            if displacement_min is not None and displacement_min != get_min_max_displacement("min", database_path, table_names):
-                and_conditions.append("capacity_cm3 >= ?")
-                and_paramaters.append(displacement_min)
-            if displacement_max is not None and displacement_max != get_min_max_displacement("max", database_path, table_names):
-                and_conditions.append("capacity_cm3 <= ?")
-                and_paramaters.append(displacement_max)
-
-            db_top_speed_min = get_min_max_top_speed('min', database_path, table_names)
-            db_top_speed_max = get_min_max_top_speed('max', database_path, table_names)
-
-            if top_speed_min is not None and top_speed_min != db_top_speed_min:
-                and_conditions.append("CAST(REPLACE(REPLACE(max_speed_km_per_h, ' km/h', ''), ',', '') AS REAL) >= ? AND max_speed_km_per_h NOT LIKE '%km/h%'")
-                and_paramaters.append(top_speed_min)
-
-            if top_speed_max is not None and top_speed_max != db_top_speed_max:
-                and_conditions.append("CAST(REPLACE(REPLACE(max_speed_km_per_h, ' km/h', ''), ',', '') AS REAL) <= ? AND max_speed_km_per_h NOT LIKE '%km/h%'")
-                and_paramaters.append(top_speed_max)
-
-            # Checkboxes:
-            if gasoline_bool == 1 and diesel_bool == 1 and hybrid_bool == 1 and electric_bool == 1 and other_fuel_type_bool == 1:
-                pass
-            else:
-                fuel_type_conditions = []
-                if gasoline_bool == 1:
-                    fuel_type_conditions.append("engine_type IN (?, ?, ?, ?, ?, ?)")
-                    or_paramaters.extend(["Gasoline", "petrol", "Gas", "Gasoline, Gas", "Rotor", "Petrol"])
-                if diesel_bool == 1:
-                    fuel_type_conditions.append("engine_type IN (?, ?)")
-                    or_paramaters.extend(["Diesel", "diesel"])
-                if hybrid_bool == 1:
-                    fuel_type_conditions.append("engine_type IN (?, ?)")
-                    or_paramaters.extend(["Hybrid", "hybrid"])
-                if electric_bool == 1:
-                    fuel_type_conditions.append("engine_type = ?")
-                    or_paramaters.append("Electric")
-                if other_fuel_type_bool == 1:
-                    fuel_type_conditions.append("engine_type = ?")
-                    or_paramaters.append("Liquefied coal hydrogen gases")
-
-                if fuel_type_conditions:
-                    and_conditions.append(f"({' OR '.join(fuel_type_conditions)})")
-
-            if engine_front_bool == 1 and engine_mid_bool == 1 and engine_rear_bool == 1:
-                pass
-            else:
-                engine_placement_conditions = []
-                if engine_front_bool == 1:
-                    engine_placement_conditions.append("engine_placement IN (?, ?, ?, ?)")
-                    or_paramaters.extend(
-                        ["front, cross-section", "front, longitudinal", "Front", "Front, longitudinally"])
-                if engine_mid_bool == 1:
-                    engine_placement_conditions.append("engine_placement IN (?, ?)")
-                    or_paramaters.extend(["mid-engine", "central"])
-                if engine_rear_bool == 1:
-                    engine_placement_conditions.append("engine_placement IN (?)")
-                    or_paramaters.append("rear")
-
-                if engine_placement_conditions:
-                    and_conditions.append(f"({' OR '.join(engine_placement_conditions)})")
-
-            if drivetrain_fwd_bool == 1 and drivetrain_rwd_bool == 1 and drivetrain_awd_bool == 1:
-                pass
-            else:
-                drivetrain_conditions = []
-                if drivetrain_fwd_bool == 1:
-                    drivetrain_conditions.append("drive_wheels = ?")
-                    or_paramaters.append("Front wheel drive")
-                if drivetrain_rwd_bool == 1:
-                    drivetrain_conditions.append("drive_wheels = ?")
-                    or_paramaters.append("Rear wheel drive")
-                if drivetrain_awd_bool == 1:
-                    drivetrain_conditions.append("drive_wheels IN (?, ?, ?, ?)")
-                    or_paramaters.extend(
-                        ["full", "All wheel drive (AWD)", "Four wheel drive (4WD)", "Constant all wheel drive"])
-
-                if drivetrain_conditions:
-                    and_conditions.append(f"({' OR '.join(drivetrain_conditions)})")
-
-            if manual_transmission_bool == 1 and automatic_transmission_bool:
-                pass
-            else:
-                transmission_conditions = []
-                if manual_transmission_bool == 1:
-                    transmission_conditions.append("transmission = ?")
-                    or_paramaters.append("Manual")
-
-                if automatic_transmission_bool == 1:
-                    transmission_conditions.append("transmission IN (?, ?, ?, ?, ?)")
-                    or_paramaters.extend(
-                        ["Automatic", "robot", "Continuously variable transmission (CVT)", "Electronic with 1 clutch",
-                         "Electronic with 2 clutch"])
-
-                if transmission_conditions:
-                    and_conditions.append(f"({' OR '.join(transmission_conditions)})")
-
-            if Bore_Stroke_Undersquare_bool == 1 and Bore_Stroke_Square_bool == 1 and Bore_Stroke_Oversquare_bool == 1:
-                pass
-            else:
-                bore_stroke_ratio_conditions = []
-                tolerance = 0.01  # Define a tolerance value for the comparison
-
-                if Bore_Stroke_Undersquare_bool == 1:
-                    bore_stroke_ratio_conditions.append("(cylinder_bore_mm / stroke_cycle_mm < ?) AND (cylinder_bore_mm != stroke_cycle_mm) AND (cylinder_bore_mm < "
-                                                        "stroke_cycle_mm)")  # Define undersquare condition
-                    or_paramaters.append(1 + tolerance)  # Add tolerance to the condition
-
-                if Bore_Stroke_Square_bool == 1:
-                    bore_stroke_ratio_conditions.append("(cylinder_bore_mm = stroke_cycle_mm)")
-
-                if Bore_Stroke_Oversquare_bool == 1:
-                    bore_stroke_ratio_conditions.append("(cylinder_bore_mm / stroke_cycle_mm > ?) AND (cylinder_bore_mm != stroke_cycle_mm) AND (cylinder_bore_mm > "
-                                                        "stroke_cycle_mm)")  # Define oversquare condition
-                    or_paramaters.append(1 - tolerance)  # Add tolerance to the condition
-
-                if bore_stroke_ratio_conditions:
-                    and_conditions.append(f"({' OR '.join(bore_stroke_ratio_conditions)})")
-
-            if United_Kingdom_bool == 1 and Japan_bool == 1 and Germany_bool == 1 and Italy_bool == 1 and France_bool == 1 and United_States_bool == 1 and Belgium_bool == 1 and Romania_bool == 1 and South_Korea_bool == 1 and Russia_bool == 1 and Switzerland_bool == 1 and China_bool == 1 and India_bool == 1 and Latvia_bool == 1 and Fictional_bool == 1 and Malaysia_bool == 1 and Netherlands_bool == 1 and Poland_bool == 1 and Czech_Republic_bool == 1 and Spain_bool == 1 and Australia_bool == 1 and Iran_bool == 1 and Sweden_bool == 1 and Austria_bool == 1 and Ukraine_bool == 1 and Taiwan_bool == 1 and Luxembourg_bool == 1 and Brazil_bool == 1 and Uzbekistan_bool == 1 and Croatia_bool == 1 and Turkey_bool == 1 and Serbia_bool == 1 and Kazakhstan_bool == 1:
-                pass
-            else:
-                nationality_conditions = []
-
-                if United_Kingdom_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("United Kingdom")
-
-                if Japan_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Japan")
-
-                if Germany_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Germany")
-
-                if Italy_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Italy")
-
-                if France_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("France")
-
-                if United_States_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("United States")
-
-                if Belgium_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Belgium")
-
-                if Romania_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Romania")
-
-                if South_Korea_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("South Korea")
-
-                if Russia_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Russia")
-
-                if Switzerland_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Switzerland")
-
-                if China_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("China")
-
-                if India_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("India")
-
-                if Latvia_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Latvia")
-
-                if Fictional_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Fictional")
-
-                if Malaysia_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Malaysia")
-
-                if Netherlands_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Netherlands")
-
-                if Poland_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Poland")
-
-                if Czech_Republic_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Czech Republic")
-
-                if Spain_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Spain")
-
-                if Australia_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Australia")
-
-                if Iran_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Iran")
-
-                if Sweden_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Sweden")
-
-                if Austria_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Austria")
-
-                if Ukraine_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Ukraine")
-
-                if Taiwan_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Taiwan")
-
-                if Luxembourg_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Luxembourg")
-
-                if Brazil_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Brazil")
-
-                if Uzbekistan_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Uzbekistan")
-
-                if Croatia_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Croatia")
-
-                if Turkey_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Turkey")
-
-                if Serbia_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Serbia")
-
-                if Kazakhstan_bool == 1:
-                    nationality_conditions.append("country_of_origin == ?")
-                    or_paramaters.append("Kazakhstan")
-
-                if nationality_conditions:
-                    and_conditions.append(f"({' OR '.join(nationality_conditions)})")
-
-            if _1_cylinders_bool == 1 and _2_cylinders_bool == 1 and _3_cylinders_bool == 1 and _4_cylinders_bool == 1 and _5_cylinders_bool == 1 and _6_cylinders_bool == 1 and _7_cylinders_bool == 1 and _8_cylinders_bool == 1 and _10_cylinders_bool == 1 and _12_cylinders_bool == 1 and _16_cylinders_bool == 1:
-                pass
-            else:
-                cylinder_count_conditions = []
-
-                cylinder_count_list = [
-                    [_1_cylinders_bool, 1],
-                    [_2_cylinders_bool, 2],
-                    [_3_cylinders_bool, 3],
-                    [_4_cylinders_bool, 4],
-                    [_5_cylinders_bool, 5],
-                    [_6_cylinders_bool, 6],
-                    [_7_cylinders_bool, 7],
-                    [_8_cylinders_bool, 8],
-                    [_10_cylinders_bool, 10],
-                    [_12_cylinders_bool, 12],
-                    [_16_cylinders_bool, 16]
-                    ]
-                for cylinder, count in cylinder_count_list:
-                    if cylinder == 1:
-                        cylinder_count_conditions.append("number_of_cylinders = ?")
-                        or_paramaters.append(count)
-
-                if cylinder_count_conditions:
-                    and_conditions.append(f"({' OR '.join(cylinder_count_conditions)})")
-
-            # Assuming 'and_conditions', 'or_conditions', 'or_parameters' are predefined lists or variables
-
-            if V_type_engine_layout_bool == 1 and Inline_engine_layout_bool == 1 and Opposed_engine_layout_bool == 1 and W_type_engine_layout_bool == 1 and Rotary_engine_layout_bool == 1:
-                pass
-            else:
-                engine_layout_conditions = []
-
-                if V_type_engine_layout_bool == 1:
-                    engine_layout_conditions.append("cylinder_layout IN (?, ?)")
-                    or_paramaters.extend(["V-type", "V-type with small angle"])
-
-                if Inline_engine_layout_bool == 1:
-                    engine_layout_conditions.append("cylinder_layout IN (?, ?)")
-                    or_paramaters.extend(["Inline", "inline"])
-
-                if Opposed_engine_layout_bool == 1:
-                    engine_layout_conditions.append("cylinder_layout IN (?, ?)")
-                    or_paramaters.extend(["Opposed", "opposed"])
-
-                if W_type_engine_layout_bool == 1:
-                    engine_layout_conditions.append("cylinder_layout = ?")
-                    or_paramaters.append("W-type")
-
-                # if drivetrain_fwd_bool == 1:
-                #     drivetrain_conditions.append("drive_wheels = ?")
-                #     or_paramaters.append("Front wheel drive")
-                # if drivetrain_rwd_bool == 1:
-                #     drivetrain_conditions.append("drive_wheels = ?")
-                #     or_paramaters.append("Rear wheel drive")
-                # if drivetrain_awd_bool == 1:
-                #     drivetrain_conditions.append("drive_wheels IN (?, ?, ?, ?)")
-                #     or_paramaters.extend(
-                #         ["full", "All wheel drive (AWD)", "Four wheel drive (4WD)", "Constant all wheel drive"])
-
-                if Rotary_engine_layout_bool == 1:
-                    engine_layout_conditions.append("cylinder_layout IN (?, ?)")
-                    or_paramaters.extend(["Rotary", "rotor"])
-
-                if engine_layout_conditions:
-                    and_conditions.append(f"({' OR '.join(engine_layout_conditions)})")
-
-            #     "V-type",  # "V-type with small angle",
-            #     "Inline",  # "inline",
-            #     "Opposed",  # "opposed"
-            #     "W-type",
-            #     "Rotary",  # "rotor",
-
-            # ALWAYS PUT THIS ONE LAST
-            if car_type_roadster_bool == 1 and car_type_coupe_bool == 1 and car_type_hatchback_bool == 1 and car_type_spyder_bool == 1 and car_type_suv_bool == 1 and car_type_van_bool == 1 and car_type_cabriolet_bool == 1 and car_type_sedan_bool == 1 and car_type_wagon_bool == 1 and car_type_pickup_bool == 1 and car_type_limousine_bool == 1:
-                pass
-            else:
-                if car_type_roadster_bool == 1:
-                    for category, models in result.items():
-                        if category == "Roadster":
-                            or_conditions.append(f"series IN ({','.join(['?'] * len(models))})")
-                            or_paramaters.extend(models)
-
-                if car_type_coupe_bool == 1:
-                    for category, models in result.items():
-                        if category == "Coupe":
-                            or_conditions.append(f"series IN ({','.join(['?'] * len(models))})")
-                            or_paramaters.extend(models)
-
-                if car_type_hatchback_bool == 1:
-                    for category, models in result.items():
-                        if category == "Hatchback":
-                            or_conditions.append(f"series IN ({','.join(['?'] * len(models))})")
-                            or_paramaters.extend(models)
-
-                if car_type_spyder_bool == 1:
-                    for category, models in result.items():
-                        if category == "Spyder":
-                            or_conditions.append(f"series IN ({','.join(['?'] * len(models))})")
-                            or_paramaters.extend(models)
-
-                if car_type_suv_bool == 1:
-                    for category, models in result.items():
-                        if category == "SUV":
-                            or_conditions.append(f"series IN ({','.join(['?'] * len(models))})")
-                            or_paramaters.extend(models)
-
-                if car_type_van_bool == 1:
-                    for category, models in result.items():
-                        if category == "Van":
-                            or_conditions.append(f"series IN ({','.join(['?'] * len(models))})")
-                            or_paramaters.extend(models)
-
-                if car_type_cabriolet_bool == 1:
-                    for category, models in result.items():
-                        if category == "Cabriolet":
-                            or_conditions.append(f"series IN ({','.join(['?'] * len(models))})")
-                            or_paramaters.extend(models)
-
-                if car_type_sedan_bool == 1:
-                    for category, models in result.items():
-                        if category == "Sedan":
-                            or_conditions.append(f"series IN ({','.join(['?'] * len(models))})")
-                            or_paramaters.extend(models)
-
-                if car_type_wagon_bool == 1:
-                    for category, models in result.items():
-                        if category == "Wagon":
-                            or_conditions.append(f"series IN ({','.join(['?'] * len(models))})")
-                            or_paramaters.extend(models)
-
-                if car_type_pickup_bool == 1:
-                    for category, models in result.items():
-                        if category == "Pickup":
-                            or_conditions.append(f"series IN ({','.join(['?'] * len(models))})")
-                            or_paramaters.extend(models)
-
-                if car_type_limousine_bool == 1:
-                    for category, models in result.items():
-                        if category == "Limousine":
-                            or_conditions.append(f"series IN ({','.join(['?'] * len(models))})")
-                            or_paramaters.extend(models)
-
-            if query_import_boolean == 1:
+            if searched_by_row_ids:
+                # Repeated searches come from the result cache, so they are not even compiled to SQL
+                # Searches with keywords show their best matches first
+                row_ids = find_ranked_row_ids(database_path, table_name, search_spec)
+
+                # Only the matching cars are read from the database, a chunk at a time
+                # When streaming they are also only formatted when they are shown
+                matching_rows = iterate_rows_by_id(database_path, table_name, row_ids)
+                if stream_results:
+                    return format_car_rows(matching_rows, variable_names, complexity), len(row_ids)
+                with trace_span("read cars") as span:
+                    rows = list(matching_rows)
+                    span.set(rows=len(rows))
+            elif query_import_boolean == 1:
                 try:
                     # print("QUERY FOR IMPORT:", query)
 
                     # Execute the query with parameters
-                    cursor.execute(query)
+                    connection_pool.execute(query, cursor=cursor)
 
                 except Exception as e:
                     print("Error handling imported query:", e)
@@ -2064,49 +1741,42 @@ def search_by_model(database_path, table_name, brand, model, year_from, year_to,
 
             else:
                 try:
+                    search_query, parameters = get_search_query(database_path, table_name, search_spec)
 
-                    if and_conditions or or_conditions:
-                        and_clause = " AND ".join(and_conditions)
-                        or_clause = " OR ".join(or_conditions)
-                        if and_clause and or_clause:
-                            where_clause = f"({and_clause}) AND ({or_clause})"
-                        else:
-                            where_clause = and_clause if and_clause else or_clause
+                    # print("SQL Query:", search_query)
+                    # print("paramaters:", parameters)
 
-                        search_query = f"{base_query} WHERE {where_clause}"
-                        parameters = and_paramaters + or_paramaters
-
-                        # print("SQL Query:", search_query)
-                        # print("paramaters:", parameters)
-
-                        cursor.execute(search_query, tuple(parameters))
-                    else:
-                        cursor.execute(base_query)
+                    connection_pool.execute(search_query, parameters, cursor=cursor)
 
                 except sqlite3.Error as e:
                     print("Error executing query:", e)
 
             if query_export_bool == 1:
                 try:
-                    if search_query is not None:
-                        query_str = search_query
-                        for param in parameters:
-                            # Replace the first occurrence of '?' in the query with the parameter value
-                            query_str = query_str.replace('?', repr(param), 1)
-                        # print("Executed Statement:", query_str)
-                except:
+                    query_str = get_executed_statement(search_query, parameters)
+                    # print("Executed Statement:", query_str)
+                except NameError:
+                    # The search query could not be built
                     query_str = base_query
-                popup = tkinter.Toplevel()
-                popup.title("Execute Statement")
 
-                label = ttk.Label(popup, text="Execute Statement:")
-                label.pack()
+                # Shows the executed statement in a popup window
+                def show_executed_statement():
+                    popup = tkinter.Toplevel()
+                    popup.title("Execute Statement")
+
+                    label = ttk.Label(popup, text="Execute Statement:")
+                    label.pack()
 
-                text = tkinter.Text(popup, height=5, width=50)
-                text.insert(tkinter.END, query_str)
-                text.pack()
+                    text = tkinter.Text(popup, height=5, width=50)
+                    text.insert(tkinter.END, query_str)
+                    text.pack()
 
-            rows = cursor.fetchall()
+                run_in_gui_thread(show_executed_statement)
+
+            if not searched_by_row_ids:
+                with trace_span("fetchall") as span:
+                    rows = cursor.fetchall()
+                    span.set(rows=len(rows))
 
             # CSV conditional
             if export_results_to_csv_bool == 1:
@@ -2119,7 +1789,7 @@ def search_by_model(database_path, table_name, brand, model, year_from, year_to,
                     return chosen_directory
 
                 # Choose the directory for exporting the CSV file
-                chosen_directory = choose_directory()
+                chosen_directory = run_in_gui_thread(choose_directory)
 
                 if chosen_directory:
                     file_path = chosen_directory + "/results.csv"  # Define the file path with a file name
@@ -2133,47 +1803,15 @@ def search_by_model(database_path, table_name, brand, model, year_from, year_to,
                     # print("No directory selected. CSV export cancelled.")
                     pass
 
-            count = 0
-            skip_counter = 0
             if len(rows) > 0:
-                formatted_output = ""
-                for row in rows:
-                    for i in range(1, len(variable_names)):
-                        if skip_counter > 0:
-                            skip_counter -= 1
-                            continue
-
-                        if complexity == "simple" and row[i] is not None:
-                            if variable_names[i - 1][1] is True:
-                                formatted_output += f"{variable_names[i - 1][0]}{row[i]}\n"
-                        elif complexity == "advanced" and row[i] is not None:
-                            if (variable_names[i - 1][0] == 'Engine HP: ') and (
-                                    variable_names[i - 1 + 1][0] == 'Engine HP RPM: ') and (row[i] is not None) and (
-                                    row[i + 1] is not None):
-                                formatted_output += f"{variable_names[i - 1][0]}{row[i]} @ {row[i + 1]} RPM\n"
-                                skip_counter += 1
-                            if (variable_names[i - 1][0] == 'Maximum Torque (N*m): ') and (
-                                    variable_names[i - 1 + 1][0] == 'Turnover of Maximum Torque (rpm): ') and (
-                                    row[i] is not None) and (row[i + 1] is not None):
-                                formatted_output += f"{variable_names[i - 1][0]}{row[i]} @ {row[i + 1]} RPM\n"
-                                skip_counter += 1
-                            if skip_counter == 0:
-                                formatted_output += f"{variable_names[i - 1][0]}{row[i]}\n"
-                    formatted_output += "~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~\n"
-                    count += 1
+                with trace_span("format cars", rows=len(rows), complexity=complexity):
+                    formatted_output = "".join(format_car_rows(rows, variable_names, complexity))
+                count = len(rows)
                 # Uncomment for debugging purposes (slows down program somewhat)
                 # print(formatted_output)
                 # print("NUMBER OF RESULTS: ", count)
                 return formatted_output, count
 
-            try:
-                # Uncomment for debugging purposes
-                pass
-                # print("SQL Query:", search_query)
-                # print("paramaters:", parameters)
-            except:
-                pass
-
     except sqlite3.Error as e:
         # Uncomment for debugging purposes
         # print("An error occurred in the search_by_model:", e)
@@ -0,0 +1,198 @@
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from array import array
+
+from car_search import add_search_arguments, find_matching_row_ids, get_filters_from_arguments, load_search_spec
+from columnar_engine import get_columnar_engine, set_columnar_engine_enabled
+from connection_pool import get_connection_pool
+from result_cache import clear_result_caches, get_result_cache
+from search_spec import COUNTRY_CHECKBOXES, CYLINDER_COUNT_CHECKBOXES, compile_search_spec
+
+
+# Runs many searches together, for reports that need every combination of a few filters (such as every country and cylinder count)
+# Searches already in the result cache are not run again, identical searches are run once, and the others share their work:
+#   - with the columnar engine, every distinct filter of the batch is evaluated once and each search combines the masks of its filters
+#   - in SQLite, the table is read once for a group of searches, each search setting one bit of the query results when a car matches
+
+# Most searches read by one SQLite query (a column each), and most parameters in one query
+MAX_SEARCHES_PER_QUERY = 200
+MAX_PARAMETERS_PER_QUERY = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+# Searches whose matches are packed into one integer column (SQLite integers have 64 bits, the sign bit is left alone)
+MATCH_BITS_PER_COLUMN = 62
+
+
+# Returns the rowids of the cars matching each search of a batch (in the order of the searches), using the result cache
+# Raises sqlite3.Error if the database cannot be searched
+def search_batch(database_path, table_name, search_specs):
+    result_cache = get_result_cache(database_path)
+    results = {}
+    missing_specs = []
+    # Identical searches are only looked up (and run) once
+    for search_spec in dict.fromkeys(search_specs):
+        row_ids = result_cache.get((table_name, search_spec))
+        if row_ids is None:
+            missing_specs.append(search_spec)
+        else:
+            results[search_spec] = row_ids
+
+    if missing_specs:
+        columnar_engine = get_columnar_engine(database_path, table_name)
+        if columnar_engine is not None:
+            missing_row_ids = columnar_engine.get_batch_row_ids(missing_specs)
+        else:
+            missing_row_ids = read_batch_row_ids(database_path, table_name, missing_specs)
+        for search_spec, row_ids in zip(missing_specs, missing_row_ids):
+            result_cache.put((table_name, search_spec), row_ids)
+            results[search_spec] = row_ids
+
+    return [results[search_spec] for search_spec in search_specs]
+
+
+# Returns the rowids of the cars matching each search, reading the table once for every group of searches
+def read_batch_row_ids(database_path, table_name, search_specs):
+    compiled_searches = [compile_search_spec(database_path, table_name, search_spec) for search_spec in search_specs]
+    # Searches giving the same SQL are read once
+    distinct_searches = list(dict.fromkeys(compiled_searches))
+    row_ids_by_search = {}
+    for query_searches in group_searches_into_queries(distinct_searches):
+        for compiled_search, row_ids in zip(query_searches, read_query_row_ids(database_path, table_name, query_searches)):
+            row_ids_by_search[compiled_search] = row_ids
+    return [row_ids_by_search[compiled_search] for compiled_search in compiled_searches]
+
+
+# Splits the searches into groups that fit in a single query
+def group_searches_into_queries(compiled_searches):
+    groups = []
+    group = []
+    parameter_count = 0
+    for compiled_search in compiled_searches:
+        search_parameter_count = len(compiled_search[1])
+        if group and (len(group) == MAX_SEARCHES_PER_QUERY or parameter_count + search_parameter_count > MAX_PARAMETERS_PER_QUERY):
+            groups.append(group)
+            group = []
+            parameter_count = 0
+        group.append(compiled_search)
+        parameter_count += search_parameter_count
+    if group:
+        groups.append(group)
+    return groups
+
+
+# Reads the table once and returns the rowids matching each of the searches, in rowid order
+# The matches of a car are packed into the bits of a few integer columns, so that Python only looks at the searches it matches
+# The sub-queries on the derived table are run once for the whole query by SQLite
+def read_query_row_ids(database_path, table_name, compiled_searches):
+    match_columns = []
+    for start in range(0, len(compiled_searches), MATCH_BITS_PER_COLUMN):
+        match_bits = [f"CASE WHEN {where_clause or '1'} THEN {1 << bit} ELSE 0 END"
+                      for bit, (where_clause, _) in enumerate(compiled_searches[start:start + MATCH_BITS_PER_COLUMN])]
+        match_columns.append(" + ".join(match_bits))
+    paramaters = [paramater for _, search_paramaters in compiled_searches for paramater in search_paramaters]
+    cursor = get_connection_pool(database_path).execute(
+        f"SELECT rowid, {', '.join(match_columns)} FROM {table_name} ORDER BY rowid", paramaters)
+    row_ids = [array("q") for _ in compiled_searches]
+    for row in cursor:
+        row_id = row[0]
+        for column_index, match_bits in enumerate(row[1:]):
+            while match_bits:
+                lowest_bit = match_bits & -match_bits
+                row_ids[column_index * MATCH_BITS_PER_COLUMN + lowest_bit.bit_length() - 1].append(row_id)
+                match_bits ^= lowest_bit
+    cursor.close()
+    return row_ids
+
+
+# Returns a search for every country and every cylinder count (and their combinations), the searches of a typical report
+def get_country_cylinder_specs(base_spec_filters=None):
+    base_spec_filters = base_spec_filters or {}
+    return [load_search_spec(dict(base_spec_filters, country_of_origin=[country], number_of_cylinders=[cylinder_count]))
+            for _, country in COUNTRY_CHECKBOXES for _, cylinder_count in CYLINDER_COUNT_CHECKBOXES]
+
+
+# Times a batch against running the same searches one at a time, with and without the columnar engine
+# The result cache is emptied before every run, so each search is really run
+def benchmark_batch(database_path, table_name, search_specs, repeats=3):
+    def measure(run):
+        times = []
+        for _ in range(repeats):
+            clear_result_caches()
+            start_time = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start_time)
+        return min(times)
+
+    def run_sequentially():
+        for search_spec in search_specs:
+            clear_result_caches()
+            find_matching_row_ids(database_path, table_name, search_spec)
+
+    timings = {}
+    for engine_name, enabled in [("columnar", True), ("SQLite", False)]:
+        set_columnar_engine_enabled(enabled)
+        if enabled and get_columnar_engine(database_path, table_name) is None:
+            print("The columnar engine is not available (is NumPy installed?)")
+            continue
+        # Warms up the snapshot, the statistics and the compiled searches, so only the searching is measured
+        search_batch(database_path, table_name, search_specs)
+        timings[engine_name] = (measure(run_sequentially), measure(lambda: search_batch(database_path, table_name, search_specs)))
+    set_columnar_engine_enabled(True)
+    clear_result_caches()
+
+    for engine_name, (sequential_time, batch_time) in timings.items():
+        print(f"{engine_name}: {len(search_specs)} searches one at a time {sequential_time * 1000:.1f} ms "
+              f"({len(search_specs) / sequential_time:.0f} searches/s), as a batch {batch_time * 1000:.1f} ms "
+              f"({len(search_specs) / batch_time:.0f} searches/s), {sequential_time / batch_time:.1f}x")
+
+
+# Maintenance command, for example:
+#   python batch_search.py run car_database.db searches.jsonl > counts.jsonl  (one JSON search per line, '-' for stdin)
+#   python batch_search.py report car_database.db --year 2000 2020  (every country x cylinder count)
+#   python batch_search.py benchmark car_database.db
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs many searches at once and writes the number of cars (and rowids) of each")
+    parser.add_argument("command", choices=["run", "report", "benchmark"])
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("searches_path", nargs="?", default="-", help="file of JSON searches, one per line (run only)")
+    parser.add_argument("--table", default="car_db_metric")
+    parser.add_argument("--row-ids", action="store_true", help="also write the rowids of the matching cars")
+    parser.add_argument("--repeats", type=int, default=3)
+    add_search_arguments(parser)
+    arguments = parser.parse_args()
+
+    try:
+        if arguments.command == "run":
+            search_file = sys.stdin if arguments.searches_path == "-" else open(arguments.searches_path)
+            with search_file:
+                search_specs = [load_search_spec(json.loads(line)) for line in search_file if line.strip()]
+        else:
+            # The other search options are applied to every search of the report
+            search_specs = get_country_cylinder_specs(get_filters_from_arguments(arguments))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    try:
+        if arguments.command == "benchmark":
+            benchmark_batch(arguments.database_path, arguments.table, search_specs, arguments.repeats)
+        else:
+            start_time = time.perf_counter()
+            batch_row_ids = search_batch(arguments.database_path, arguments.table, search_specs)
+            batch_time = time.perf_counter() - start_time
+            for index, (search_spec, row_ids) in enumerate(zip(search_specs, batch_row_ids)):
+                result = {"search": index, "count": len(row_ids)}
+                if arguments.command == "report":
+                    result["country_of_origin"], = search_spec.country_of_origin
+                    result["number_of_cylinders"], = search_spec.number_of_cylinders
+                if arguments.row_ids:
+                    result["row_ids"] = [int(row_id) for row_id in row_ids]
+                print(json.dumps(result))
+            print(f"{len(search_specs)} searches in {batch_time * 1000:.1f} ms", file=sys.stderr)
+    except sqlite3.Error as e:
+        print("An error occurred while searching:", e, file=sys.stderr)
+        raise SystemExit(1)
+    except BrokenPipeError:
+        # The output was piped into a program that stopped reading (such as head)
+        sys.stderr.close()
+        raise SystemExit(0)
@@ -0,0 +1,340 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the peak memory is then left out of the results
+    resource = None
+
+from synthetic_database import ROW_COUNT_PRESETS, generate_database
+
+
+# Benchmark suite: times the startup of the program, the basic and advanced searches of a fixed corpus, the min/max helpers
+#   and the brand list on synthetic databases of every size (synthetic_database.py), and compares them with a stored baseline
+# Each measurement runs in its own process, so the startup is really cold and the peak memory belongs to a single database
+# The AutoMatch module is only imported by those processes, the suite itself does not need the GUI libraries
+
+# Bumped whenever the layout of the results changes, a baseline of another version is not compared
+BENCHMARK_VERSION = 1
+# Basic searches of the corpus, as (brand, model, (first year, last year) or None for every year), like the basic page
+BASIC_SEARCHES = [
+    ("Toyota", "", None), ("Toyota", "Corolla", None), ("BMW", "", (2000, 2010)), ("Porsche", "911", None), ("Lada", "", (1970, 1995)),
+    ("Ferrari", "", None), ("Tesla", "Model 3", None), ("Mercedes-Benz", "E-Class", (1990, 2024)), ("Honda", "Civic", (2000, 2024)),
+    ("Volkswagen", "", (2010, 2024)),
+    ]
+# Advanced searches of the corpus, as SearchSpec filters (the sliders and checkbox groups left out filter nothing)
+ADVANCED_SEARCHES = [
+    {"engine_hp": (300, None)},
+    {"year": (2015, 2024), "engine_type": ["Electric", "Hybrid"]},
+    {"country_of_origin": ["Italy"], "number_of_cylinders": [8, 10, 12]},
+    {"body_category": ["Coupe", "Roadster", "Cabriolet"], "transmission": ["Manual"], "drive_wheels": ["RWD"]},
+    {"curb_weight": (None, 1200), "power_to_weight_ratio": (0.1, None)},
+    {"displacement": (5000, None), "cylinder_layout": ["V-type", "W-type"]},
+    {"top_speed": (250, None), "engine_placement": ["Mid", "Rear"]},
+    {"brand": "Toyota", "seating_capacity": (7, None)},
+    {"bore_stroke": ["oversquare"], "year": (1990, 2005), "country_of_origin": ["Japan"]},
+    {"brand": "BMW", "engine_type": ["Diesel"], "drive_wheels": ["AWD"]},
+    ]
+
+# A result is a regression when it is this much slower (or bigger) than the baseline...
+DEFAULT_TOLERANCE = 0.25
+# ...and, for times, also slower by at least this many ms, so that timer noise on fast operations is not reported
+MIN_REGRESSION_MS = 1.0
+DEFAULT_BASELINE_PATH = "benchmark_baseline.json"
+
+
+# Returns the peak memory (resident set size, KiB) of the current process so far, or None where it cannot be read
+def get_peak_rss_kib():
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS gives bytes, Linux gives KiB
+    return peak_rss // 1024 if sys.platform == "darwin" else peak_rss
+
+
+# Returns the latency percentiles (ms) of a list of timings (seconds), and the cars found per second when row_count is given
+def get_latency_summary(times, row_count=None):
+    times = sorted(times)
+    summary = {
+        "samples": len(times),
+        "p50_ms": round(times[len(times) // 2] * 1000, 3),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 3),
+        "p99_ms": round(times[min(len(times) - 1, int(len(times) * 0.99))] * 1000, 3),
+        "max_ms": round(times[-1] * 1000, 3),
+        }
+    if row_count is not None:
+        summary["rows_per_s"] = round(row_count / sum(times)) if sum(times) else None
+    return summary
+
+
+# Returns the arguments of search_by_model for a search, the sliders the search leaves out being set to the limits of the table
+def get_search_by_model_arguments(automatch, database_path, table_name, search_spec, complexity):
+    from search_spec import CHECKBOX_GROUPS, RANGE_ARGUMENTS
+    from statistics_catalog import get_column_range
+
+    arguments = {"database_path": database_path, "table_name": table_name, "brand": search_spec.brand or "",
+                 "model": search_spec.model or "", "variable_names": automatch.variable_names, "complexity": complexity,
+                 "export_results_to_csv_bool": 0, "query_export_bool": 0, "query_import_boolean": 0, "query": None}
+    for range_name, (minimum_argument, maximum_argument) in RANGE_ARGUMENTS.items():
+        minimum, maximum = getattr(search_spec, range_name)
+        arguments[minimum_argument] = minimum if minimum is not None else get_column_range(database_path, table_name, range_name, "min")
+        arguments[maximum_argument] = maximum if maximum is not None else get_column_range(database_path, table_name, range_name, "max")
+    for group_name, checkboxes in CHECKBOX_GROUPS.items():
+        checked_values = getattr(search_spec, group_name)
+        for argument_name, value in checkboxes:
+            arguments[argument_name] = 1 if checked_values is None or value in checked_values else 0
+    return arguments
+
+
+# Returns the searches of the corpus as (kind, SearchSpec)
+def get_corpus_specs():
+    from search_spec import SearchSpec
+
+    search_specs = [("basic_search", SearchSpec(brand, model, year=years)) for brand, model, years in BASIC_SEARCHES]
+    search_specs += [("advanced_search", SearchSpec(**filters)) for filters in ADVANCED_SEARCHES]
+    return search_specs
+
+
+# Runs a search of the corpus and returns its number of cars
+# The search returns a message instead of (cars, count) after an error or without cars, and every search of the corpus finds cars,
+#   so a message fails the run instead of being timed as a valid search
+def run_corpus_search(AutoMatch, arguments):
+    result = AutoMatch.search_by_model(**arguments)
+    if not isinstance(result, tuple):
+        raise RuntimeError(f"A search of the corpus failed: {result.strip()} (brand {arguments['brand']!r}, model {arguments['model']!r})")
+    return result[1]
+
+
+# Runs in its own process: what the program does before its window shows (import, brand list, slider ranges, model index),
+#   then the first search, which may still have to build the derived table and the columnar snapshot
+def measure_startup(database_path, table_name):
+    start_time = time.perf_counter()
+    import AutoMatch
+    from model_index import get_model_index
+
+    AutoMatch.print_brand_names_only(database_path, table_name)
+    read_slider_ranges(AutoMatch, database_path, table_name)
+    get_model_index(database_path, table_name)
+    startup_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    _, search_spec = get_corpus_specs()[len(BASIC_SEARCHES)]
+    run_corpus_search(AutoMatch, get_search_by_model_arguments(AutoMatch, database_path, table_name, search_spec, "advanced"))
+    first_search_time = time.perf_counter() - start_time
+    return {"startup_ms": round(startup_time * 1000, 3), "first_search_ms": round(first_search_time * 1000, 3),
+            "peak_rss_kib": get_peak_rss_kib()}
+
+
+# Reads every slider limit through the get_min_max_* helpers, as the pages do when they are built
+def read_slider_ranges(automatch, database_path, table_name):
+    automatch.get_min_max_year(database_path, table_name, "min")
+    automatch.get_min_max_year(database_path, table_name, "max")
+    for range_helper in [automatch.get_min_max_seating_capacity, automatch.get_min_max_engine_hp, automatch.get_min_max_curb_weight,
+                         automatch.get_min_max_power_to_weight_ratio, automatch.get_min_max_displacement,
+                         automatch.get_min_max_top_speed]:
+        range_helper("min", database_path, table_name)
+        range_helper("max", database_path, table_name)
+
+
+# Runs in its own process: times every search of the corpus (repeats times) and the helpers of the pages
+# The result cache is emptied before every search, so each one is really run
+def measure_operations(database_path, table_name, repeats):
+    import AutoMatch
+    from columnar_engine import get_columnar_engine
+    from result_cache import clear_result_caches
+    from statistics_catalog import clear_loaded_catalogs
+
+    corpus = [(search_kind, get_search_by_model_arguments(AutoMatch, database_path, table_name, search_spec,
+                                                          "simple" if search_kind == "basic_search" else "advanced"))
+              for search_kind, search_spec in get_corpus_specs()]
+    # Warms up the derived table, the snapshot and the compiled searches, the cold start is measured by measure_startup
+    for _, arguments in corpus:
+        run_corpus_search(AutoMatch, arguments)
+
+    times = {"basic_search": [], "advanced_search": [], "min_max_helpers": [], "brand_names": []}
+    car_counts = {"basic_search": 0, "advanced_search": 0}
+    for _ in range(repeats):
+        for search_kind, arguments in corpus:
+            clear_result_caches()
+            start_time = time.perf_counter()
+            car_count = run_corpus_search(AutoMatch, arguments)
+            times[search_kind].append(time.perf_counter() - start_time)
+            car_counts[search_kind] += car_count
+        # The helpers read the catalog file again, as a newly started program would
+        clear_loaded_catalogs()
+        start_time = time.perf_counter()
+        read_slider_ranges(AutoMatch, database_path, table_name)
+        times["min_max_helpers"].append(time.perf_counter() - start_time)
+        clear_loaded_catalogs()
+        start_time = time.perf_counter()
+        AutoMatch.print_brand_names_only(database_path, table_name)
+        times["brand_names"].append(time.perf_counter() - start_time)
+
+    operations = {operation: get_latency_summary(operation_times, car_counts.get(operation)) for operation, operation_times in times.items()}
+    return {"operations": operations, "columnar_engine": get_columnar_engine(database_path, table_name) is not None,
+            "peak_rss_kib": get_peak_rss_kib()}
+
+
+# Runs a measurement of this file in a new process and returns its JSON result
+# Raises RuntimeError if the process fails
+def run_measurement_process(command, database_path, table_name, *extra_arguments):
+    completed_process = subprocess.run([sys.executable, os.path.abspath(__file__), command, database_path, "--table", table_name,
+                                        *extra_arguments], capture_output=True, text=True)
+    if completed_process.returncode != 0:
+        raise RuntimeError(f"{command} failed on {database_path}:\n{completed_process.stderr}")
+    return json.loads(completed_process.stdout.strip().splitlines()[-1])
+
+
+# Removes the files the program keeps next to a database (statistics catalog, columnar snapshot of the table), for a cold start
+def remove_cache_files(database_path, table_name):
+    from columnar_snapshot import get_snapshot_path
+    from statistics_catalog import get_catalog_path
+
+    for cache_path in [get_catalog_path(database_path), get_snapshot_path(database_path, table_name)]:
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+
+# Starts the program repeats times (removing its cache files before each start for a cold start)
+# Returns the median of every startup measurement, a single start being too noisy to compare with a baseline
+def measure_startups(database_path, table_name, repeats, cold):
+    startups = []
+    for _ in range(repeats):
+        if cold:
+            remove_cache_files(database_path, table_name)
+        startups.append(run_measurement_process("startup", database_path, table_name))
+    medians = {}
+    for key in startups[0]:
+        # The peak memory is None where it cannot be read
+        values = sorted(startup[key] for startup in startups if startup[key] is not None)
+        medians[key] = values[len(values) // 2] if values else None
+    return medians
+
+
+# Runs the whole suite on a database of every size (generated in database_directory when missing) and returns the results
+def run_benchmark_suite(sizes, database_directory, table_name, repeats, seed=1):
+    results = {"version": BENCHMARK_VERSION, "machine": get_machine_description(), "databases": {}}
+    os.makedirs(database_directory, exist_ok=True)
+    for size in sizes:
+        database_path = os.path.join(database_directory, f"cars_{size}_seed{seed}.db")
+        if not os.path.exists(database_path):
+            print(f"Generating {database_path}...", file=sys.stderr)
+            generate_database(database_path, ROW_COUNT_PRESETS[size], seed, table_name)
+        print(f"Measuring {database_path}...", file=sys.stderr)
+        results["databases"][size] = {
+            "rows": ROW_COUNT_PRESETS[size],
+            "cold_startup": measure_startups(database_path, table_name, repeats, cold=True),
+            "warm_startup": measure_startups(database_path, table_name, repeats, cold=False),
+            **run_measurement_process("operations", database_path, table_name, "--repeats", str(repeats)),
+            }
+    return results
+
+
+# Returns what the results depend on besides the code, a baseline from another machine is only a rough guide
+def get_machine_description():
+    return {"platform": platform.platform(), "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "cpu_count": os.cpu_count()}
+
+
+# Returns every number of the results that can regress, keyed by its path (such as "100k/operations/basic_search/p95_ms")
+def flatten_results(results, prefix=""):
+    flat_results = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat_results.update(flatten_results(value, f"{prefix}{key}/"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key.endswith(("_ms", "_kib", "_per_s")):
+            flat_results[f"{prefix}{key}"] = value
+    return flat_results
+
+
+# Returns the regressions of the results against the baseline, as lines to print
+def compare_with_baseline(results, baseline, tolerance):
+    if baseline.get("version") != BENCHMARK_VERSION:
+        return [f"The baseline is from version {baseline.get('version')} of the benchmark, it cannot be compared"]
+    regressions = []
+    current_values = flatten_results(results["databases"])
+    for path, baseline_value in flatten_results(baseline["databases"]).items():
+        current_value = current_values.get(path)
+        if current_value is None or not baseline_value:
+            continue
+        if path.endswith("_per_s"):
+            is_regression = current_value < baseline_value / (1 + tolerance)
+        else:
+            is_regression = current_value > baseline_value * (1 + tolerance)
+            if path.endswith("_ms"):
+                is_regression = is_regression and current_value - baseline_value >= MIN_REGRESSION_MS
+        if is_regression:
+            regressions.append(f"{path}: {current_value} (baseline {baseline_value}, {current_value / baseline_value:.2f}x)")
+    return regressions
+
+
+# Prints the main numbers of the results, one line per database and operation
+def print_results(results):
+    for size, database_results in results["databases"].items():
+        print(f"{size} ({database_results['rows']} cars, columnar engine: {database_results['columnar_engine']}):")
+        for startup_name in ["cold_startup", "warm_startup"]:
+            startup = database_results[startup_name]
+            print(f"  {startup_name}: {startup['startup_ms']:.1f} ms, first search {startup['first_search_ms']:.1f} ms, "
+                  f"peak RSS {startup['peak_rss_kib']} KiB")
+        for operation, summary in database_results["operations"].items():
+            line = f"  {operation}: p50 {summary['p50_ms']:.2f} ms, p95 {summary['p95_ms']:.2f} ms, p99 {summary['p99_ms']:.2f} ms"
+            if "rows_per_s" in summary:
+                line += f", {summary['rows_per_s']} cars/s"
+            print(line)
+        print(f"  peak RSS: {database_results['peak_rss_kib']} KiB")
+
+
+# Maintenance command, for example:
+#   python benchmark_suite.py run --sizes 10k 100k  (compares with benchmark_baseline.json, exits with 1 on a regression)
+#   python benchmark_suite.py run --sizes 10k 100k 1m 5m --save-baseline  (records a new baseline)
+# The databases are generated once in --directory and reused by the next runs
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the searches and the startup on synthetic databases of several sizes")
+    parser.add_argument("command", choices=["run", "startup", "operations"], help="startup and operations are run by 'run'")
+    parser.add_argument("database_path", nargs="?", help="database of a single measurement (startup and operations only)")
+    parser.add_argument("--table", default="car_db_metric")
+    parser.add_argument("--sizes", nargs="+", choices=list(ROW_COUNT_PRESETS), default=["10k", "100k"])
+    parser.add_argument("--directory", default="benchmark_databases", help="folder of the generated databases")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=3, help="runs of the search corpus and starts of the program")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown, 0.25 for 25%%")
+    arguments = parser.parse_args()
+
+    if arguments.command == "startup":
+        print(json.dumps(measure_startup(arguments.database_path, arguments.table)))
+    elif arguments.command == "operations":
+        print(json.dumps(measure_operations(arguments.database_path, arguments.table, arguments.repeats)))
+    else:
+        try:
+            results = run_benchmark_suite(arguments.sizes, arguments.directory, arguments.table, arguments.repeats, arguments.seed)
+        except (OSError, RuntimeError, sqlite3.Error) as e:
+            print("The benchmark failed:", e, file=sys.stderr)
+            raise SystemExit(1)
+        print_results(results)
+        with open(arguments.save_baseline and arguments.baseline or arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+        if not arguments.save_baseline:
+            try:
+                with open(arguments.baseline) as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError):
+                print(f"No baseline to compare with ({arguments.baseline}), record one with --save-baseline")
+                raise SystemExit(0)
+            if baseline.get("machine") != results["machine"]:
+                print("The baseline was recorded on another machine, the comparison is only a rough guide")
+            regressions = compare_with_baseline(results, baseline, arguments.tolerance)
+            for regression in regressions:
+                print("Regression:", regression)
+            print(f"{len(regressions)} regressions against {arguments.baseline} (tolerance {arguments.tolerance:.0%})")
+            raise SystemExit(1 if regressions else 0)
@@ -0,0 +1,220 @@
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+
+from columnar_engine import get_columnar_engine
+from connection_pool import get_connection_pool
+from model_index import get_model_index
+from parallel_scan import read_matching_row_ids_with_workers, set_parallel_scan_workers
+from result_cache import get_result_cache, iterate_rows_by_id
+from search_spec import CHECKBOX_GROUPS, RANGE_ARGUMENTS, SearchSpec, compile_search_spec
+from text_search import ensure_text_index, rank_text_matches
+from tracing import set_trace_path, trace_span
+
+
+# Searching without the GUI: nothing here uses Tkinter, so searches can run in scripts, batch jobs and benchmarks
+# The GUI (search_cars in AutoMatch.py) uses the same functions and only adds its dialogs and formatting on top
+
+
+# Returns the rowids of the cars matching a search, in rowid order
+# Repeated searches are answered from the result cache, new ones by the columnar engine when NumPy is installed, otherwise by SQLite
+#   (split over worker processes for big tables when set_parallel_scan_workers is used)
+# Raises sqlite3.Error if the database cannot be searched
+def find_matching_row_ids(database_path, table_name, search_spec):
+    with trace_span("find matching row ids", search=repr(search_spec)) as span:
+        result_cache = get_result_cache(database_path)
+        cache_key = (table_name, search_spec)
+        row_ids = result_cache.get(cache_key)
+        if row_ids is None:
+            columnar_engine = get_columnar_engine(database_path, table_name)
+            if columnar_engine is not None:
+                span.set(engine="columnar")
+                row_ids = columnar_engine.get_matching_row_ids(search_spec)
+            else:
+                span.set(engine="SQLite")
+                where_clause, search_paramaters = compile_search_spec(database_path, table_name, search_spec)
+                row_ids = read_matching_row_ids_with_workers(database_path, table_name, where_clause, search_paramaters)
+            result_cache.put(cache_key, row_ids)
+        else:
+            span.set(engine="result cache")
+        span.set(rows=len(row_ids))
+    return row_ids
+
+
+# Returns the rowids of the cars matching a search in the order they are shown: the best matches of its text first,
+#   or in rowid order for a search without text
+# Raises sqlite3.Error if the database cannot be searched
+def find_ranked_row_ids(database_path, table_name, search_spec):
+    row_ids = find_matching_row_ids(database_path, table_name, search_spec)
+    return rank_text_matches(database_path, table_name, search_spec.text, row_ids)
+
+
+# Returns the number of cars matching a search and a generator of their full records (tuples in column order)
+# The records are read a chunk at a time as the generator is used, the best matches of the text of the search first
+def search_car_rows(database_path, table_name, search_spec):
+    row_ids = find_ranked_row_ids(database_path, table_name, search_spec)
+    return len(row_ids), iterate_rows_by_id(database_path, table_name, row_ids)
+
+
+# Returns the column names of a table, in the order of the records returned by search_car_rows
+def get_column_names(database_path, table_name):
+    cursor = get_connection_pool(database_path).execute(f"SELECT * FROM {table_name} LIMIT 0")
+    column_names = [column[0] for column in cursor.description]
+    cursor.close()
+    return column_names
+
+
+# Returns the SQL query of a search and its parameters, as run for exports
+def get_search_query(database_path, table_name, search_spec):
+    search_query = f"SELECT * FROM {table_name}"
+    where_clause, paramaters = compile_search_spec(database_path, table_name, search_spec)
+    if where_clause:
+        search_query += f" WHERE {where_clause}"
+    return search_query, paramaters
+
+
+# Returns a query with its parameters written into it, so it can be read or run again on its own
+def get_executed_statement(query, paramaters):
+    executed_statement = query
+    for paramater in paramaters:
+        # Replace the first occurrence of '?' in the query with the parameter value
+        executed_statement = executed_statement.replace('?', repr(paramater), 1)
+    return executed_statement
+
+
+# Writes cars to an open file as CSV, with a header line of the column names
+def write_rows_as_csv(file, column_names, rows):
+    writer = csv.writer(file)
+    writer.writerow(column_names)
+    writer.writerows(rows)
+
+
+# Writes cars to an open file as JSON lines, one object per car keyed by column name
+def write_rows_as_jsonl(file, column_names, rows):
+    for row in rows:
+        file.write(json.dumps(dict(zip(column_names, row)), ensure_ascii=False))
+        file.write("\n")
+
+
+# Returns the search described by a dictionary decoded from JSON (the SearchSpec argument names, ranges as [min, max] lists)
+# Raises ValueError if it is not a valid search
+def load_search_spec(filters):
+    if not isinstance(filters, dict):
+        raise ValueError("A search must be a JSON object")
+    try:
+        return SearchSpec(**filters)
+    except TypeError as e:
+        raise ValueError(str(e))
+
+
+# Returns the number given on the command line, as an int when it has no decimals
+def parse_number(text):
+    number = float(text)
+    return int(number) if number.is_integer() else number
+
+
+# Adds an option for every slider and checkbox group of SearchSpec to a command line parser
+def add_search_arguments(parser):
+    parser.add_argument("--spec", help="search as a JSON object, or @file to read it from a file ('@-' for stdin)")
+    parser.add_argument("--brand")
+    parser.add_argument("--model")
+    parser.add_argument("--text", help="words to find in the make, model, series, generation or trim")
+    for range_name in RANGE_ARGUMENTS:
+        parser.add_argument(f"--{range_name.replace('_', '-')}", nargs=2, type=parse_number, metavar=("MIN", "MAX"))
+    for group_name, checkboxes in CHECKBOX_GROUPS.items():
+        parser.add_argument(f"--{group_name.replace('_', '-')}", nargs="+", type=type(checkboxes[0][1]),
+                            choices=[value for _, value in checkboxes], metavar="VALUE")
+
+
+# Returns the filters given on the command line: the --spec JSON object, with the other options added to or replacing its filters
+def get_filters_from_arguments(arguments):
+    filters = {}
+    if arguments.spec is not None:
+        if arguments.spec.startswith("@"):
+            spec_file = sys.stdin if arguments.spec == "@-" else open(arguments.spec[1:])
+            with spec_file:
+                json_text = spec_file.read()
+        else:
+            json_text = arguments.spec
+        filters = json.loads(json_text)
+        if not isinstance(filters, dict):
+            raise ValueError("A search must be a JSON object")
+    for field_name in ["brand", "model", "text", *RANGE_ARGUMENTS, *CHECKBOX_GROUPS]:
+        value = getattr(arguments, field_name)
+        if value is not None:
+            filters[field_name] = value
+    return filters
+
+
+# Returns the search given on the command line
+def get_search_spec_from_arguments(arguments):
+    return load_search_spec(get_filters_from_arguments(arguments))
+
+
+# Command line search, for example:
+#   python car_search.py car_database.db --brand Toyota --year 2000 2010 --engine-type Hybrid Diesel > toyotas.jsonl
+#   python car_search.py car_database.db --spec @search.json --format csv --limit 100
+#   python car_search.py car_database.db --spec '{"engine_hp": [400, null]}' --count
+#   python car_search.py car_database.db --text "GT3 RS" --year 2010 2020
+#   python car_search.py car_database.db --brand Lamborgini --fuzzy --count
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Searches the car database without the GUI and writes the cars to stdout")
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("--table", default="car_db_metric")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("--limit", type=int, help="write at most this many cars")
+    parser.add_argument("--count", action="store_true", help="only write the number of matching cars")
+    parser.add_argument("--explain", action="store_true", help="write the search and its SQL query to stderr")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes of the SQLite search of big tables")
+    parser.add_argument("--trace", metavar="FILE", help="write the timing spans of the search to a Chrome trace file")
+    parser.add_argument("--fuzzy", action="store_true", help="replace a misspelled brand or model by the closest real one")
+    add_search_arguments(parser)
+    arguments = parser.parse_args()
+
+    try:
+        search_spec = get_search_spec_from_arguments(arguments)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    if arguments.fuzzy:
+        model_index = get_model_index(arguments.database_path, arguments.table)
+        if model_index is not None:
+            search_spec, corrections = model_index.correct_search_spec(search_spec)
+            for typed_name, name in corrections:
+                print(f"{typed_name!r} read as {name!r}", file=sys.stderr)
+
+    # The keyword index is built before the search (and the timing), never during it
+    if search_spec.text is not None:
+        ensure_text_index(arguments.database_path, arguments.table)
+
+    set_parallel_scan_workers(arguments.workers)
+    if arguments.trace is not None:
+        set_trace_path(arguments.trace)
+    start_time = time.perf_counter()
+    try:
+        if arguments.explain:
+            search_query, paramaters = get_search_query(arguments.database_path, arguments.table, search_spec)
+            print(search_spec, file=sys.stderr)
+            print(get_executed_statement(search_query, paramaters), file=sys.stderr)
+        count, rows = search_car_rows(arguments.database_path, arguments.table, search_spec)
+        if arguments.count:
+            print(count)
+        else:
+            if arguments.limit is not None:
+                rows = (row for _, row in zip(range(arguments.limit), rows))
+            column_names = get_column_names(arguments.database_path, arguments.table)
+            if arguments.format == "csv":
+                write_rows_as_csv(sys.stdout, column_names, rows)
+            else:
+                write_rows_as_jsonl(sys.stdout, column_names, rows)
+    except sqlite3.Error as e:
+        print("An error occurred while searching:", e, file=sys.stderr)
+        raise SystemExit(1)
+    except BrokenPipeError:
+        # The output was piped into a program that stopped reading (such as head)
+        sys.stderr.close()
+        raise SystemExit(0)
+    print(f"{count} cars found in {(time.perf_counter() - start_time) * 1000:.1f} ms", file=sys.stderr)
@@ -0,0 +1,382 @@
+import argparse
+import random
+import time
+from collections import OrderedDict
+
+from columnar_snapshot import build_snapshot, get_snapshot, np
+from connection_pool import get_connection_pool
+from derived_tables import get_enum_code, get_enum_code_column
+from result_cache import clear_result_caches, iterate_rows_by_id
+from search_spec import CATEGORICAL_CHECKBOXES, CHECKBOX_GROUPS, RANGE_ARGUMENTS, get_search_spec
+from statistics_catalog import get_column_range
+from text_search import read_text_row_ids
+
+
+# The columnar engine works on the filterable columns of the car table as NumPy arrays, memory-mapped from the snapshot,
+#   and answers the filters of search_by_model as vectorized boolean masks instead of a SQL query
+# Only the full records of the matching cars are read from SQLite, for display
+# It follows the same rules as the SQL path of search_by_model (with the derived table), which check_equivalence verifies
+
+# Set to False to always search in SQLite
+columnar_engine_enabled = True
+
+# Engines in use, keyed by (database path, table name), each one working on a snapshot
+columnar_engines = {}
+# Memory kept by each engine for the masks of recent filters (one byte per car per mask), see get_cached_filter_mask
+FILTER_MASK_CACHE_BYTES = 32 * 1024 * 1024
+
+
+class ColumnarEngine:
+    def __init__(self, database_path, table_name, snapshot):
+        self.database_path = database_path
+        self.table_name = table_name
+        self.snapshot = snapshot
+        self.row_count = snapshot.row_count
+        self.row_ids = snapshot.arrays["row_id"]
+        # Column name (without the table alias) to array
+        self.columns = snapshot.arrays
+        # Column name to {value: code} for the text columns
+        self.text_codes = {column_name: {value: code for code, value in enumerate(values)}
+                           for column_name, values in snapshot.text_values.items()}
+        # Masks of the most recently used filters, so that moving one slider only evaluates the filter of that slider again
+        self.filter_masks = OrderedDict()
+        self.max_filter_masks = max(1, FILTER_MASK_CACHE_BYTES // max(1, self.row_count))
+
+    # Returns the mask of the cars whose text column is one of the given values
+    def get_text_mask(self, column_name, values, columns=None):
+        columns = self.columns if columns is None else columns
+        codes = [self.text_codes[column_name][value] for value in values if value in self.text_codes[column_name]]
+        return np.isin(columns[column_name], codes)
+
+    # Returns the slider limit of a range, the filter is only applied when the slider is moved away from it
+    # The snapshot holds the same ranges as the statistics catalog
+    def get_range_limit(self, range_name, min_max_flag):
+        return self.snapshot.ranges[range_name][0 if min_max_flag == "min" else 1]
+
+    # Returns the filters of a search (a SearchSpec) as (key, function returning the mask of the cars it keeps) pairs
+    # Two searches with the same filter give it the same key, so a batch of searches computes its mask only once
+    # With positions (in the arrays), the masks only cover the cars at those positions, in the same order
+    def get_filters(self, search_spec, positions=None):
+        columns = self.columns if positions is None else ColumnSubset(self.columns, positions)
+        row_count = self.row_count if positions is None else len(positions)
+        filters = []
+
+        if search_spec.brand is not None:
+            filters.append((("make", search_spec.brand), lambda: self.get_text_mask("make", [search_spec.brand], columns)))
+        if search_spec.model is not None:
+            filters.append((("model", search_spec.model), lambda: self.get_text_mask("model", [search_spec.model], columns)))
+        if search_spec.text is not None:
+            # The words are looked up in the full-text index of the database, the snapshot has no index of its own
+            filters.append((("text", search_spec.text),
+                            lambda: np.isin(columns["row_id"], read_text_row_ids(self.database_path, self.table_name, search_spec.text))))
+
+        year_from, year_to = search_spec.year
+        if year_from is not None and year_from != self.get_range_limit("year", "min"):
+            filters.append((("year_from", ">=", year_from),
+                            lambda: (columns["year_from"] >= year_from) & (columns["year_from"] != 0.0)))
+        if year_to is not None and year_to != self.get_range_limit("year", "max"):
+            filters.append((("year_to", "<=", year_to), lambda: (columns["year_to"] <= year_to) & (columns["year_to"] != 0.0)))
+
+        # A car with several seat layouts matches when the range of its layouts overlaps the chosen range (as in SQLite)
+        seats_min, seats_max = search_spec.seating_capacity
+        if seats_min is not None and seats_min != self.get_range_limit("seating_capacity", "min"):
+            seats_min = int(round(seats_min))
+            filters.append((("seats_max", ">=", seats_min), lambda: columns["seats_max"] >= seats_min))
+        if seats_max is not None and seats_max != self.get_range_limit("seating_capacity", "max"):
+            seats_max = int(round(seats_max))
+            filters.append((("seats_min", "<=", seats_max), lambda: columns["seats_min"] <= seats_max))
+
+        for range_name, column_name, convert in [("engine_hp", "engine_hp", int), ("curb_weight", "curb_weight_kg", int),
+                                                 ("power_to_weight_ratio", "power_to_weight", None),
+                                                 ("displacement", "capacity_cm3", None), ("top_speed", "top_speed_kmh", None)]:
+            minimum, maximum = getattr(search_spec, range_name)
+            if minimum is not None and minimum != self.get_range_limit(range_name, "min"):
+                minimum = convert(minimum) if convert else minimum
+                filters.append(((column_name, ">=", minimum),
+                                lambda column_name=column_name, minimum=minimum: columns[column_name] >= minimum))
+            if maximum is not None and maximum != self.get_range_limit(range_name, "max"):
+                maximum = convert(maximum) if convert else maximum
+                filters.append(((column_name, "<=", maximum),
+                                lambda column_name=column_name, maximum=maximum: columns[column_name] <= maximum))
+
+        for column_name in CATEGORICAL_CHECKBOXES:
+            checked_values = search_spec.get_checked_values(column_name)
+            if checked_values:
+                codes = [get_enum_code(column_name, value) for value in checked_values]
+                filters.append(((column_name, tuple(checked_values)),
+                                lambda column_name=column_name, codes=codes: np.isin(columns[get_enum_code_column(column_name)], codes)))
+
+        checked_shapes = search_spec.get_checked_values("bore_stroke")
+        if checked_shapes:
+            def get_shape_mask():
+                ratio = columns["bore_stroke_ratio"]
+                shape_mask = np.zeros(row_count, dtype=bool)
+                if "undersquare" in checked_shapes:
+                    shape_mask |= ratio < 1
+                if "square" in checked_shapes:
+                    shape_mask |= ratio == 1
+                if "oversquare" in checked_shapes:
+                    shape_mask |= ratio > 1
+                return shape_mask
+            filters.append((("bore_stroke", tuple(checked_shapes)), get_shape_mask))
+
+        checked_countries = search_spec.get_checked_values("country_of_origin")
+        if checked_countries:
+            filters.append((("country_of_origin", tuple(checked_countries)),
+                            lambda: self.get_text_mask("country_of_origin", checked_countries, columns)))
+
+        checked_cylinder_counts = search_spec.get_checked_values("number_of_cylinders")
+        if checked_cylinder_counts:
+            filters.append((("number_of_cylinders", tuple(checked_cylinder_counts)),
+                            lambda: np.isin(columns["number_of_cylinders"], checked_cylinder_counts)))
+
+        checked_body_categories = search_spec.get_checked_values("body_category")
+        if checked_body_categories:
+            filters.append((("body_category", tuple(checked_body_categories)),
+                            lambda: self.get_text_mask("body_category", checked_body_categories, columns)))
+
+        return filters
+
+    # Returns the row ids of the cars matching a search (a SearchSpec)
+    # filter_masks ({filter key: mask}) is given by batches of searches, the masks of filters shared by their searches are kept there
+    def get_matching_row_ids(self, search_spec, filter_masks=None):
+        mask = np.ones(self.row_count, dtype=bool)
+        for filter_key, get_filter_mask in self.get_filters(search_spec):
+            if filter_masks is None:
+                mask &= get_filter_mask()
+                continue
+            filter_mask = filter_masks.get(filter_key)
+            if filter_mask is None:
+                filter_mask = get_filter_mask()
+                filter_masks[filter_key] = filter_mask
+            mask &= filter_mask
+        return self.row_ids[mask]
+
+    # Returns the positions in the arrays of the given cars (rowids in rowid order), the arrays are in rowid order too
+    def get_positions(self, row_ids):
+        return np.searchsorted(self.row_ids, np.asarray(row_ids, dtype=np.int64))
+
+    # Returns the positions (in the arrays) of the cars matching a search
+    # Given the positions of the cars found by a wider search, only those cars are checked,
+    #   and only against the filters that are not in skipped_filter_keys (the filters the wider search already applied)
+    def get_matching_positions(self, search_spec, positions=None, skipped_filter_keys=()):
+        mask = np.ones(self.row_count if positions is None else len(positions), dtype=bool)
+        for filter_key, get_filter_mask in self.get_filters(search_spec, positions):
+            if filter_key not in skipped_filter_keys:
+                mask &= get_filter_mask()
+        return np.flatnonzero(mask) if positions is None else positions[mask]
+
+    # Returns the row ids of the cars matching a search, reusing the masks of the recently used filters (see get_cached_filter_mask)
+    def get_matching_row_ids_from_cached_masks(self, search_spec):
+        mask = np.ones(self.row_count, dtype=bool)
+        for filter_key, get_filter_mask in self.get_filters(search_spec):
+            mask &= self.get_cached_filter_mask(filter_key, get_filter_mask)
+        return self.row_ids[mask]
+
+    # Returns the row ids of the cars matching each search of a batch, in the order of the searches
+    # Every distinct filter of the batch is evaluated once, and each search only combines the masks of its filters
+    def get_batch_row_ids(self, search_specs):
+        filter_masks = {}
+        return [self.get_matching_row_ids(search_spec, filter_masks) for search_spec in search_specs]
+
+    # Returns the mask of a filter, evaluating it only if it is not one of the recently used filters
+    def get_cached_filter_mask(self, filter_key, get_filter_mask):
+        filter_mask = self.filter_masks.get(filter_key)
+        if filter_mask is None:
+            filter_mask = get_filter_mask()
+            self.filter_masks[filter_key] = filter_mask
+            if len(self.filter_masks) > self.max_filter_masks:
+                self.filter_masks.popitem(last=False)
+        else:
+            self.filter_masks.move_to_end(filter_key)
+        return filter_mask
+
+    # Returns {checkbox group: {value: number of cars}}, the number of cars the search would find with only that checkbox
+    #   of the group checked (the other filters of the search, and those of the other groups, stay as they are)
+    # Every group is counted from one mask of the other filters, with a bincount over its codes
+    def get_facet_counts(self, search_spec):
+        filters = [(filter_key, self.get_cached_filter_mask(filter_key, get_filter_mask))
+                   for filter_key, get_filter_mask in self.get_filters(search_spec)]
+        facet_counts = {}
+        for group_name in CHECKBOX_GROUPS:
+            mask = np.ones(self.row_count, dtype=bool)
+            for filter_key, filter_mask in filters:
+                # The filters of checkbox groups are keyed by the name of their group
+                if filter_key[0] != group_name:
+                    mask &= filter_mask
+            facet_counts[group_name] = self.count_group_values(group_name, mask)
+        return facet_counts
+
+    # Returns the number of cars of the mask having each value of a checkbox group
+    def count_group_values(self, group_name, mask):
+        columns = self.columns
+        values = [value for _, value in CHECKBOX_GROUPS[group_name]]
+        if group_name in CATEGORICAL_CHECKBOXES:
+            # NULL is coded -1, so the codes are shifted by one for bincount
+            code_counts = np.bincount(columns[get_enum_code_column(group_name)][mask] + 1)
+            codes = {value: get_enum_code(group_name, value) + 1 for value in values}
+        elif group_name in self.text_codes:
+            code_counts = np.bincount(columns[group_name][mask])
+            codes = {value: self.text_codes[group_name].get(value, len(code_counts)) for value in values}
+        elif group_name == "number_of_cylinders":
+            cylinder_counts = columns["number_of_cylinders"][mask]
+            return {value: int(np.count_nonzero(cylinder_counts == value)) for value in values}
+        else:
+            ratio = columns["bore_stroke_ratio"][mask]
+            return {"undersquare": int(np.count_nonzero(ratio < 1)), "square": int(np.count_nonzero(ratio == 1)),
+                    "oversquare": int(np.count_nonzero(ratio > 1))}
+        return {value: int(code_counts[code]) if code < len(code_counts) else 0 for value, code in codes.items()}
+
+    # Yields the full records of the given cars from SQLite, in rowid order, reading them a chunk at a time
+    def iterate_rows(self, row_ids):
+        return iterate_rows_by_id(self.database_path, self.table_name, row_ids)
+
+    # Reads the full records of the given cars from SQLite, in rowid order
+    def fetch_rows(self, row_ids):
+        return list(self.iterate_rows(row_ids))
+
+    # Returns the full records of the cars matching a search
+    def search(self, search_spec):
+        return self.fetch_rows(self.get_matching_row_ids(search_spec))
+
+
+# The columns of some of the cars only, each column is cut out of the full array the first time it is used
+class ColumnSubset(dict):
+    def __init__(self, columns, positions):
+        super().__init__()
+        self.columns = columns
+        self.positions = positions
+
+    def __missing__(self, column_name):
+        column = self.columns[column_name][self.positions]
+        self[column_name] = column
+        return column
+
+
+# Turns the columnar engine on or off for the whole program
+def set_columnar_engine_enabled(enabled):
+    global columnar_engine_enabled
+    columnar_engine_enabled = enabled
+
+
+# Returns the engine of a table, working on the current snapshot of the database (rebuilt when the database file changed)
+# Returns None when the engine cannot be used (NumPy missing, engine turned off, no snapshot, ...), searches then use SQLite
+def get_columnar_engine(database_path, table_name):
+    if not columnar_engine_enabled:
+        return None
+    snapshot = get_snapshot(database_path, table_name)
+    if snapshot is None:
+        return None
+    columnar_engine = columnar_engines.get((database_path, table_name))
+    if columnar_engine is None or columnar_engine.snapshot is not snapshot:
+        columnar_engine = ColumnarEngine(database_path, table_name, snapshot)
+        columnar_engines[(database_path, table_name)] = columnar_engine
+    return columnar_engine
+
+
+# Generates random arguments for search_by_model: sliders either left at their limits or moved inside them,
+#   and checkbox groups either all checked or partly checked
+# The same seed always gives the same searches
+def generate_search_parameters(database_path, table_name, count=100, seed=0):
+    random_generator = random.Random(seed)
+    makes = [row[0] for row in get_connection_pool(database_path).execute(
+        f"SELECT DISTINCT make FROM {table_name} WHERE make IS NOT NULL ORDER BY make").fetchall()]
+
+    parameter_sets = []
+    for _ in range(count):
+        parameters = {"database_path": database_path, "table_name": table_name, "model": "",
+                      "brand": random_generator.choice(makes) if makes and random_generator.random() < 0.2 else ""}
+        for range_name, (minimum_name, maximum_name) in RANGE_ARGUMENTS.items():
+            low = get_column_range(database_path, table_name, range_name, "min")
+            high = get_column_range(database_path, table_name, range_name, "max")
+            parameters[minimum_name] = low
+            parameters[maximum_name] = high
+            if low is None or high is None:
+                continue
+            if random_generator.random() < 0.3:
+                parameters[minimum_name] = round(random_generator.uniform(low, low + (high - low) / 2), 2)
+            if random_generator.random() < 0.3:
+                parameters[maximum_name] = round(random_generator.uniform(low + (high - low) / 2, high), 2)
+        for checkboxes in CHECKBOX_GROUPS.values():
+            all_checked = random_generator.random() < 0.7
+            for argument_name, _ in checkboxes:
+                parameters[argument_name] = 1 if all_checked or random_generator.random() < 0.5 else 0
+        parameter_sets.append(parameters)
+    return parameter_sets
+
+
+# Runs search_by_model with and without the columnar engine and returns the number of searches whose results differ
+# The GUI module is imported here only, so the engine itself can be used without it
+def check_equivalence(database_path, table_name, parameter_sets):
+    from AutoMatch import search_by_model, variable_names
+
+    mismatches = 0
+    for parameters in parameter_sets:
+        arguments = dict(parameters, variable_names=variable_names, complexity="advanced", export_results_to_csv_bool=0,
+                         query_export_bool=0, query_import_boolean=0, query=None)
+        # The result cache is emptied before each run, or the second one would simply return the results of the first
+        set_columnar_engine_enabled(False)
+        clear_result_caches()
+        sql_result = search_by_model(**arguments)
+        set_columnar_engine_enabled(True)
+        clear_result_caches()
+        columnar_result = search_by_model(**arguments)
+        if sql_result != columnar_result:
+            mismatches += 1
+            print("Different results for:", {name: value for name, value in parameters.items() if name != "database_path"})
+    return mismatches
+
+
+# Measures the latency of the searches, in SQLite and with the columnar engine (filtering only, and filtering plus fetching the cars)
+def benchmark_columnar_engine(database_path, table_name, parameter_sets, repeats=3):
+    from AutoMatch import search_by_model, variable_names
+
+    columnar_engine = get_columnar_engine(database_path, table_name)
+    if columnar_engine is None:
+        print("The columnar engine is not available (is NumPy installed?)")
+        return
+    start_time = time.perf_counter()
+    ColumnarEngine(database_path, table_name, build_snapshot(database_path, table_name))
+    print(f"Load from the database: {(time.perf_counter() - start_time) * 1000:.1f} ms for {columnar_engine.row_count} cars")
+
+    timings = {"SQLite search": [], "columnar filter": [], "columnar search": []}
+    for parameters in parameter_sets:
+        arguments = dict(parameters, variable_names=variable_names, complexity="simple", export_results_to_csv_bool=0,
+                         query_export_bool=0, query_import_boolean=0, query=None)
+        search_spec = get_search_spec(parameters)
+        set_columnar_engine_enabled(False)
+        # The result cache is emptied before every SQLite search, so each one is really searched
+        for name, search in [("SQLite search", lambda: clear_result_caches() or search_by_model(**arguments)),
+                             ("columnar filter", lambda: columnar_engine.get_matching_row_ids(search_spec)),
+                             ("columnar search", lambda: columnar_engine.search(search_spec))]:
+            times = []
+            for _ in range(repeats):
+                start_time = time.perf_counter()
+                search()
+                times.append(time.perf_counter() - start_time)
+            timings[name].append(min(times))
+        set_columnar_engine_enabled(True)
+
+    for name, times in timings.items():
+        times.sort()
+        print(f"{name}: p50 {times[len(times) // 2] * 1000:.2f} ms, p95 {times[min(len(times) - 1, int(len(times) * 0.95))] * 1000:.2f} ms")
+
+
+# Maintenance command, for example:
+#   python columnar_engine.py check car_database.db
+#   python columnar_engine.py benchmark car_database.db --searches 200
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks and benchmarks the NumPy search engine against the SQLite search")
+    parser.add_argument("command", choices=["check", "benchmark"])
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("--table", default="car_db_metric")
+    parser.add_argument("--searches", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    searches = generate_search_parameters(arguments.database_path, arguments.table, arguments.searches, arguments.seed)
+    if arguments.command == "check":
+        mismatch_count = check_equivalence(arguments.database_path, arguments.table, searches)
+        print(f"{mismatch_count} of {len(searches)} searches gave different results")
+    elif arguments.command == "benchmark":
+        benchmark_columnar_engine(arguments.database_path, arguments.table, searches)
@@ -0,0 +1,274 @@
+import argparse
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import time
+
+from connection_pool import get_connection_pool, get_database_fingerprint
+from derived_tables import car_body_categories, ensure_derived_table, get_categorical_values, get_derived_table_name, get_enum_code_column
+from statistics_catalog import get_table_catalog
+from tracing import trace_span
+
+# NumPy is optional, without it there is no snapshot and everything is read from SQLite
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# The snapshot is a binary file next to the database (one per table) holding everything the program needs before the first search:
+#   the filterable columns of the car table (for the columnar engine), the brand and model lists and the slider ranges
+# The arrays are memory-mapped straight from the file, so opening it costs a small JSON header and no copying
+# It is rebuilt whenever the database file changes (same modification time and size check as the statistics catalog)
+
+# File layout: magic, header length (8 bytes, little endian), JSON header, then the arrays, each aligned to ARRAY_ALIGNMENT
+SNAPSHOT_MAGIC = b"AUTOMATCH-SNAPSHOT\n"
+# Bumped whenever the layout or the content of the snapshot changes, older files are then simply rebuilt
+SNAPSHOT_VERSION = 1
+ARRAY_ALIGNMENT = 64
+# Rows fetched at a time while the snapshot is built
+SNAPSHOT_READ_ROWS = 10000
+
+# Columns stored as numbers, from the car table and from the derived table (NULL is stored as NaN)
+NUMERIC_COLUMNS = ["car.year_from", "car.year_to", "car.engine_hp", "car.curb_weight_kg", "car.capacity_cm3",
+                   "car.number_of_cylinders", "derived.seats_min", "derived.seats_max", "derived.power_to_weight",
+                   "derived.top_speed_kmh", "derived.bore_stroke_ratio"]
+# Columns stored as text, each as an array of integer codes plus the list of distinct values (the code is the position in it)
+TEXT_COLUMNS = ["car.make", "car.model", "car.country_of_origin", "derived.body_category"]
+
+# Opened snapshots, keyed by (database path, table name)
+loaded_snapshots = {}
+
+
+class ColumnarSnapshot:
+    def __init__(self, header, arrays, memory_map=None):
+        self.fingerprint = header["fingerprint"]
+        self.table_name = header["table_name"]
+        self.row_count = header["row_count"]
+        # Slider ranges, as in the statistics catalog: {range name: [min, max]}
+        self.ranges = header["ranges"]
+        # Sorted brand names, and the sorted model names of every brand
+        self.makes = header["makes"]
+        self.models_by_make = header["models_by_make"]
+        # Distinct values of every text column, the arrays hold positions in these lists
+        self.text_values = header["text_values"]
+        # Column name (without the table alias) to array, plus "row_id"
+        self.arrays = arrays
+        # Kept open for as long as the snapshot is used, the arrays point into it
+        self.memory_map = memory_map
+
+
+# Returns the path of the snapshot file that belongs to a table of a database, every table has its own
+def get_snapshot_path(database_path, table_name):
+    return f"{database_path}.{table_name}.snapshot"
+
+
+# Reads the filterable columns of every car from the database, in rowid order
+# The rows are fetched SNAPSHOT_READ_ROWS at a time straight into arrays allocated for every car, so at most one batch of rows
+#   is held as Python objects (a whole table of them used to take several times the memory of the snapshot itself)
+# Returns the arrays and the distinct values of the text columns
+# Raises ValueError if a numeric column holds text, as SQLite compares text and numbers in a way the arrays cannot follow
+def read_filter_columns(database_path, table_name):
+    code_columns = [get_enum_code_column(column_name) for column_name in get_categorical_values()]
+    from_clause = (f"FROM {table_name} AS car JOIN {get_derived_table_name(table_name)} AS derived "
+                   f"ON derived.car_id = car.rowid")
+    cursor = get_connection_pool(database_path).execute(f"SELECT COUNT(*) {from_clause}")
+    car_count = cursor.fetchone()[0]
+    cursor.execute(f"SELECT car.rowid, {', '.join(NUMERIC_COLUMNS + TEXT_COLUMNS)}, "
+                   f"{', '.join('derived.' + column for column in code_columns)} {from_clause} ORDER BY car.rowid")
+
+    # The arrays as (dtype, value of the cars not read yet): NULL is NaN in the numeric columns and gets the code -1
+    #   in the categorical ones, which (like the unmapped code 0) is never chosen by a checkbox
+    array_types = {"row_id": (np.int64, 0)}
+    for column in NUMERIC_COLUMNS:
+        array_types[column.split('.')[1]] = (np.float64, np.nan)
+    for column in TEXT_COLUMNS:
+        array_types[column.split('.')[1]] = (np.int32, 0)
+    for column in code_columns:
+        array_types[column] = (np.int16, -1)
+    arrays = {name: np.full(car_count, fill_value, dtype=dtype) for name, (dtype, fill_value) in array_types.items()}
+    codes_by_column = {column.split('.')[1]: {} for column in TEXT_COLUMNS}
+
+    row_count = 0
+    while True:
+        rows = cursor.fetchmany(SNAPSHOT_READ_ROWS)
+        if not rows:
+            break
+        start, end = row_count, row_count + len(rows)
+        # Cars added since they were counted, the arrays grow to hold them
+        if end > len(arrays["row_id"]):
+            for name, (dtype, fill_value) in array_types.items():
+                arrays[name] = np.concatenate([arrays[name], np.full(end - len(arrays[name]), fill_value, dtype=dtype)])
+        columns_of_values = list(zip(*rows))
+        arrays["row_id"][start:end] = columns_of_values[0]
+        position = 1
+        for column in NUMERIC_COLUMNS:
+            values = columns_of_values[position]
+            if any(isinstance(value, (str, bytes)) for value in values):
+                cursor.close()
+                raise ValueError(f"{column} holds text values")
+            arrays[column.split('.')[1]][start:end] = [np.nan if value is None else value for value in values]
+            position += 1
+        for column in TEXT_COLUMNS:
+            codes = codes_by_column[column.split('.')[1]]
+            arrays[column.split('.')[1]][start:end] = [codes.setdefault(value, len(codes)) for value in columns_of_values[position]]
+            position += 1
+        for column in code_columns:
+            arrays[column][start:end] = [-1 if value is None else value for value in columns_of_values[position]]
+            position += 1
+        row_count = end
+    cursor.close()
+
+    # Cars removed since they were counted
+    arrays = {name: array[:row_count] for name, array in arrays.items()}
+    text_values = {name: list(codes) for name, codes in codes_by_column.items()}
+    return arrays, text_values
+
+
+# Returns the sorted brand names and the sorted model names of every brand (cars without a name are left out)
+def read_brand_lists(database_path, table_name):
+    cursor = get_connection_pool(database_path).execute(
+        f"SELECT DISTINCT make, model FROM {table_name} WHERE make IS NOT NULL AND model IS NOT NULL ORDER BY make, model")
+    models_by_make = {}
+    for make, model in cursor.fetchall():
+        models_by_make.setdefault(make, []).append(model)
+    cursor.execute(f"SELECT DISTINCT make FROM {table_name} WHERE make IS NOT NULL ORDER BY make")
+    makes = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return makes, models_by_make
+
+
+# Writes the snapshot file, under a temporary name first so that a crash can never leave a half written snapshot
+def write_snapshot_file(snapshot_path, header, arrays):
+    array_layout = {}
+    data_size = 0
+    for name, array in arrays.items():
+        data_size += -data_size % ARRAY_ALIGNMENT
+        array_layout[name] = {"dtype": array.dtype.str, "offset": data_size, "length": len(array)}
+        data_size += array.nbytes
+    header = dict(header, arrays=array_layout)
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = len(SNAPSHOT_MAGIC) + 8 + len(header_bytes)
+    data_start += -data_start % ARRAY_ALIGNMENT
+
+    temporary_path = f"{snapshot_path}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(SNAPSHOT_MAGIC)
+        file.write(struct.pack("<Q", len(header_bytes)))
+        file.write(header_bytes)
+        for name, array in arrays.items():
+            file.write(b"\0" * (data_start + array_layout[name]["offset"] - file.tell()))
+            file.write(array.tobytes())
+    os.replace(temporary_path, snapshot_path)
+
+
+# Opens a snapshot file and maps its arrays, returns None if it is missing, unreadable or from an older version
+def open_snapshot_file(snapshot_path):
+    try:
+        with open(snapshot_path, "rb") as file:
+            # An empty file cannot be mapped
+            if os.fstat(file.fileno()).st_size == 0:
+                return None
+            memory_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except OSError:
+        return None
+    try:
+        if memory_map[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            return None
+        header_length = struct.unpack_from("<Q", memory_map, len(SNAPSHOT_MAGIC))[0]
+        header_start = len(SNAPSHOT_MAGIC) + 8
+        header = json.loads(memory_map[header_start:header_start + header_length].decode("utf-8"))
+        if header.get("version") != SNAPSHOT_VERSION:
+            return None
+        data_start = header_start + header_length
+        data_start += -data_start % ARRAY_ALIGNMENT
+        # np.frombuffer does not copy, the arrays read the mapped pages directly
+        arrays = {name: np.frombuffer(memory_map, dtype=np.dtype(layout["dtype"]), count=layout["length"],
+                                      offset=data_start + layout["offset"])
+                  for name, layout in header["arrays"].items()}
+    except (ValueError, KeyError, struct.error):
+        return None
+    return ColumnarSnapshot(header, arrays, memory_map)
+
+
+# Reads everything from the database and writes a new snapshot file
+# If the file cannot be written (for example in a read-only folder) the snapshot is still returned, from memory
+def build_snapshot(database_path, table_name):
+    arrays, text_values = read_filter_columns(database_path, table_name)
+    makes, models_by_make = read_brand_lists(database_path, table_name)
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "fingerprint": get_database_fingerprint(database_path),
+        "table_name": table_name,
+        "row_count": len(arrays["row_id"]),
+        "ranges": get_table_catalog(database_path, table_name)["statistics"],
+        "makes": makes,
+        "models_by_make": models_by_make,
+        "text_values": text_values,
+        }
+    snapshot_path = get_snapshot_path(database_path, table_name)
+    try:
+        write_snapshot_file(snapshot_path, header, arrays)
+    except OSError as e:
+        print("Could not save the snapshot:", e)
+        return ColumnarSnapshot(header, arrays)
+    snapshot = open_snapshot_file(snapshot_path)
+    return snapshot if snapshot is not None else ColumnarSnapshot(header, arrays)
+
+
+# Returns the snapshot of a table, making sure it matches the current database file
+# Order of lookup: memory, then the snapshot file, and only if both are stale is the snapshot rebuilt from the database
+# Returns None when there can be no snapshot (NumPy missing, derived table not available, ...)
+def get_snapshot(database_path, table_name):
+    if np is None:
+        return None
+    # The derived table is built first, as building it changes the database file
+    if not ensure_derived_table(database_path, table_name, car_body_categories):
+        return None
+    fingerprint = get_database_fingerprint(database_path)
+
+    snapshot = loaded_snapshots.get((database_path, table_name))
+    if snapshot is not None and snapshot.fingerprint == fingerprint:
+        return snapshot
+
+    with trace_span("open snapshot") as span:
+        snapshot = open_snapshot_file(get_snapshot_path(database_path, table_name))
+        if snapshot is None or snapshot.fingerprint != fingerprint or snapshot.table_name != table_name:
+            span.set(built=True)
+            try:
+                snapshot = build_snapshot(database_path, table_name)
+            except (sqlite3.Error, ValueError) as e:
+                print("Could not build the snapshot:", e)
+                return None
+
+    loaded_snapshots[(database_path, table_name)] = snapshot
+    return snapshot
+
+
+# Maintenance command, for example:
+#   python columnar_snapshot.py build car_database.db
+#   python columnar_snapshot.py open car_database.db (prints how long opening the snapshot takes)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds or opens the memory-mapped snapshot of the car database")
+    parser.add_argument("command", choices=["build", "open"])
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("--table", default="car_db_metric")
+    arguments = parser.parse_args()
+
+    if np is None:
+        print("The snapshot needs NumPy")
+    elif arguments.command == "build":
+        ensure_derived_table(arguments.database_path, arguments.table, car_body_categories)
+        start_time = time.perf_counter()
+        built_snapshot = build_snapshot(arguments.database_path, arguments.table)
+        print(f"Built the snapshot of {built_snapshot.row_count} cars in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+    elif arguments.command == "open":
+        start_time = time.perf_counter()
+        opened_snapshot = open_snapshot_file(get_snapshot_path(arguments.database_path, arguments.table))
+        if opened_snapshot is None:
+            print("There is no valid snapshot, build it first")
+        else:
+            print(f"Opened the snapshot of {opened_snapshot.row_count} cars in {(time.perf_counter() - start_time) * 1000:.2f} ms, "
+                  f"up to date: {opened_snapshot.fingerprint == get_database_fingerprint(arguments.database_path)}")
@@ -0,0 +1,255 @@
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+from tracing import TRACED_QUERY_LENGTH, trace_span
+
+
+# The connection pool keeps one read-only SQLite connection open per thread instead of connecting on every call
+# Opening a connection means opening the file, reading the schema and warming up the page cache,
+#   which used to happen for every search, every slider range and every keystroke in the brand boxes
+# When the database file changes (a derived table or an index is written to it, or the file is replaced) the pool starts
+#   a new generation: every thread reopens its own connection the next time it uses the pool, once none of its cursors is open,
+#   so a search that is still reading (on this thread or on the search worker) is never cut off
+
+# Settings applied to every pooled connection
+# mmap_size lets SQLite read the database straight from memory-mapped pages (256 MB covers the whole car database),
+#   cache_size is in KiB when negative (64 MB), temp_store keeps sorting/DISTINCT temporary tables in memory
+#   and query_only makes sure a pooled connection can never change the database
+READ_ONLY_PRAGMAS = [
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA query_only = ON",
+    ]
+
+# Number of prepared statements kept per connection
+# The sqlite3 module keeps the compiled statements itself (cached_statements), the pool mirrors that LRU to count reuse
+STATEMENT_CACHE_SIZE = 128
+
+# One pool per database path, shared by the whole program
+connection_pools = {}
+connection_pools_lock = threading.Lock()
+
+
+# Returns the validity key of the database file, which is its modification time and size
+# Returns None if the file cannot be accessed
+def get_database_fingerprint(database_path):
+    try:
+        stat_result = os.stat(database_path)
+    except OSError:
+        return None
+    return [stat_result.st_mtime_ns, stat_result.st_size]
+
+
+# Opens a read-only connection to the database using a URI, so a missing database is reported instead of created
+def open_read_only_connection(database_path, statement_cache_size=STATEMENT_CACHE_SIZE):
+    database_uri = f"file:{pathname2url(os.path.abspath(database_path))}?mode=ro"
+    connection = sqlite3.connect(database_uri, uri=True, cached_statements=statement_cache_size, check_same_thread=False)
+    try:
+        for pragma in READ_ONLY_PRAGMAS:
+            connection.execute(pragma)
+    except sqlite3.Error:
+        connection.close()
+        raise
+    return connection
+
+
+# Cursor handed out by the pool, which remembers being closed so the pool knows when a connection is no longer in use
+class PooledCursor(sqlite3.Cursor):
+    closed = False
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+
+class ConnectionPool:
+    def __init__(self, database_path, statement_cache_size=STATEMENT_CACHE_SIZE):
+        self.database_path = database_path
+        self.statement_cache_size = statement_cache_size
+        self.fingerprint = get_database_fingerprint(database_path)
+        # Incremented whenever the database file changes, connections of an older generation are reopened
+        self.generation = 0
+        # Every thread gets its own connection, as SQLite connections should not be shared between threads
+        self.thread_data = threading.local()
+        self.connections = []
+        # Connection of every thread, by thread id, so a query can be interrupted from another thread
+        self.thread_connections = {}
+        self.lock = threading.Lock()
+        self.counters = {
+            "connections_opened": 0,
+            "connect_seconds": 0.0,
+            "statements_executed": 0,
+            "statements_prepared": 0,
+            "statements_reused": 0,
+            "execute_seconds": 0.0,
+            }
+
+    # Adds a value to one of the counters, counters are shared by all the threads
+    def add_to_counter(self, counter_name, value):
+        with self.lock:
+            self.counters[counter_name] += value
+
+    # Returns True if a cursor of the current thread is still open (handed out, not closed and still referenced)
+    def has_open_cursors(self):
+        return any(not cursor.closed for cursor in getattr(self.thread_data, "cursors", ()))
+
+    # Returns the connection of the current thread, opening it on first use
+    # A connection of an older generation is replaced once none of its cursors is open, until then it is still used
+    def get_connection(self):
+        connection = getattr(self.thread_data, "connection", None)
+        if connection is not None and self.thread_data.generation != self.generation and not self.has_open_cursors():
+            self.close_connection(connection)
+            connection = None
+        if connection is None:
+            start_time = time.perf_counter()
+            connection = open_read_only_connection(self.database_path, self.statement_cache_size)
+            self.add_to_counter("connect_seconds", time.perf_counter() - start_time)
+            self.add_to_counter("connections_opened", 1)
+            self.thread_data.connection = connection
+            self.thread_data.generation = self.generation
+            # Mirror of the prepared statement cache of this connection, oldest statement first
+            self.thread_data.statements = OrderedDict()
+            # Cursors handed out on this connection, they leave the set when they are no longer referenced
+            self.thread_data.cursors = weakref.WeakSet()
+            with self.lock:
+                self.connections.append(connection)
+                self.thread_connections[threading.get_ident()] = connection
+        return connection
+
+    # Closes a connection of the current thread and forgets it
+    def close_connection(self, connection):
+        with self.lock:
+            self.connections.remove(connection)
+            self.thread_connections.pop(threading.get_ident(), None)
+        self.thread_data.connection = None
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+
+    # Returns a new cursor on the connection of the current thread
+    def cursor(self):
+        cursor = self.get_connection().cursor(PooledCursor)
+        self.thread_data.cursors.add(cursor)
+        return cursor
+
+    # Hands out a cursor on the connection of the current thread for a "with" block and closes the cursor afterwards
+    # The connection itself stays open in the pool
+    @contextmanager
+    def open_cursor(self):
+        cursor = self.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    # Executes a query on the connection of the current thread and returns the cursor
+    # An existing cursor can be passed in, for example when the cursor description is needed afterwards
+    def execute(self, query, parameters=(), cursor=None):
+        if cursor is None:
+            cursor = self.cursor()
+        else:
+            self.get_connection()
+
+        # Queries with the same text reuse the statement SQLite already compiled
+        statements = self.thread_data.statements
+        if query in statements:
+            statements.move_to_end(query)
+            self.add_to_counter("statements_reused", 1)
+        else:
+            statements[query] = True
+            if len(statements) > self.statement_cache_size:
+                statements.popitem(last=False)
+            self.add_to_counter("statements_prepared", 1)
+
+        start_time = time.perf_counter()
+        try:
+            with trace_span("execute", query=query[:TRACED_QUERY_LENGTH], parameters=len(parameters)):
+                cursor.execute(query, parameters)
+        finally:
+            self.add_to_counter("execute_seconds", time.perf_counter() - start_time)
+            self.add_to_counter("statements_executed", 1)
+        return cursor
+
+    # Interrupts the query running on the connection of the given thread, which then fails with an "interrupted" error
+    # Does nothing if that thread has no connection or is not running a query
+    def interrupt_thread(self, thread_id):
+        with self.lock:
+            connection = self.thread_connections.get(thread_id)
+        if connection is not None:
+            connection.interrupt()
+
+    # Returns a copy of the counters, used to see how much connection overhead the pool removes
+    def get_statistics(self):
+        with self.lock:
+            statistics = dict(self.counters)
+        statistics["open_connections"] = len(self.connections)
+        return statistics
+
+    # Starts a new generation after the database file changed, every thread reopens its connection when it next uses the pool
+    # Only the connections of threads that have ended are closed here, no other connection can be closed from this thread
+    def start_new_generation(self, fingerprint):
+        running_thread_ids = {thread.ident for thread in threading.enumerate()}
+        with self.lock:
+            self.fingerprint = fingerprint
+            self.generation += 1
+            ended_thread_ids = [thread_id for thread_id in self.thread_connections if thread_id not in running_thread_ids]
+            ended_connections = [self.thread_connections.pop(thread_id) for thread_id in ended_thread_ids]
+            for connection in ended_connections:
+                self.connections.remove(connection)
+        for connection in ended_connections:
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
+
+    # Closes every connection of the pool, threads will open a new one on their next query
+    # Only for when the program is done with the database, as it cuts off the queries every thread is running
+    def close_all(self):
+        with self.lock:
+            connections = self.connections
+            self.connections = []
+            self.thread_connections = {}
+        for connection in connections:
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
+        # A new thread_data object drops the closed connections of every thread
+        self.thread_data = threading.local()
+
+
+# Returns the shared pool of a database
+# If the database file was changed or replaced since the pool was made, its connections are reopened as they are next used
+def get_connection_pool(database_path):
+    with connection_pools_lock:
+        connection_pool = connection_pools.get(database_path)
+        if connection_pool is None:
+            connection_pool = ConnectionPool(database_path)
+            connection_pools[database_path] = connection_pool
+        fingerprint = get_database_fingerprint(database_path)
+        if fingerprint != connection_pool.fingerprint:
+            connection_pool.start_new_generation(fingerprint)
+    return connection_pool
+
+
+# Closes every pooled connection of every database
+def close_all_connection_pools():
+    with connection_pools_lock:
+        for connection_pool in connection_pools.values():
+            connection_pool.close_all()
+
+
+# Interrupts the queries a thread is running, on every database
+def interrupt_thread_queries(thread_id):
+    with connection_pools_lock:
+        pools = list(connection_pools.values())
+    for connection_pool in pools:
+        connection_pool.interrupt_thread(thread_id)
@@ -0,0 +1,163 @@
+import argparse
+import sqlite3
+import time
+from collections import Counter
+
+from car_search import find_matching_row_ids, get_column_names
+from connection_pool import get_connection_pool
+from result_cache import iterate_rows_by_id
+from search_spec import compile_search_spec
+from statistics_catalog import get_catalog, get_table_catalog, save_catalog_file
+
+
+# Data profile of the car table: for every column the share of cars with a value, the number of distinct values,
+#   the smallest and biggest number and a histogram of the numbers
+# Everything is counted in a single pass over the cars: each column of a chunk of rows is counted with a Counter,
+#   and the profile is worked out from the counts of the distinct values afterwards
+# The profile of the whole table is kept in the statistics catalog, the profile of the cars of a search is computed when asked for
+
+# Number of bins of the histograms of numeric columns
+HISTOGRAM_BIN_COUNT = 10
+# Number of rows counted at a time
+PROFILE_CHUNK_SIZE = 5000
+
+
+# Returns the profile of a column from the number of cars having each of its values (None included)
+def get_column_profile(value_counts, row_count):
+    null_count = value_counts.pop(None, 0)
+    # Text columns can hold a few numbers and numeric columns a few texts, only the numbers have a range and a histogram
+    number_counts = {value: count for value, count in value_counts.items() if isinstance(value, (int, float))}
+    return {
+        "non_null": row_count - null_count,
+        "null_rate": null_count / row_count if row_count else 0.0,
+        "distinct": len(value_counts),
+        "min": min(number_counts) if number_counts else None,
+        "max": max(number_counts) if number_counts else None,
+        "histogram": get_histogram(number_counts),
+        }
+
+
+# Returns the histogram of numbers given as {number: count}, as [low, high, count] bins of equal width, or None without numbers
+def get_histogram(number_counts):
+    if not number_counts:
+        return None
+    minimum = min(number_counts)
+    maximum = max(number_counts)
+    if minimum == maximum:
+        return [[minimum, maximum, sum(number_counts.values())]]
+    bin_width = (maximum - minimum) / HISTOGRAM_BIN_COUNT
+    bin_counts = [0] * HISTOGRAM_BIN_COUNT
+    for number, count in number_counts.items():
+        bin_counts[min(int((number - minimum) / bin_width), HISTOGRAM_BIN_COUNT - 1)] += count
+    return [[minimum + bin_width * index, minimum + bin_width * (index + 1), count] for index, count in enumerate(bin_counts)]
+
+
+# Profiles every column of the table in a single pass, or only the given cars (rowids) when row_ids is not None
+# Returns {"row_count": number of cars, "columns": {column name: column profile}}, the columns in table order
+# Raises sqlite3.Error if the cars cannot be read
+def compute_data_profile(database_path, table_name, row_ids=None):
+    column_names = get_column_names(database_path, table_name)
+    value_counts = [Counter() for _ in column_names]
+    row_count = 0
+
+    if row_ids is None:
+        cursor = get_connection_pool(database_path).execute(f"SELECT * FROM {table_name}")
+        chunks = iter(lambda: cursor.fetchmany(PROFILE_CHUNK_SIZE), [])
+    else:
+        rows = iterate_rows_by_id(database_path, table_name, row_ids)
+        chunks = iter(lambda: [row for _, row in zip(range(PROFILE_CHUNK_SIZE), rows)], [])
+    for chunk in chunks:
+        row_count += len(chunk)
+        # Counting a whole column of the chunk at once keeps the loop over the values in C
+        for column_counts, column_values in zip(value_counts, zip(*chunk)):
+            column_counts.update(column_values)
+
+    return {"row_count": row_count,
+            "columns": {column_name: get_column_profile(column_counts, row_count)
+                        for column_name, column_counts in zip(column_names, value_counts)}}
+
+
+# Returns the profile of the whole table, computing it (and saving it in the statistics catalog) if needed
+# Raises sqlite3.Error if it cannot be computed
+def get_data_profile(database_path, table_name):
+    table_catalog = get_table_catalog(database_path, table_name)
+    if "profile" not in table_catalog:
+        table_catalog["profile"] = compute_data_profile(database_path, table_name)
+        save_catalog_file(database_path, get_catalog(database_path))
+    return table_catalog["profile"]
+
+
+# Returns the profile of the cars matching a search, the cached profile of the whole table when the search filters nothing
+# Raises sqlite3.Error if it cannot be computed
+def get_search_data_profile(database_path, table_name, search_spec):
+    where_clause, _ = compile_search_spec(database_path, table_name, search_spec)
+    if not where_clause:
+        return get_data_profile(database_path, table_name)
+    return compute_data_profile(database_path, table_name, find_matching_row_ids(database_path, table_name, search_spec))
+
+
+# Returns the profile of the columns sorted by the share of cars having a value, the most complete first
+# Each item is (column name, percentage of cars with a value, column profile)
+def get_completeness(data_profile):
+    return sorted(((column_name, (1 - column_profile["null_rate"]) * 100, column_profile)
+                   for column_name, column_profile in data_profile["columns"].items()), key=lambda item: item[1], reverse=True)
+
+
+# Returns a histogram as a line of block characters, one per bin, the tallest bin being a full block
+def format_histogram(histogram):
+    if not histogram or len(histogram) == 1:
+        return ""
+    blocks = " ▁▂▃▄▅▆▇█"
+    tallest_bin = max(count for _, _, count in histogram) or 1
+    return "".join(blocks[round(count / tallest_bin * (len(blocks) - 1))] for _, _, count in histogram)
+
+
+# Returns a line of the completeness window for a column
+def format_column_profile(column_name, percentage, column_profile):
+    line = f"{column_name}: {percentage:.2f}% ({column_profile['distinct']} distinct"
+    if column_profile["min"] is not None:
+        line += f", {column_profile['min']:g} to {column_profile['max']:g} {format_histogram(column_profile['histogram'])}".rstrip()
+    return line + ")"
+
+
+# The way the completeness window counted its columns before the profile: one COUNT query (and table scan) per column
+def count_columns_one_by_one(database_path, table_name, column_names):
+    connection_pool = get_connection_pool(database_path)
+    total_records = connection_pool.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+    return {column_name: connection_pool.execute(f"SELECT COUNT({column_name}) FROM {table_name} WHERE {column_name} IS NOT NULL")
+            .fetchone()[0] / total_records * 100 for column_name in column_names}
+
+
+# Maintenance command, for example:
+#   python data_profile.py car_database.db  (whole table, timed against one COUNT query per column)
+#   python data_profile.py car_database.db --brand Toyota --year 2000 2010  (the cars of a search)
+if __name__ == "__main__":
+    from car_search import add_search_arguments, get_search_spec_from_arguments
+
+    parser = argparse.ArgumentParser(description="Shows the completeness, distinct values and ranges of every column")
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("--table", default="car_db_metric")
+    add_search_arguments(parser)
+    arguments = parser.parse_args()
+    try:
+        search_spec = get_search_spec_from_arguments(arguments)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    try:
+        start_time = time.perf_counter()
+        if not compile_search_spec(arguments.database_path, arguments.table, search_spec)[0]:
+            data_profile = compute_data_profile(arguments.database_path, arguments.table)
+            profile_time = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            count_columns_one_by_one(arguments.database_path, arguments.table, list(data_profile["columns"]))
+            print(f"One COUNT per column: {(time.perf_counter() - start_time) * 1000:.1f} ms for {len(data_profile['columns'])} columns")
+        else:
+            data_profile = get_search_data_profile(arguments.database_path, arguments.table, search_spec)
+            profile_time = time.perf_counter() - start_time
+    except sqlite3.Error as e:
+        print("An error occurred while profiling:", e)
+        raise SystemExit(1)
+    print(f"Single pass profile: {profile_time * 1000:.1f} ms for {data_profile['row_count']} cars")
+    for column_name, percentage, column_profile in get_completeness(data_profile):
+        print(format_column_profile(column_name, percentage, column_profile))
@@ -0,0 +1,328 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+from connection_pool import get_connection_pool
+from statistics_catalog import get_table_catalog, keep_catalog_valid
+from tracing import trace_span
+
+
+# Derived tables hold values that are worked out from the car table once, instead of on every search
+# They live in the same database, next to the car table, with one row per car (car_id is the rowid of the car)
+# The statistics catalog remembers which derived tables were built, so they are only rebuilt when the database changes
+
+
+# List of car categories and corresponding keywords
+# Used to find the body category of a car from its series, for example "Coupe" or "Hatchback"
+car_body_categories = {
+    "Roadster": ["Roadster", "Speedster"],
+    "Coupe": ["Coupe", "Fastback", "Hardtop"],
+    "Hatchback": ["Hatchback", "Liftback"],
+    "Spyder": ["Spyder", "Spider"],
+    "Cabriolet": ["Cabriolet"],
+    "Sedan": ["Sedan", "Targa"],
+    "Wagon": ["Wagon"],
+    "SUV": ["SUV", "Crossover"],
+    "Pickup": ["Pickup"],
+    "Van": ["Van", "Minivan"],
+    "Limousine": ["Limousine"],
+    }
+
+
+# Returns the name of the derived table that belongs to a car table
+def get_derived_table_name(table_name):
+    return f"{table_name}_derived"
+
+
+# Method to categorize car models based on keywords
+# Used in the program to search cars by keywords such as "Coupe" or "Hatchback"
+def categorize_model(model_name, categories):
+    if model_name is None:
+        return None
+    for category, keywords in categories.items():
+        for keyword in keywords:
+            if keyword.lower() in model_name.lower():
+                return category
+    return None
+
+
+# Method to sort and categorize car series column in the database
+# Returns a 2D array of all the cars that fit under a certain keyword
+# Only used when the derived table cannot be built, for example on a read-only database
+def sort_car_series_column_by_keywords(database_path, table_name, categories):
+    try:
+        results = {}
+        with trace_span("sort car series by keywords") as span:
+            # Select car series column from the database
+            cursor = get_connection_pool(database_path).execute(f"SELECT DISTINCT series FROM {table_name}")
+            car_series_rows = cursor.fetchall()
+
+            # Create an empty dictionary to store categorized models
+            categorized_models = {category: [] for category in categories}
+
+            # Iterate through the car series rows and categorize the models
+            for row in car_series_rows:
+                car_series = row[0]
+                category = categorize_model(car_series, categories)
+                if category:
+                    categorized_models[category].append(car_series)
+            span.set(rows=len(car_series_rows))
+
+        # Store the categorized models in the 'results' dictionary
+        for category, models in categorized_models.items():
+            results[category] = models
+
+        # print(results)
+        return results  # Return the results as a dictionary
+
+    except sqlite3.Error as e:
+        print(f"SQLite error: {e}")
+        return {}  # Return an empty dictionary in case of an error
+
+
+# Bumped whenever columns are added to (or changed in) the derived table, so existing databases rebuild it
+DERIVED_TABLE_VERSION = 3
+
+# Numeric shadow columns, worked out with the same expressions search_by_model used to run on every row of every search
+# Storing them as plain numbers with an index means a range filter becomes an index lookup instead of a full scan
+NUMERIC_SHADOW_COLUMNS = {
+    # Values written with " km/h" were always left out of the top speed filter, and "1,234" style thousands are cleaned up
+    "top_speed_kmh": "CASE WHEN car.max_speed_km_per_h NOT LIKE '%km/h%' "
+                     "THEN CAST(REPLACE(car.max_speed_km_per_h, ',', '') AS REAL) END",
+    "bore_stroke_ratio": "CASE WHEN car.cylinder_bore_mm = car.stroke_cycle_mm THEN 1.0 "
+                         "ELSE 1.0 * car.cylinder_bore_mm / NULLIF(car.stroke_cycle_mm, 0) END",
+    "power_to_weight": "car.engine_hp / NULLIF(car.curb_weight_kg, 0)",
+    }
+
+
+# File with the canonical values of the categorical columns (the ones the checkboxes choose from),
+#   each with the raw spellings found in the database, such as "petrol" or "Gas" for "Gasoline"
+CATEGORICAL_VALUES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "categorical_values.json")
+
+# Loaded on first use, keyed by column, then by canonical value
+categorical_values = None
+
+
+# Returns the canonical values and synonyms of every categorical column, as defined in the data file
+def get_categorical_values():
+    global categorical_values
+    if categorical_values is None:
+        with open(CATEGORICAL_VALUES_PATH, "r") as file:
+            categorical_values = json.load(file)
+    return categorical_values
+
+
+# Returns the name of the dictionary table that maps the raw values of the categorical columns to integer codes
+def get_enum_dictionary_name(table_name):
+    return f"{table_name}_enum_dictionary"
+
+
+# Returns the name of the derived column holding the integer code of a categorical column
+def get_enum_code_column(column_name):
+    return f"{column_name}_code"
+
+
+# Returns the code of a canonical value, which is its position in the data file starting from 1
+# Raw values that are not listed in the data file get the code 0, so no checkbox ever selects them
+def get_enum_code(column_name, canonical_value):
+    return list(get_categorical_values()[column_name]).index(canonical_value) + 1
+
+
+# Returns the condition on the derived table (and its parameters) that keeps only the chosen canonical values
+def get_enum_code_condition(column_name, chosen_values):
+    codes = [get_enum_code(column_name, value) for value in chosen_values]
+    return f"{get_enum_code_column(column_name)} IN ({', '.join(['?'] * len(codes))})", codes
+
+
+# Returns every raw spelling of the chosen canonical values, used when the derived table is not available
+def get_categorical_synonyms(column_name, chosen_values):
+    return [raw_value for value in chosen_values for raw_value in get_categorical_values()[column_name][value]]
+
+
+# Returns a short text that changes whenever the layout of the derived table, the body categories or the categorical values change
+# It is stored in the catalog, so editing the categories in the code (or the data file) rebuilds the derived table
+def get_derived_table_signature(categories):
+    return json.dumps({"version": DERIVED_TABLE_VERSION, "body_categories": categories,
+                       "categorical_values": get_categorical_values()}, sort_keys=True)
+
+
+# Returns the smallest and biggest seat count of a number_of_seats value, which can list several layouts such as "5, 7"
+def parse_seat_range(number_of_seats):
+    if number_of_seats is None:
+        return None, None
+    seat_counts = [int(part.strip()) for part in str(number_of_seats).split(',') if part.strip().isdigit()]
+    if not seat_counts:
+        return None, None
+    return min(seat_counts), max(seat_counts)
+
+
+# Builds the enum dictionary table, with one row per distinct raw value of every categorical column
+# Raw values missing from the data file are kept too (with the code 0), so they are easy to find and add
+def build_enum_dictionary(cursor, table_name):
+    enum_dictionary_name = get_enum_dictionary_name(table_name)
+    cursor.execute(f"DROP TABLE IF EXISTS {enum_dictionary_name}")
+    cursor.execute(f"CREATE TABLE {enum_dictionary_name} (column_name TEXT, raw_value TEXT, code INTEGER, "
+                   f"canonical_value TEXT, PRIMARY KEY (column_name, raw_value))")
+    for column_name, values in get_categorical_values().items():
+        raw_value_codes = {}
+        for code, (canonical_value, raw_values) in enumerate(values.items(), start=1):
+            for raw_value in raw_values:
+                raw_value_codes[raw_value] = (code, canonical_value)
+        cursor.execute(f"SELECT DISTINCT {column_name} FROM {table_name} WHERE {column_name} IS NOT NULL")
+        cursor.executemany(f"INSERT OR IGNORE INTO {enum_dictionary_name} VALUES (?, ?, ?, ?)",
+                           [(column_name, row[0], *raw_value_codes.get(row[0], (0, None))) for row in cursor.fetchall()])
+
+
+# Builds the derived table, with the body category, the numeric shadow columns and the categorical codes of every car
+# Text values that need Python to be worked out (series names, seat lists, synonyms) are only processed once per distinct value,
+#   as there are a lot fewer of them than cars, then every car is filled in with a single INSERT ... SELECT
+def build_derived_table(database_path, table_name, categories):
+    derived_table_name = get_derived_table_name(table_name)
+    enum_dictionary_name = get_enum_dictionary_name(table_name)
+    with keep_catalog_valid(database_path) as catalog:
+        connection = sqlite3.connect(database_path)
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"SELECT DISTINCT series FROM {table_name}")
+            series_categories = [(row[0], categorize_model(row[0], categories)) for row in cursor.fetchall()]
+            cursor.execute("CREATE TEMP TABLE series_categories (series TEXT PRIMARY KEY, body_category TEXT)")
+            cursor.executemany("INSERT OR IGNORE INTO series_categories VALUES (?, ?)", series_categories)
+
+            cursor.execute(f"SELECT DISTINCT number_of_seats FROM {table_name}")
+            seat_ranges = [(row[0], *parse_seat_range(row[0])) for row in cursor.fetchall()]
+            cursor.execute("CREATE TEMP TABLE seat_ranges (number_of_seats PRIMARY KEY, seats_min INTEGER, seats_max INTEGER)")
+            cursor.executemany("INSERT OR IGNORE INTO seat_ranges VALUES (?, ?, ?)", seat_ranges)
+
+            build_enum_dictionary(cursor, table_name)
+            code_columns = [get_enum_code_column(column_name) for column_name in get_categorical_values()]
+            code_expressions = [f"{column_name}_dictionary.code" for column_name in get_categorical_values()]
+            code_joins = [f"LEFT JOIN {enum_dictionary_name} AS {column_name}_dictionary "
+                          f"ON {column_name}_dictionary.column_name = '{column_name}' AND {column_name}_dictionary.raw_value = car.{column_name}"
+                          for column_name in get_categorical_values()]
+
+            shadow_columns = ", ".join([*NUMERIC_SHADOW_COLUMNS, *code_columns])
+            shadow_expressions = ", ".join([*NUMERIC_SHADOW_COLUMNS.values(), *code_expressions])
+            cursor.execute(f"DROP TABLE IF EXISTS {derived_table_name}")
+            cursor.execute(f"CREATE TABLE {derived_table_name} (car_id INTEGER PRIMARY KEY, body_category TEXT, "
+                           f"seats_min INTEGER, seats_max INTEGER, {' REAL, '.join(NUMERIC_SHADOW_COLUMNS)} REAL, "
+                           f"{' INTEGER, '.join(code_columns)} INTEGER)")
+            cursor.execute(f"INSERT INTO {derived_table_name} (car_id, body_category, seats_min, seats_max, {shadow_columns}) "
+                           f"SELECT car.rowid, series_categories.body_category, seat_ranges.seats_min, seat_ranges.seats_max, "
+                           f"{shadow_expressions} FROM {table_name} AS car "
+                           f"LEFT JOIN series_categories ON series_categories.series = car.series "
+                           f"LEFT JOIN seat_ranges ON seat_ranges.number_of_seats = car.number_of_seats "
+                           f"{' '.join(code_joins)}")
+
+            # Every SQLite index also holds the car_id (the rowid), so these lookups never read the derived table itself
+            for column in ["body_category", "seats_min", "seats_max", *NUMERIC_SHADOW_COLUMNS, *code_columns]:
+                cursor.execute(f"CREATE INDEX {derived_table_name}_{column} ON {derived_table_name} ({column})")
+            cursor.execute("DROP TABLE series_categories")
+            cursor.execute("DROP TABLE seat_ranges")
+            connection.commit()
+        finally:
+            connection.close()
+
+        table_catalog = catalog["tables"].setdefault(table_name, {})
+        table_catalog["derived_table"] = get_derived_table_signature(categories)
+
+
+# Makes sure the derived table exists and matches the current database and categories
+# Returns True if the table can be used, False if it could not be built (for example when the database is read-only)
+def ensure_derived_table(database_path, table_name, categories):
+    try:
+        table_catalog = get_table_catalog(database_path, table_name)
+        if table_catalog.get("derived_table") == get_derived_table_signature(categories):
+            return True
+        with trace_span("build derived table"):
+            build_derived_table(database_path, table_name, categories)
+        return True
+    except sqlite3.Error as e:
+        print("Could not build the derived table:", e)
+        return False
+
+
+# Wraps a condition on the derived table so it can be used in a query on the car table
+# The condition is answered from the indexes of the derived table, the cars are then fetched by rowid
+def get_derived_condition(table_name, derived_condition):
+    return f"rowid IN (SELECT car_id FROM {get_derived_table_name(table_name)} WHERE {derived_condition})"
+
+
+# Returns the SQL condition (and its parameters) that keeps only the cars of the chosen body categories
+def get_body_category_condition(table_name, chosen_categories):
+    placeholders = ', '.join(['?'] * len(chosen_categories))
+    return get_derived_condition(table_name, f"body_category IN ({placeholders})"), list(chosen_categories)
+
+
+# Returns the raw values of the categorical columns that are not listed in the data file, as (column, raw value, car count)
+def get_unmapped_categorical_values(database_path, table_name):
+    if not ensure_derived_table(database_path, table_name, car_body_categories):
+        return []
+    connection_pool = get_connection_pool(database_path)
+    unmapped_values = []
+    for column_name in get_categorical_values():
+        cursor = connection_pool.execute(
+            f"SELECT car.{column_name}, COUNT(*) FROM {table_name} AS car "
+            f"JOIN {get_derived_table_name(table_name)} AS derived ON derived.car_id = car.rowid "
+            f"WHERE derived.{get_enum_code_column(column_name)} = 0 GROUP BY car.{column_name} ORDER BY COUNT(*) DESC")
+        unmapped_values.extend((column_name, raw_value, car_count) for raw_value, car_count in cursor.fetchall())
+    return unmapped_values
+
+
+# Returns the query plan of a query as a list of lines, as shown by EXPLAIN QUERY PLAN
+def get_query_plan(cursor, query, parameters):
+    cursor.execute(f"EXPLAIN QUERY PLAN {query}", parameters)
+    return [row[-1] for row in cursor.fetchall()]
+
+
+# Compares the old body type filter (categorizing every series, then "series IN (...)" with all the names)
+#   with the derived table filter, for every body category, printing the query plans and the timings
+def benchmark_body_category_filter(database_path, table_name, categories, repeats=3):
+    if not ensure_derived_table(database_path, table_name, categories):
+        return
+    cursor = get_connection_pool(database_path).cursor()
+
+    for category in categories:
+        old_times = []
+        new_times = []
+        for _ in range(repeats):
+            # Old path, the categorizing is part of the cost as it ran on every search
+            start_time = time.perf_counter()
+            cursor.execute(f"SELECT DISTINCT series FROM {table_name}")
+            series_names = [row[0] for row in cursor.fetchall() if categorize_model(row[0], categories) == category]
+            old_query = f"SELECT * FROM {table_name} WHERE series IN ({','.join(['?'] * len(series_names))})"
+            old_count = len(cursor.execute(old_query, series_names).fetchall())
+            old_times.append(time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            condition, parameters = get_body_category_condition(table_name, [category])
+            new_query = f"SELECT * FROM {table_name} WHERE {condition}"
+            new_count = len(cursor.execute(new_query, parameters).fetchall())
+            new_times.append(time.perf_counter() - start_time)
+
+        print(f"{category}: {old_count} cars (old) / {new_count} cars (new), "
+              f"{len(series_names)} bound series names replaced by 1 parameter")
+        print(f"  old: {min(old_times) * 1000:.1f} ms, plan: {' | '.join(get_query_plan(cursor, old_query, series_names))}")
+        print(f"  new: {min(new_times) * 1000:.1f} ms, plan: {' | '.join(get_query_plan(cursor, new_query, parameters))}")
+    cursor.close()
+
+
+# Maintenance command, for example:
+#   python derived_tables.py build car_database.db
+#   python derived_tables.py benchmark car_database.db
+#   python derived_tables.py unmapped car_database.db (lists the raw values to add to categorical_values.json)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds or benchmarks the derived tables of the car database")
+    parser.add_argument("command", choices=["build", "benchmark", "unmapped"])
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("--table", default="car_db_metric")
+    arguments = parser.parse_args()
+
+    if arguments.command == "build":
+        build_derived_table(arguments.database_path, arguments.table, car_body_categories)
+    elif arguments.command == "benchmark":
+        benchmark_body_category_filter(arguments.database_path, arguments.table, car_body_categories)
+    elif arguments.command == "unmapped":
+        for column_name, raw_value, car_count in get_unmapped_categorical_values(arguments.database_path, arguments.table):
+            print(f"{column_name}: {raw_value!r} ({car_count} cars)")
@@ -0,0 +1,64 @@
+import argparse
+import sqlite3
+import time
+
+from batch_search import read_batch_row_ids
+from columnar_engine import get_columnar_engine, set_columnar_engine_enabled
+from search_spec import CHECKBOX_GROUPS
+
+
+# Facet counts: for the current search, the number of cars every checkbox would find if it was the only one checked in its group
+# They are shown next to the checkboxes of the advanced, country of origin and engine layout pages
+# The columnar engine counts every group with a bincount over one mask; SQLite counts all the checkboxes in one pass (batch_search)
+
+
+# Returns {checkbox group: {value: number of cars}} for a search
+# Raises sqlite3.Error if the database cannot be searched
+def get_facet_counts(database_path, table_name, search_spec):
+    columnar_engine = get_columnar_engine(database_path, table_name)
+    if columnar_engine is not None:
+        return columnar_engine.get_facet_counts(search_spec)
+    return read_facet_counts(database_path, table_name, search_spec)
+
+
+# Counts the checkboxes in SQLite: every checkbox is the search with only that checkbox checked in its group,
+#   and all of them are read in a single pass over the table
+def read_facet_counts(database_path, table_name, search_spec):
+    checkbox_specs = [(group_name, value, search_spec.replace(**{group_name: [value]}))
+                      for group_name, checkboxes in CHECKBOX_GROUPS.items() for _, value in checkboxes]
+    batch_row_ids = read_batch_row_ids(database_path, table_name, [checkbox_spec for _, _, checkbox_spec in checkbox_specs])
+    facet_counts = {group_name: {} for group_name in CHECKBOX_GROUPS}
+    for (group_name, value, _), row_ids in zip(checkbox_specs, batch_row_ids):
+        facet_counts[group_name][value] = len(row_ids)
+    return facet_counts
+
+
+# Maintenance command, for example:
+#   python facets.py car_database.db --brand Toyota --engine-hp 150 400
+if __name__ == "__main__":
+    from car_search import add_search_arguments, get_search_spec_from_arguments
+
+    parser = argparse.ArgumentParser(description="Shows the number of cars of every checkbox for a search, and the time to count them")
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("--table", default="car_db_metric")
+    parser.add_argument("--sqlite", action="store_true", help="count in SQLite instead of the columnar engine")
+    add_search_arguments(parser)
+    arguments = parser.parse_args()
+    try:
+        search_spec = get_search_spec_from_arguments(arguments)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    set_columnar_engine_enabled(not arguments.sqlite)
+    try:
+        # The first count also loads the snapshot and the slider ranges
+        get_facet_counts(arguments.database_path, arguments.table, search_spec)
+        start_time = time.perf_counter()
+        facet_counts = get_facet_counts(arguments.database_path, arguments.table, search_spec)
+        count_time = time.perf_counter() - start_time
+    except sqlite3.Error as e:
+        print("An error occurred while counting:", e)
+        raise SystemExit(1)
+    for group_name, value_counts in facet_counts.items():
+        print(f"{group_name}: " + ", ".join(f"{value} ({count})" for value, count in value_counts.items()))
+    print(f"Counted in {count_time * 1000:.2f} ms")
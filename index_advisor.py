@@ -0,0 +1,285 @@
+import argparse
+import json
+import random
+import sqlite3
+import time
+
+from connection_pool import get_connection_pool
+from statistics_catalog import keep_catalog_valid
+
+
+# Maintenance command to add secondary indexes to the car table and to check which ones actually help the searches
+# It replays a corpus of generated filter combinations (the same kind of conditions search_by_model builds),
+#   looks at the query plan of each one and measures the latency, for every candidate set of indexes
+
+# Candidate sets of indexes, each index is a list of columns
+# "single" has one index per filter, "composite" groups the filters that are usually used together,
+#   and "covering" adds indexes that answer the brand/model lookups without reading the table at all
+INDEX_SETS = {
+    "none": [],
+    "single": [
+        ["make"], ["model"], ["year_from"], ["year_to"], ["engine_hp"], ["curb_weight_kg"], ["capacity_cm3"],
+        ["engine_type"], ["drive_wheels"], ["transmission"], ["country_of_origin"], ["number_of_cylinders"],
+        ["cylinder_layout"],
+        ],
+    "composite": [
+        ["make", "model", "year_from"],
+        ["engine_hp", "curb_weight_kg"],
+        ["capacity_cm3", "number_of_cylinders"],
+        ["country_of_origin", "engine_type"],
+        ["drive_wheels", "transmission"],
+        ["cylinder_layout", "number_of_cylinders"],
+        ],
+    "covering": [
+        ["make", "model"],
+        ["make", "website"],
+        ["engine_hp", "curb_weight_kg", "year_from", "year_to"],
+        ["country_of_origin", "number_of_cylinders", "cylinder_layout"],
+        ],
+    }
+
+# The filters of search_by_model, with the SQL they turn into
+# Range filters use the same conditions as search_by_model, the lists are filled in from the values in the database
+RANGE_FILTERS = {
+    "year_from": "year_from >= ? AND year_from != 0.0",
+    "year_to": "year_to <= ? AND year_to != 0.0",
+    "engine_hp_min": "engine_hp >= ?",
+    "engine_hp_max": "engine_hp <= ?",
+    "curb_weight_kg_min": "curb_weight_kg >= ?",
+    "curb_weight_kg_max": "curb_weight_kg <= ?",
+    "capacity_cm3_min": "capacity_cm3 >= ?",
+    "capacity_cm3_max": "capacity_cm3 <= ?",
+    }
+LIST_FILTERS = ["engine_type", "drive_wheels", "transmission", "country_of_origin", "number_of_cylinders", "cylinder_layout"]
+
+
+# Returns the name used for an index, for example car_db_metric_make_model
+def get_index_name(table_name, columns):
+    return f"{table_name}_{'_'.join(columns)}"
+
+
+# Returns the size of the data in the database in bytes, according to SQLite
+# Free pages (left behind by dropped indexes) are not counted, as new indexes reuse them first
+def get_database_size(cursor):
+    page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+    freelist_count = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+    page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+    return (page_count - freelist_count) * page_size
+
+
+# Creates the indexes of a set, and runs ANALYZE so the query planner knows how selective they are
+def create_index_set(database_path, table_name, index_set_name):
+    with keep_catalog_valid(database_path):
+        connection = sqlite3.connect(database_path)
+        try:
+            for columns in INDEX_SETS[index_set_name]:
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {get_index_name(table_name, columns)} "
+                                   f"ON {table_name} ({', '.join(columns)})")
+            connection.execute("ANALYZE")
+            connection.commit()
+        finally:
+            connection.close()
+
+
+# Drops the indexes of a set, except the ones in kept_index_names (the database file keeps its size until it is vacuumed)
+def drop_index_set(database_path, table_name, index_set_name, kept_index_names=()):
+    with keep_catalog_valid(database_path):
+        connection = sqlite3.connect(database_path)
+        try:
+            for columns in INDEX_SETS[index_set_name]:
+                index_name = get_index_name(table_name, columns)
+                if index_name not in kept_index_names:
+                    connection.execute(f"DROP INDEX IF EXISTS {index_name}")
+            connection.commit()
+        finally:
+            connection.close()
+
+
+# Returns the names of the indexes of the database, and the statistics tables ANALYZE writes (sqlite_stat1, ...) with their rows
+def read_index_state(database_path):
+    connection_pool = get_connection_pool(database_path)
+    index_names = {row[0] for row in connection_pool.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()}
+    statistics_tables = {}
+    for (statistics_table,) in connection_pool.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'sqlite_stat%'").fetchall():
+        statistics_tables[statistics_table] = connection_pool.execute(f"SELECT * FROM {statistics_table}").fetchall()
+    return index_names, statistics_tables
+
+
+# Puts the statistics tables back the way read_index_state found them, dropping the ones that did not exist yet
+def restore_statistics_tables(database_path, statistics_tables):
+    with keep_catalog_valid(database_path):
+        connection = sqlite3.connect(database_path)
+        try:
+            for (statistics_table,) in connection.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'sqlite_stat%'").fetchall():
+                if statistics_table not in statistics_tables:
+                    connection.execute(f"DROP TABLE {statistics_table}")
+                    continue
+                connection.execute(f"DELETE FROM {statistics_table}")
+                rows = statistics_tables[statistics_table]
+                if rows:
+                    connection.executemany(f"INSERT INTO {statistics_table} VALUES ({', '.join(['?'] * len(rows[0]))})", rows)
+            connection.commit()
+        finally:
+            connection.close()
+
+
+# Generates a corpus of searches, each one a list of filters with their SQL condition and parameters
+# The same seed always gives the same corpus, so runs before and after a change can be compared
+def generate_query_corpus(database_path, table_name, query_count=200, seed=0):
+    connection_pool = get_connection_pool(database_path)
+    random_generator = random.Random(seed)
+
+    makes = [row[0] for row in connection_pool.execute(
+        f"SELECT DISTINCT make FROM {table_name} WHERE make IS NOT NULL ORDER BY make").fetchall()]
+    list_values = {}
+    for column in LIST_FILTERS:
+        list_values[column] = [row[0] for row in connection_pool.execute(
+            f"SELECT DISTINCT {column} FROM {table_name} WHERE {column} IS NOT NULL ORDER BY {column}").fetchall()]
+    range_values = {
+        "year_from": (1950, 2020), "year_to": (1950, 2020),
+        "engine_hp_min": (50, 500), "engine_hp_max": (100, 1000),
+        "curb_weight_kg_min": (600, 2000), "curb_weight_kg_max": (1000, 3000),
+        "capacity_cm3_min": (600, 4000), "capacity_cm3_max": (1000, 8000),
+        }
+
+    corpus = []
+    for _ in range(query_count):
+        filters = []
+        if makes and random_generator.random() < 0.3:
+            filters.append({"name": "make", "condition": "make = ?", "parameters": [random_generator.choice(makes)]})
+        for filter_name in random_generator.sample(list(RANGE_FILTERS), random_generator.randint(0, 3)):
+            low, high = range_values[filter_name]
+            filters.append({"name": filter_name, "condition": RANGE_FILTERS[filter_name],
+                            "parameters": [random_generator.randint(low, high)]})
+        for column in random_generator.sample(LIST_FILTERS, random_generator.randint(0, 2)):
+            if not list_values[column]:
+                continue
+            chosen_values = random_generator.sample(list_values[column], min(len(list_values[column]), random_generator.randint(1, 3)))
+            filters.append({"name": column, "condition": f"{column} IN ({', '.join(['?'] * len(chosen_values))})",
+                            "parameters": chosen_values})
+        corpus.append(filters)
+    return corpus
+
+
+# Returns the SQL query and the parameters of one search of the corpus
+def build_corpus_query(table_name, filters):
+    if not filters:
+        return f"SELECT * FROM {table_name}", []
+    where_clause = " AND ".join(f"({search_filter['condition']})" for search_filter in filters)
+    parameters = [parameter for search_filter in filters for parameter in search_filter["parameters"]]
+    return f"SELECT * FROM {table_name} WHERE {where_clause}", parameters
+
+
+# Returns the value below which the given fraction of the values fall (0.5 is the median)
+def get_percentile(values, fraction):
+    if not values:
+        return 0.0
+    sorted_values = sorted(values)
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+# Replays the corpus against the database as it is now
+# Returns the latencies, and for every filter how many of the searches using it still scanned the whole table
+def replay_corpus(database_path, table_name, corpus):
+    connection_pool = get_connection_pool(database_path)
+    latencies = []
+    filter_uses = {}
+    filter_full_scans = {}
+    for filters in corpus:
+        query, parameters = build_corpus_query(table_name, filters)
+        plan = [row[-1] for row in connection_pool.execute(f"EXPLAIN QUERY PLAN {query}", parameters).fetchall()]
+        full_scan = any(line.startswith(f"SCAN {table_name}") for line in plan)
+
+        start_time = time.perf_counter()
+        connection_pool.execute(query, parameters).fetchall()
+        latencies.append(time.perf_counter() - start_time)
+
+        for search_filter in filters:
+            filter_uses[search_filter["name"]] = filter_uses.get(search_filter["name"], 0) + 1
+            if full_scan:
+                filter_full_scans[search_filter["name"]] = filter_full_scans.get(search_filter["name"], 0) + 1
+
+    return {
+        "p50_ms": round(get_percentile(latencies, 0.5) * 1000, 3),
+        "p95_ms": round(get_percentile(latencies, 0.95) * 1000, 3),
+        "full_scan_share": {name: round(filter_full_scans.get(name, 0) / uses, 3) for name, uses in sorted(filter_uses.items())},
+        }
+
+
+# Tries every candidate index set on the corpus and returns one report entry per set
+# Each set is created, measured and dropped again, so the database ends up the way it started: the indexes that were already
+#   there (such as the ones of the create command) are kept, and the statistics ANALYZE wrote are put back as they were
+def advise_index_sets(database_path, table_name, corpus, index_set_names=None):
+    existing_index_names, statistics_tables = read_index_state(database_path)
+    report = []
+    try:
+        for index_set_name in index_set_names or list(INDEX_SETS):
+            with get_connection_pool(database_path).open_cursor() as cursor:
+                size_before = get_database_size(cursor)
+            create_index_set(database_path, table_name, index_set_name)
+            try:
+                with get_connection_pool(database_path).open_cursor() as cursor:
+                    size_after = get_database_size(cursor)
+                result = replay_corpus(database_path, table_name, corpus)
+            finally:
+                drop_index_set(database_path, table_name, index_set_name, existing_index_names)
+            result["index_set"] = index_set_name
+            result["size_growth_mb"] = round((size_after - size_before) / 1024 / 1024, 2)
+            report.append(result)
+    finally:
+        restore_statistics_tables(database_path, statistics_tables)
+    return sorted(report, key=lambda entry: (entry["p95_ms"], entry["size_growth_mb"]))
+
+
+# Prints a report made by advise_index_sets, the best set (lowest p95 latency) comes first
+def print_index_report(report):
+    for entry in report:
+        print(f"{entry['index_set']}: p50 {entry['p50_ms']} ms, p95 {entry['p95_ms']} ms, +{entry['size_growth_mb']} MB")
+        still_scanning = [name for name, share in entry["full_scan_share"].items() if share > 0]
+        if still_scanning:
+            print("  still full scans with:", ", ".join(f"{name} ({entry['full_scan_share'][name]:.0%})" for name in still_scanning))
+
+
+# Maintenance command, for example:
+#   python index_advisor.py advise car_database.db --corpus corpus.json
+#   python index_advisor.py create car_database.db --index-set composite
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Creates secondary indexes on the car table and compares index sets")
+    parser.add_argument("command", choices=["advise", "create", "drop"])
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("--table", default="car_db_metric")
+    parser.add_argument("--index-set", choices=list(INDEX_SETS), action="append",
+                        help="index set to create/drop, or to compare (can be given more than once, default: all)")
+    parser.add_argument("--corpus", help="JSON file with the searches to replay, generated (and saved) if it does not exist")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", help="JSON file to write the report to")
+    arguments = parser.parse_args()
+
+    if arguments.command == "create":
+        for name in arguments.index_set or []:
+            create_index_set(arguments.database_path, arguments.table, name)
+    elif arguments.command == "drop":
+        for name in arguments.index_set or []:
+            drop_index_set(arguments.database_path, arguments.table, name)
+    else:
+        corpus = None
+        if arguments.corpus:
+            try:
+                with open(arguments.corpus, "r") as corpus_file:
+                    corpus = json.load(corpus_file)
+            except OSError:
+                pass
+        if corpus is None:
+            corpus = generate_query_corpus(arguments.database_path, arguments.table, arguments.queries, arguments.seed)
+            if arguments.corpus:
+                with open(arguments.corpus, "w") as corpus_file:
+                    json.dump(corpus, corpus_file)
+
+        report = advise_index_sets(arguments.database_path, arguments.table, corpus, arguments.index_set)
+        print_index_report(report)
+        if arguments.report:
+            with open(arguments.report, "w") as report_file:
+                json.dump(report, report_file, indent=2)
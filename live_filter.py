@@ -0,0 +1,150 @@
+import argparse
+import time
+from array import array
+
+from car_search import find_matching_row_ids
+from columnar_engine import get_columnar_engine, set_columnar_engine_enabled
+from connection_pool import get_connection_pool, get_database_fingerprint
+from result_cache import FETCH_CHUNK_SIZE, clear_result_caches, get_result_cache
+from search_spec import RANGE_ARGUMENTS, compile_search_spec
+from statistics_catalog import get_column_range
+
+
+# Live results: the advanced page searches again whenever a slider or checkbox changes (after a short pause)
+# Most changes only narrow the previous search (a slider moved inwards, a checkbox unchecked), so the cars it found are kept
+#   and only they are filtered again, instead of searching the whole table
+# Any other change (a slider moved outwards, a new brand, ...) runs a normal search, which becomes the new starting point
+
+# Most cars of a previous search refined in SQLite (a single query, each car being a rowid lookup), bigger searches are run again
+MAX_SQLITE_REFINE_CARS = FETCH_CHUNK_SIZE
+# Largest share of the table refined by the columnar engine: comparing a whole column is faster than gathering
+#   the values of most of the cars, so bigger searches reuse the masks of the filters that did not change instead
+MAX_COLUMNAR_REFINE_SHARE = 0.1
+
+
+class LiveFilter:
+    def __init__(self, database_path, table_name):
+        self.database_path = database_path
+        self.table_name = table_name
+        # Previous search and the rowids of its cars
+        self.search_spec = None
+        self.row_ids = None
+        # The engine (or, without it, the database file) the previous cars were found in, they are dropped when it changes
+        self.columnar_engine = None
+        self.fingerprint = None
+        # Number of searches answered by refining the previous cars, and by a full search
+        self.counters = {"refined": 0, "searched": 0}
+
+    # Returns the rowids of the cars matching a search, in rowid order, refining the previous search when possible
+    # Raises sqlite3.Error if the database cannot be searched
+    def update(self, search_spec):
+        columnar_engine = get_columnar_engine(self.database_path, self.table_name)
+        fingerprint = get_database_fingerprint(self.database_path)
+        result_cache = get_result_cache(self.database_path)
+        row_ids = result_cache.get((self.table_name, search_spec))
+        if row_ids is None:
+            can_refine = (self.search_spec is not None and columnar_engine is self.columnar_engine and fingerprint == self.fingerprint
+                          and search_spec.is_narrower_than(self.search_spec))
+            if can_refine and columnar_engine is not None and len(self.row_ids) <= columnar_engine.row_count * MAX_COLUMNAR_REFINE_SHARE:
+                # Only the filters that changed are applied, the previous cars already pass the others
+                skipped_filter_keys = {filter_key for filter_key, _ in columnar_engine.get_filters(self.search_spec)}
+                positions = columnar_engine.get_matching_positions(search_spec, columnar_engine.get_positions(self.row_ids),
+                                                                   skipped_filter_keys)
+                row_ids = columnar_engine.row_ids[positions]
+                self.counters["refined"] += 1
+            elif can_refine and len(self.row_ids) <= MAX_SQLITE_REFINE_CARS:
+                row_ids = read_matching_row_ids_among(self.database_path, self.table_name, search_spec, self.row_ids)
+                self.counters["refined"] += 1
+            elif columnar_engine is not None:
+                # Only the filter of the slider that moved is compared again, the masks of the others are kept by the engine
+                row_ids = columnar_engine.get_matching_row_ids_from_cached_masks(search_spec)
+                self.counters["searched"] += 1
+            else:
+                row_ids = find_matching_row_ids(self.database_path, self.table_name, search_spec)
+                self.counters["searched"] += 1
+            result_cache.put((self.table_name, search_spec), row_ids)
+
+        self.search_spec = search_spec
+        self.row_ids = row_ids
+        self.columnar_engine = columnar_engine
+        self.fingerprint = fingerprint
+        return row_ids
+
+
+# Returns the rowids of the cars matching a search among the given cars, in rowid order, a chunk of cars at a time
+def read_matching_row_ids_among(database_path, table_name, search_spec, candidate_row_ids):
+    where_clause, paramaters = compile_search_spec(database_path, table_name, search_spec)
+    connection_pool = get_connection_pool(database_path)
+    row_ids = array("q")
+    with connection_pool.open_cursor() as cursor:
+        for start in range(0, len(candidate_row_ids), FETCH_CHUNK_SIZE):
+            chunk = [int(row_id) for row_id in candidate_row_ids[start:start + FETCH_CHUNK_SIZE]]
+            search_query = f"SELECT rowid FROM {table_name} WHERE rowid IN ({', '.join(['?'] * len(chunk))})"
+            if where_clause:
+                search_query += f" AND ({where_clause})"
+            connection_pool.execute(f"{search_query} ORDER BY rowid", (*chunk, *paramaters), cursor=cursor)
+            row_ids.extend(row[0] for row in cursor.fetchall())
+    return row_ids
+
+
+# Returns the searches of a slider dragged from one end of its range to the other, a step at a time:
+#   the minimum moves up, then the maximum moves down (every search narrows the previous one)
+# The other filters of the search stay as in base_search_spec
+def get_slider_drag_specs(database_path, table_name, range_name, step_count, base_search_spec):
+    low = get_column_range(database_path, table_name, range_name, "min")
+    high = get_column_range(database_path, table_name, range_name, "max")
+    middle = (low + high) / 2
+    steps = [round(low + (middle - low) * step / step_count) for step in range(step_count + 1)]
+    return ([base_search_spec.replace(**{range_name: (minimum, high)}) for minimum in steps] +
+            [base_search_spec.replace(**{range_name: (steps[-1], high - (high - middle) * step / step_count)})
+             for step in range(1, step_count + 1)])
+
+
+# Times the searches while a slider is dragged, with the live results and with a new search every time
+# The result cache is emptied before every step, as the GUI would never see the same search twice while dragging
+def benchmark_live_filter(database_path, table_name, range_name, step_count, base_search_spec):
+    search_specs = get_slider_drag_specs(database_path, table_name, range_name, step_count, base_search_spec)
+    for engine_name, enabled in [("columnar", True), ("SQLite", False)]:
+        set_columnar_engine_enabled(enabled)
+        if enabled and get_columnar_engine(database_path, table_name) is None:
+            print("The columnar engine is not available (is NumPy installed?)")
+            continue
+        # Warms up the snapshot, the statistics and the connection
+        find_matching_row_ids(database_path, table_name, search_specs[0])
+        live_filter = LiveFilter(database_path, table_name)
+        for mode, search in [("new search", lambda search_spec: find_matching_row_ids(database_path, table_name, search_spec)),
+                             ("live results", live_filter.update)]:
+            times = []
+            for search_spec in search_specs:
+                clear_result_caches()
+                start_time = time.perf_counter()
+                row_ids = search(search_spec)
+                times.append(time.perf_counter() - start_time)
+                clear_result_caches()
+                if list(row_ids) != list(find_matching_row_ids(database_path, table_name, search_spec)):
+                    print("Different results for:", search_spec)
+            times.sort()
+            print(f"{engine_name} {mode}: {len(times)} updates, p50 {times[len(times) // 2] * 1000:.2f} ms, "
+                  f"p95 {times[min(len(times) - 1, int(len(times) * 0.95))] * 1000:.2f} ms, max {times[-1] * 1000:.2f} ms")
+        print(f"{engine_name}: {live_filter.counters['refined']} of {len(search_specs)} live results refined the previous cars")
+    set_columnar_engine_enabled(True)
+
+
+# Maintenance command, for example:
+#   python live_filter.py car_database.db --drag engine_hp --steps 50 --brand Toyota --engine-type Gasoline Hybrid
+if __name__ == "__main__":
+    from car_search import add_search_arguments, get_search_spec_from_arguments
+
+    parser = argparse.ArgumentParser(description="Benchmarks the live results while a slider of the advanced page is dragged")
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("--table", default="car_db_metric")
+    parser.add_argument("--drag", default="engine_hp", choices=list(RANGE_ARGUMENTS), help="slider to drag")
+    parser.add_argument("--steps", type=int, default=50)
+    add_search_arguments(parser)
+    arguments = parser.parse_args()
+    try:
+        search_spec = get_search_spec_from_arguments(arguments)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    benchmark_live_filter(arguments.database_path, arguments.table, arguments.drag, arguments.steps, search_spec)
@@ -0,0 +1,155 @@
+import argparse
+import bisect
+import sqlite3
+import time
+
+from columnar_snapshot import get_snapshot, read_brand_lists
+from connection_pool import get_database_fingerprint
+from trigram_index import TrigramIndex
+
+
+# In-memory index of the sorted models of every brand, used by the model dropdowns while the user types a brand
+# A lookup is a few dictionary and bisect operations, so it can run on every key press without touching the database
+# Partial brand input is matched too: first exactly, then ignoring case, then by prefix and finally by spelling (trigram_index)
+# Misspelled models are matched by spelling as well, among the models of the chosen brands or all of them
+
+# Number of brands a misspelled brand can match
+FUZZY_MATCH_COUNT = 3
+
+# Loaded indexes, keyed by (database path, table name)
+loaded_model_indexes = {}
+
+
+class ModelIndex:
+    def __init__(self, fingerprint, makes, models_by_make):
+        self.fingerprint = fingerprint
+        self.models_by_make = models_by_make
+        # Lowercase brand names, sorted so that all the brands starting with a prefix are next to each other
+        self.lowercase_makes = sorted({make.lower() for make in makes})
+        # Lowercase brand name to the brands with that name (brands differing only in case are merged)
+        self.makes_by_lowercase = {}
+        for make in makes:
+            self.makes_by_lowercase.setdefault(make.lower(), []).append(make)
+        # Trigram indexes of the brands and of every distinct model, built with the index (on the worker thread in the GUI)
+        #   so that a misspelled name is looked up in a few milliseconds
+        self.make_trigram_index = TrigramIndex(self.lowercase_makes)
+        self.model_trigram_index = TrigramIndex(sorted({model for models in models_by_make.values() for model in models}))
+
+    # Returns the brands matching a (partial) brand name
+    def get_matching_makes(self, brand):
+        if brand in self.models_by_make:
+            return [brand]
+        lowercase_brand = brand.lower()
+        if lowercase_brand in self.makes_by_lowercase:
+            return self.makes_by_lowercase[lowercase_brand]
+
+        start = bisect.bisect_left(self.lowercase_makes, lowercase_brand)
+        end = start
+        while end < len(self.lowercase_makes) and self.lowercase_makes[end].startswith(lowercase_brand):
+            end += 1
+        lowercase_matches = self.lowercase_makes[start:end]
+        if not lowercase_matches:
+            lowercase_matches = [lowercase_make for _, lowercase_make
+                                 in self.make_trigram_index.get_similar_names(lowercase_brand, FUZZY_MATCH_COUNT)]
+        return [make for lowercase_make in lowercase_matches for make in self.makes_by_lowercase[lowercase_make]]
+
+    # Returns the sorted models of the brands in a comma separated list of (partial) brand names
+    def get_models(self, brand_string):
+        brands = [brand.strip() for brand in brand_string.split(',') if brand.strip() != ""]
+        matching_makes = {make for brand in brands for make in self.get_matching_makes(brand)}
+        if len(matching_makes) == 1:
+            # The lists are already sorted, the common case of a single brand needs no sorting
+            return list(self.models_by_make[matching_makes.pop()])
+        return sorted({model for make in matching_makes for model in self.models_by_make[make]})
+
+    # Returns the brands to suggest for a comma separated list of (partial or misspelled) brand names, the best matches first
+    # Brands that are typed exactly are not suggested again, an empty list means every brand is spelled right
+    def get_suggested_makes(self, brand_string):
+        brands = [brand.strip() for brand in brand_string.split(',') if brand.strip() != ""]
+        return list(dict.fromkeys(make for brand in brands if brand not in self.models_by_make for make in self.get_matching_makes(brand)))
+
+    # Returns the models closest in spelling to a (misspelled) model name, the most similar first
+    # With brands (a comma separated list of brand names), only their models are suggested
+    def get_similar_models(self, model, brand_string=""):
+        allowed_models = set(self.get_models(brand_string)) if brand_string.strip() != "" else None
+        return [similar_model for _, similar_model in self.model_trigram_index.get_similar_names(model, allowed_names=allowed_models)]
+
+    # Returns a search with its brand and model replaced by the closest real names, when they are not spelled like any car
+    # Also returns the replacements made, as (typed name, real name) pairs
+    def correct_search_spec(self, search_spec):
+        corrections = {}
+        if search_spec.brand is not None and search_spec.brand not in self.models_by_make:
+            matching_makes = self.get_matching_makes(search_spec.brand)
+            if matching_makes:
+                corrections["brand"] = matching_makes[0]
+        brand = corrections.get("brand", search_spec.brand) or ""
+        if search_spec.model is not None:
+            known_models = self.get_models(brand) if brand != "" else self.model_trigram_index.names
+            if search_spec.model not in known_models:
+                similar_models = self.get_similar_models(search_spec.model, brand)
+                if similar_models:
+                    corrections["model"] = similar_models[0]
+        return (search_spec.replace(**corrections),
+                [(getattr(search_spec, field_name), name) for field_name, name in corrections.items()])
+
+
+# Builds the index, from the snapshot if there is one, otherwise from the database
+def build_model_index(database_path, table_name):
+    snapshot = get_snapshot(database_path, table_name)
+    if snapshot is not None:
+        return ModelIndex(snapshot.fingerprint, snapshot.makes, snapshot.models_by_make)
+    fingerprint = get_database_fingerprint(database_path)
+    makes, models_by_make = read_brand_lists(database_path, table_name)
+    return ModelIndex(fingerprint, makes, models_by_make)
+
+
+# Returns the index of a table if it is loaded and matches the current database file, without ever building it
+# Used by the GUI to answer a key press straight away, None means the index has to be built first (see get_model_index)
+def get_loaded_model_index(database_path, table_name):
+    model_index = loaded_model_indexes.get((database_path, table_name))
+    if model_index is not None and model_index.fingerprint == get_database_fingerprint(database_path):
+        return model_index
+    return None
+
+
+# Returns the index of a table, building it if it is missing or the database file changed
+# Returns None if the brand lists cannot be read
+def get_model_index(database_path, table_name):
+    model_index = get_loaded_model_index(database_path, table_name)
+    if model_index is not None:
+        return model_index
+    try:
+        model_index = build_model_index(database_path, table_name)
+    except sqlite3.Error as e:
+        print("Could not build the model index:", e)
+        return None
+    loaded_model_indexes[(database_path, table_name)] = model_index
+    return model_index
+
+
+# Maintenance command, for example:
+#   python model_index.py car_database.db Toy (prints the models suggested while typing "Toy" and the time per key press)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Looks up the models suggested for a (partial) brand name")
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("brand", nargs="?", default="")
+    parser.add_argument("--table", default="car_db_metric")
+    parser.add_argument("--repeat", type=int, default=1000)
+    arguments = parser.parse_args()
+
+    start_time = time.perf_counter()
+    index = get_model_index(arguments.database_path, arguments.table)
+    if index is None:
+        raise SystemExit(1)
+    print(f"Loaded the index of {len(index.models_by_make)} brands in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+
+    # Every prefix of the brand, as typed one key at a time
+    prefixes = [arguments.brand[:length] for length in range(1, len(arguments.brand) + 1)] or [""]
+    start_time = time.perf_counter()
+    for _ in range(arguments.repeat):
+        for prefix in prefixes:
+            get_loaded_model_index(arguments.database_path, arguments.table).get_models(prefix)
+    lookup_time = (time.perf_counter() - start_time) / (arguments.repeat * len(prefixes))
+    models = index.get_models(arguments.brand)
+    print(f"{len(models)} models for {arguments.brand!r}, {lookup_time * 1_000_000:.1f} µs per key press")
+    print(", ".join(models[:20]) + (" ..." if len(models) > 20 else ""))
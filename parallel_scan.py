@@ -0,0 +1,153 @@
+import argparse
+import multiprocessing
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from connection_pool import get_connection_pool, get_database_fingerprint
+from result_cache import clear_result_caches, read_matching_row_ids
+from search_spec import compile_search_spec
+
+
+# Parallel SQLite search: the table is split into rowid ranges and each range is searched by its own worker process,
+#   with its own read-only connection, then the rowids are put back together in rowid order
+# Processes are used because a search that scans the table is mostly SQLite work on one connection,
+#   which a single process cannot spread over several cores
+# Only used when the columnar engine is not available, and only for tables big enough to be worth splitting
+
+# Number of worker processes used by the SQLite searches, 0 or 1 searches in the calling thread (set_parallel_scan_workers)
+parallel_scan_workers = 0
+# Tables with fewer rows than this are always searched in the calling thread, starting the workers would take longer
+PARALLEL_SCAN_MIN_ROWS = 50000
+# Number of rowid ranges given to each worker, more ranges even out ranges with more matching cars
+PARTITIONS_PER_WORKER = 4
+
+# Process pools, keyed by the number of workers, started on first use
+process_pools = {}
+
+
+# Sets the number of worker processes of the SQLite searches (0 or 1 turns the parallel search off)
+def set_parallel_scan_workers(worker_count):
+    global parallel_scan_workers
+    parallel_scan_workers = worker_count
+
+
+# Returns the process pool with the given number of workers, starting it on first use
+# The workers are started with "spawn", as an SQLite connection inherited through fork must not be used
+def get_process_pool(worker_count):
+    process_pool = process_pools.get(worker_count)
+    if process_pool is None:
+        process_pool = ProcessPoolExecutor(worker_count, mp_context=multiprocessing.get_context("spawn"))
+        process_pools[worker_count] = process_pool
+    return process_pool
+
+
+# Stops the worker processes of every pool
+def shutdown_process_pools():
+    for process_pool in process_pools.values():
+        process_pool.shutdown(cancel_futures=True)
+    process_pools.clear()
+
+
+# Returns the rowid ranges (first, last) splitting a table into about the given number of parts, or [] for an empty table
+def get_rowid_partitions(database_path, table_name, partition_count):
+    cursor = get_connection_pool(database_path).execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table_name}")
+    first_row_id, last_row_id = cursor.fetchone()
+    cursor.close()
+    if first_row_id is None:
+        return []
+    partition_size = max(1, -(-(last_row_id - first_row_id + 1) // partition_count))
+    return [(start, min(start + partition_size - 1, last_row_id)) for start in range(first_row_id, last_row_id + 1, partition_size)]
+
+
+# Runs in a worker process: returns the rowids (as the bytes of an array of 64 bit integers) of the matching cars of a rowid range
+# Each worker keeps its own pooled read-only connection, which is reopened when the database file changes
+def read_partition_row_ids(database_path, table_name, where_clause, paramaters, first_row_id, last_row_id):
+    search_query = f"SELECT rowid FROM {table_name} WHERE rowid BETWEEN ? AND ?"
+    if where_clause:
+        search_query += f" AND ({where_clause})"
+    cursor = get_connection_pool(database_path).execute(f"{search_query} ORDER BY rowid", (first_row_id, last_row_id, *paramaters))
+    row_ids = array("q", (row[0] for row in cursor.fetchall()))
+    cursor.close()
+    return row_ids.tobytes()
+
+
+# Returns the rowids of the cars matching a WHERE clause, in rowid order, searching the rowid ranges in the worker processes
+def read_matching_row_ids_in_parallel(database_path, table_name, where_clause, paramaters, worker_count):
+    partitions = get_rowid_partitions(database_path, table_name, worker_count * PARTITIONS_PER_WORKER)
+    process_pool = get_process_pool(worker_count)
+    futures = [process_pool.submit(read_partition_row_ids, os.path.abspath(database_path), table_name, where_clause, tuple(paramaters),
+                                   first_row_id, last_row_id)
+               for first_row_id, last_row_id in partitions]
+    # The ranges follow each other, so adding them in order keeps the rowids sorted
+    row_ids = array("q")
+    for future in futures:
+        row_ids.frombytes(future.result())
+    return row_ids
+
+
+# Returns True if the table is big enough for a parallel search with the current settings
+def should_scan_in_parallel(database_path, table_name):
+    if parallel_scan_workers <= 1:
+        return False
+    partitions = get_rowid_partitions(database_path, table_name, 1)
+    return bool(partitions) and partitions[0][1] - partitions[0][0] + 1 >= PARALLEL_SCAN_MIN_ROWS
+
+
+# Returns the rowids of the cars matching a WHERE clause in SQLite, in parallel when it is turned on and the table is big enough
+def read_matching_row_ids_with_workers(database_path, table_name, where_clause, paramaters):
+    if should_scan_in_parallel(database_path, table_name):
+        return read_matching_row_ids_in_parallel(database_path, table_name, where_clause, paramaters, parallel_scan_workers)
+    return read_matching_row_ids(database_path, table_name, where_clause, paramaters)
+
+
+# Checks that the parallel search returns the same rowids as the serial one, then times both with 1 to max_workers workers
+def benchmark_parallel_scan(database_path, table_name, search_count, max_workers, repeats=3):
+    # Only needed for the benchmark, so the worker processes do not import it (nor NumPy)
+    from columnar_engine import generate_search_parameters
+    from search_spec import get_search_spec
+
+    compiled_searches = [compile_search_spec(database_path, table_name, get_search_spec(parameters))
+                         for parameters in generate_search_parameters(database_path, table_name, search_count)]
+    # A search of every car with a filter that no index can answer, the case the parallel search is meant for
+    compiled_searches.append(("CAST(REPLACE(REPLACE(max_speed_km_per_h, ' km/h', ''), ',', '') AS REAL) > ?", (0,)))
+
+    def measure(search):
+        times = []
+        for _ in range(repeats):
+            clear_result_caches()
+            start_time = time.perf_counter()
+            for where_clause, paramaters in compiled_searches:
+                search(where_clause, paramaters)
+            times.append(time.perf_counter() - start_time)
+        return min(times)
+
+    serial_time = measure(lambda where_clause, paramaters: read_matching_row_ids(database_path, table_name, where_clause, paramaters))
+    print(f"Serial: {serial_time * 1000:.1f} ms for {len(compiled_searches)} searches")
+    for worker_count in range(1, max_workers + 1):
+        mismatches = 0
+        for where_clause, paramaters in compiled_searches:
+            serial_row_ids = read_matching_row_ids(database_path, table_name, where_clause, paramaters)
+            parallel_row_ids = read_matching_row_ids_in_parallel(database_path, table_name, where_clause, paramaters, worker_count)
+            mismatches += serial_row_ids != parallel_row_ids
+        parallel_time = measure(lambda where_clause, paramaters: read_matching_row_ids_in_parallel(
+            database_path, table_name, where_clause, paramaters, worker_count))
+        print(f"{worker_count} workers: {parallel_time * 1000:.1f} ms, {serial_time / parallel_time:.2f}x, "
+              f"{mismatches} searches with different results")
+    shutdown_process_pools()
+
+
+# Maintenance command, for example:
+#   python parallel_scan.py car_database.db --max-workers 8
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks and benchmarks the parallel SQLite search against the serial one")
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("--table", default="car_db_metric")
+    parser.add_argument("--searches", type=int, default=20)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    arguments = parser.parse_args()
+
+    if get_database_fingerprint(arguments.database_path) is None:
+        parser.error(f"Cannot open {arguments.database_path}")
+    benchmark_parallel_scan(arguments.database_path, arguments.table, arguments.searches, arguments.max_workers)
@@ -0,0 +1,147 @@
+import operator
+import threading
+from array import array
+from collections import OrderedDict
+
+from connection_pool import get_connection_pool, get_database_fingerprint
+from tracing import trace_span
+
+
+# Cache of search results, so that repeating a search (or toggling a checkbox back) is answered without searching again
+# A search is keyed by its table and its SearchSpec, which is the same for the same choices in the GUI,
+#   and only the rowids of the matching cars are kept (8 bytes per car)
+# The least recently used searches are dropped once there are too many entries or they take too much memory,
+#   and the whole cache is emptied when the database file changes
+
+# Limits of every cache
+MAX_CACHED_SEARCHES = 128
+MAX_CACHED_BYTES = 16 * 1024 * 1024
+# Number of cars read from the database with one query when the records of cached rowids are fetched
+FETCH_CHUNK_SIZE = 500
+
+# One cache per database, keyed by the database path
+result_caches = {}
+result_caches_lock = threading.Lock()
+
+
+class ResultCache:
+    def __init__(self, database_path, max_entries=MAX_CACHED_SEARCHES, max_bytes=MAX_CACHED_BYTES):
+        self.database_path = database_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Search key to rowids, the least recently used search first
+        self.entries = OrderedDict()
+        self.size_in_bytes = 0
+        # The cache only holds results of the database file with this modification time and size
+        self.fingerprint = get_database_fingerprint(database_path)
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    # Empties the cache if the database file changed since the results were cached, must be called with self.lock held
+    def check_fingerprint(self):
+        fingerprint = get_database_fingerprint(self.database_path)
+        if fingerprint != self.fingerprint:
+            if self.entries:
+                self.counters["invalidations"] += 1
+            self.entries.clear()
+            self.size_in_bytes = 0
+            self.fingerprint = fingerprint
+
+    # Returns the cached rowids of a search, or None if it is not cached
+    def get(self, key):
+        with self.lock:
+            self.check_fingerprint()
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[0]
+
+    # Caches the rowids of a search, dropping the least recently used searches to stay within the limits
+    def put(self, key, row_ids):
+        entry_size = get_entry_size(key, row_ids)
+        if entry_size > self.max_bytes:
+            return
+        with self.lock:
+            self.check_fingerprint()
+            if key in self.entries:
+                self.size_in_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (row_ids, entry_size)
+            self.size_in_bytes += entry_size
+            while len(self.entries) > self.max_entries or self.size_in_bytes > self.max_bytes:
+                self.size_in_bytes -= self.entries.popitem(last=False)[1][1]
+                self.counters["evictions"] += 1
+
+    # Empties the cache
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size_in_bytes = 0
+
+    # Returns the counters, the share of lookups answered from the cache and its current size
+    def get_statistics(self):
+        with self.lock:
+            statistics = dict(self.counters)
+            statistics["entries"] = len(self.entries)
+            statistics["bytes"] = self.size_in_bytes
+        lookups = statistics["hits"] + statistics["misses"]
+        statistics["hit_rate"] = statistics["hits"] / lookups if lookups else 0.0
+        return statistics
+
+
+# Returns the (approximate) memory used by a cached search: the rowids plus the text of the key
+def get_entry_size(key, row_ids):
+    return len(row_ids) * 8 + len(repr(key))
+
+
+# Returns the result cache of a database, creating it on first use
+def get_result_cache(database_path):
+    with result_caches_lock:
+        result_cache = result_caches.get(database_path)
+        if result_cache is None:
+            result_cache = ResultCache(database_path)
+            result_caches[database_path] = result_cache
+        return result_cache
+
+
+# Empties the result caches of every database
+def clear_result_caches():
+    with result_caches_lock:
+        caches = list(result_caches.values())
+    for result_cache in caches:
+        result_cache.clear()
+
+
+# Returns the rowids of the cars matching a WHERE clause (an empty one for every car), in rowid order
+def read_matching_row_ids(database_path, table_name, where_clause, paramaters=()):
+    search_query = f"SELECT rowid FROM {table_name}"
+    if where_clause:
+        search_query += f" WHERE {where_clause}"
+    with trace_span("read matching row ids") as span:
+        cursor = get_connection_pool(database_path).execute(f"{search_query} ORDER BY rowid", paramaters)
+        row_ids = array("q", (row[0] for row in cursor.fetchall()))
+        cursor.close()
+        span.set(rows=len(row_ids))
+    return row_ids
+
+
+# Reads the full records of the given cars, in the order of the rowids, a chunk at a time so that only the cars that are used are read
+def iterate_rows_by_id(database_path, table_name, row_ids):
+    connection_pool = get_connection_pool(database_path)
+    with connection_pool.open_cursor() as cursor:
+        for start in range(0, len(row_ids), FETCH_CHUNK_SIZE):
+            chunk = [int(row_id) for row_id in row_ids[start:start + FETCH_CHUNK_SIZE]]
+            placeholders = ', '.join(['?'] * len(chunk))
+            # The span ends before the cars are handed out, so it does not include the time the caller spends on them
+            with trace_span("fetch rows", rows=len(chunk)):
+                if all(map(operator.lt, chunk, chunk[1:])):
+                    connection_pool.execute(f"SELECT * FROM {table_name} WHERE rowid IN ({placeholders}) ORDER BY rowid", chunk, cursor=cursor)
+                    rows = cursor.fetchall()
+                else:
+                    # Ranked cars (best text matches first) are put back in their order after being read
+                    connection_pool.execute(f"SELECT rowid, * FROM {table_name} WHERE rowid IN ({placeholders})", chunk, cursor=cursor)
+                    rows_by_id = {row[0]: row[1:] for row in cursor.fetchall()}
+                    rows = [rows_by_id[row_id] for row_id in chunk if row_id in rows_by_id]
+            yield from rows
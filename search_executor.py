@@ -0,0 +1,150 @@
+import queue
+import threading
+import time
+
+from connection_pool import interrupt_thread_queries
+from tracing import trace_span
+
+
+# Searches run on a single worker thread so the Tk mainloop never waits for the database
+# Jobs are submitted on a channel ("search", "models", ...), and only the newest job of a channel matters:
+#   submitting a new job (or cancelling the channel) interrupts the query of the older one and drops its result
+# Finished jobs are handed back to the Tk thread by polling with root.after, as Tk may only be used from the thread running it
+# A thread is used rather than a process: SQLite releases the GIL while it runs a query, and connection.interrupt()
+#   can only stop a query running in the same process
+
+# How often (ms) the Tk thread looks for finished jobs and updates the progress of running ones
+POLL_INTERVAL_MS = 30
+
+# Set on the worker thread, so that run_in_gui_thread knows where to send its calls
+worker_data = threading.local()
+
+
+class SearchExecutor:
+    def __init__(self, root, poll_interval_ms=POLL_INTERVAL_MS):
+        self.root = root
+        self.poll_interval_ms = poll_interval_ms
+        # Jobs waiting for the worker, and finished jobs (or calls from run_in_gui_thread) waiting for the Tk thread
+        self.jobs = queue.Queue()
+        self.finished_jobs = queue.Queue()
+        # Number of the newest job of every channel, a job whose number is not the newest is outdated
+        self.generations = {}
+        # Channel and number of the job the worker is running, None when it is idle
+        self.running_job = None
+        self.lock = threading.Lock()
+        # Jobs the Tk thread is still waiting for: {channel: (number, start time, on_progress)}, only used on the Tk thread
+        self.pending_jobs = {}
+
+        self.worker = threading.Thread(target=self.run_worker, name="search-worker", daemon=True)
+        self.worker.start()
+        self.root.after(self.poll_interval_ms, self.poll_finished_jobs)
+
+    # Runs function() on the worker thread, then on_done(result) or on_error(exception) on the Tk thread
+    # on_progress(elapsed seconds) is called on the Tk thread while the job is waiting or running
+    # Any older job of the same channel is cancelled
+    def submit(self, channel, function, on_done=None, on_error=None, on_progress=None):
+        with self.lock:
+            generation = self.generations.get(channel, 0) + 1
+            self.generations[channel] = generation
+            self.interrupt_running_job(channel)
+        self.pending_jobs[channel] = (generation, time.perf_counter(), on_progress)
+        self.jobs.put((channel, generation, function, on_done, on_error))
+        return generation
+
+    # Cancels the job of a channel: a running query is interrupted, a waiting job is skipped and no callback is called
+    def cancel(self, channel):
+        with self.lock:
+            if channel not in self.generations:
+                return
+            self.generations[channel] += 1
+            self.interrupt_running_job(channel)
+        self.pending_jobs.pop(channel, None)
+
+    # Returns True if a job of the channel has not finished yet
+    def is_busy(self, channel):
+        return channel in self.pending_jobs
+
+    # Interrupts the query of the running job if it belongs to the channel, must be called with self.lock held
+    def interrupt_running_job(self, channel):
+        if self.running_job is not None and self.running_job[0] == channel:
+            interrupt_thread_queries(self.worker.ident)
+
+    # Loop of the worker thread
+    def run_worker(self):
+        worker_data.executor = self
+        while True:
+            channel, generation, function, on_done, on_error = self.jobs.get()
+            with self.lock:
+                if self.generations.get(channel) != generation:
+                    # Replaced while it was waiting
+                    continue
+                self.running_job = (channel, generation)
+            try:
+                with trace_span("job", channel=str(channel)):
+                    result = function()
+                callback = on_done
+            except Exception as e:
+                result = e
+                callback = on_error if on_error is not None else print_job_error
+            with self.lock:
+                self.running_job = None
+            self.finished_jobs.put((channel, generation, callback, result))
+
+    # Called by Tk every poll_interval_ms, runs the callbacks of finished jobs and reports the progress of the others
+    def poll_finished_jobs(self):
+        while True:
+            try:
+                channel, generation, callback, result = self.finished_jobs.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if channel is None:
+                    # A call sent by run_in_gui_thread
+                    callback()
+                    continue
+                pending_job = self.pending_jobs.get(channel)
+                if pending_job is None or pending_job[0] != generation:
+                    # Outdated, a newer job was submitted or the channel was cancelled
+                    continue
+                del self.pending_jobs[channel]
+                if callback is not None:
+                    with trace_span("show job result", channel=str(channel)):
+                        callback(result)
+            except Exception as e:
+                # The executor must keep polling whatever a callback does
+                print("An error occurred while showing the results:", e)
+
+        for channel, (generation, start_time, on_progress) in list(self.pending_jobs.items()):
+            if on_progress is not None:
+                on_progress(time.perf_counter() - start_time)
+        self.root.after(self.poll_interval_ms, self.poll_finished_jobs)
+
+
+# Default on_error of a job
+def print_job_error(error):
+    print("An error occurred while searching:", error)
+
+
+# Calls function(*arguments) on the Tk thread and returns its result
+# Used by code that may run on the worker but has to show a dialog; on any other thread the function is simply called
+def run_in_gui_thread(function, *arguments):
+    executor = getattr(worker_data, "executor", None)
+    if executor is None:
+        return function(*arguments)
+
+    outcome = {}
+    finished = threading.Event()
+
+    def call():
+        try:
+            outcome["result"] = function(*arguments)
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            finished.set()
+
+    executor.finished_jobs.put((None, None, call, None))
+    finished.wait()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
@@ -0,0 +1,402 @@
+import functools
+import numbers
+
+from connection_pool import get_connection_pool, get_database_fingerprint
+from derived_tables import (car_body_categories, ensure_derived_table, get_body_category_condition, get_categorical_synonyms,
+                            get_derived_condition, get_enum_code_condition, parse_seat_range,
+                            sort_car_series_column_by_keywords)
+from statistics_catalog import get_column_range
+from text_search import get_search_words, get_text_condition, is_text_index_ready
+from tracing import trace_span
+
+
+# A search is described by a SearchSpec: the brand and model, the free text, one (min, max) tuple per slider and one frozenset per checkbox group
+# It replaces the long list of arguments of search_by_model, is hashable (so it can key the result cache)
+#   and is turned into SQL only once per database (compile_search_spec)
+
+# Sliders, as (range name in the statistics catalog: argument names of search_by_model)
+RANGE_ARGUMENTS = {
+    "year": ("year_from", "year_to"),
+    "seating_capacity": ("seating_capacity_min", "seating_capacity_max"),
+    "engine_hp": ("engine_hp_min", "engine_hp_max"),
+    "curb_weight": ("curb_weight_kg_min", "curb_weight_kg_max"),
+    "power_to_weight_ratio": ("min_power_to_weight_ratio", "max_power_to_weight_ratio"),
+    "displacement": ("displacement_min", "displacement_max"),
+    "top_speed": ("top_speed_min", "top_speed_max"),
+    }
+
+# Checkbox groups, as (argument name of search_by_model, value) pairs
+# A group filters nothing when all or none of its checkboxes are checked, like in search_by_model
+CATEGORICAL_CHECKBOXES = {
+    "engine_type": [("gasoline_bool", "Gasoline"), ("diesel_bool", "Diesel"), ("hybrid_bool", "Hybrid"),
+                    ("electric_bool", "Electric"), ("other_fuel_type_bool", "Other")],
+    "engine_placement": [("engine_front_bool", "Front"), ("engine_mid_bool", "Mid"), ("engine_rear_bool", "Rear")],
+    "drive_wheels": [("drivetrain_fwd_bool", "FWD"), ("drivetrain_rwd_bool", "RWD"), ("drivetrain_awd_bool", "AWD")],
+    "transmission": [("manual_transmission_bool", "Manual"), ("automatic_transmission_bool", "Automatic")],
+    "cylinder_layout": [("V_type_engine_layout_bool", "V-type"), ("Inline_engine_layout_bool", "Inline"),
+                        ("Opposed_engine_layout_bool", "Opposed"), ("W_type_engine_layout_bool", "W-type"),
+                        ("Rotary_engine_layout_bool", "Rotary")],
+    }
+BODY_CATEGORY_CHECKBOXES = [
+    ("car_type_roadster_bool", "Roadster"), ("car_type_coupe_bool", "Coupe"), ("car_type_hatchback_bool", "Hatchback"),
+    ("car_type_spyder_bool", "Spyder"), ("car_type_cabriolet_bool", "Cabriolet"), ("car_type_sedan_bool", "Sedan"),
+    ("car_type_wagon_bool", "Wagon"), ("car_type_suv_bool", "SUV"), ("car_type_pickup_bool", "Pickup"),
+    ("car_type_van_bool", "Van"), ("car_type_limousine_bool", "Limousine"),
+    ]
+BORE_STROKE_CHECKBOXES = [("Bore_Stroke_Undersquare_bool", "undersquare"), ("Bore_Stroke_Square_bool", "square"),
+                          ("Bore_Stroke_Oversquare_bool", "oversquare")]
+COUNTRY_CHECKBOXES = [(f"{country.replace(' ', '_')}_bool", country) for country in [
+    "United Kingdom", "Japan", "Germany", "Italy", "France", "United States", "Belgium", "Romania", "South Korea", "Russia",
+    "Switzerland", "China", "India", "Latvia", "Fictional", "Malaysia", "Netherlands", "Poland", "Czech Republic", "Spain",
+    "Australia", "Iran", "Sweden", "Austria", "Ukraine", "Taiwan", "Luxembourg", "Brazil", "Uzbekistan", "Croatia", "Turkey",
+    "Serbia", "Kazakhstan"]]
+CYLINDER_COUNT_CHECKBOXES = [(f"_{count}_cylinders_bool", count) for count in [1, 2, 3, 4, 5, 6, 7, 8, 10, 12, 16]]
+
+# Every checkbox group, by the name of its field in SearchSpec
+CHECKBOX_GROUPS = dict(CATEGORICAL_CHECKBOXES, body_category=BODY_CATEGORY_CHECKBOXES, bore_stroke=BORE_STROKE_CHECKBOXES,
+                       country_of_origin=COUNTRY_CHECKBOXES, number_of_cylinders=CYLINDER_COUNT_CHECKBOXES)
+
+# Number of compiled searches kept in memory
+COMPILED_SEARCH_CACHE_SIZE = 256
+
+
+class SearchSpec:
+    __slots__ = ("brand", "model", "text", *RANGE_ARGUMENTS, *CHECKBOX_GROUPS, "key")
+
+    # brand and model: exact names, empty or None for any
+    # text: words to find in the names of the cars (see text_search), empty or None for any
+    # Sliders: (min, max), either can be None, and a limit equal to the one of the database filters nothing
+    # Checkbox groups: the checked values (see CHECKBOX_GROUPS), an empty group filters nothing
+    # A spec is never changed once created, so it can be used as a dictionary key
+    # Raises ValueError for a value of the wrong type (such as a number as the brand of a search loaded from JSON)
+    def __init__(self, brand=None, model=None, text=None, **filters):
+        unknown_filters = set(filters) - set(RANGE_ARGUMENTS) - set(CHECKBOX_GROUPS)
+        if unknown_filters:
+            raise TypeError(f"Unknown search filters: {', '.join(sorted(unknown_filters))}")
+        for field_name, value in [("brand", brand), ("model", model), ("text", text)]:
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f"The {field_name} of a search must be a text, not {value!r}")
+        self.brand = brand if brand is not None and brand.strip() != "" else None
+        self.model = model if model is not None and model.strip() != "" else None
+        # The words are joined again, so texts that only differ in spacing are the same search
+        self.text = " ".join(get_search_words(text)) if text is not None else None
+        if self.text == "":
+            self.text = None
+        for range_name in RANGE_ARGUMENTS:
+            limits = filters.get(range_name) or (None, None)
+            if not isinstance(limits, (list, tuple)) or len(limits) != 2 or \
+                    not all(limit is None or isinstance(limit, numbers.Real) and not isinstance(limit, bool) for limit in limits):
+                raise ValueError(f"The {range_name} range of a search must be [min, max] numbers (or null), not {limits!r}")
+            minimum, maximum = limits
+            setattr(self, range_name, (minimum, maximum))
+        for group_name, checkboxes in CHECKBOX_GROUPS.items():
+            setattr(self, group_name, get_checkbox_group(group_name, checkboxes, filters.get(group_name)))
+        self.key = tuple(getattr(self, field_name) for field_name in self.__slots__[:-1])
+
+    def __eq__(self, other):
+        return isinstance(other, SearchSpec) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        fields = [f"{field_name}={value!r}" for field_name, value in zip(self.__slots__, self.key)
+                  if value is not None and value != (None, None)]
+        return f"SearchSpec({', '.join(fields)})"
+
+    # Returns a copy of the spec with some of its filters replaced
+    def replace(self, **filters):
+        fields = {field_name: getattr(self, field_name) for field_name in self.__slots__[:-1]}
+        fields.update(filters)
+        return SearchSpec(**fields)
+
+    # Returns True if every car this search finds is also found by another search, which is then only narrowed down:
+    #   the same brand and model (or none in the other search), ranges inside the other ranges and checked values among the other ones
+    # Every filter keeps fewer cars as its limits get closer, so the cars of the other search can simply be filtered again
+    # Used by the live results, a moved slider then refines the previous cars instead of searching them all again
+    def is_narrower_than(self, other):
+        if other.brand is not None and self.brand != other.brand or other.model is not None and self.model != other.model:
+            return False
+        # Typing more of the text only adds words or letters to the last word (a prefix), which keeps fewer cars
+        if other.text is not None and (self.text is None or not self.text.startswith(other.text)):
+            return False
+        for range_name in RANGE_ARGUMENTS:
+            (minimum, maximum), (other_minimum, other_maximum) = getattr(self, range_name), getattr(other, range_name)
+            if other_minimum is not None and (minimum is None or minimum < other_minimum):
+                return False
+            if other_maximum is not None and (maximum is None or maximum > other_maximum):
+                return False
+        for group_name in CHECKBOX_GROUPS:
+            checked_values, other_checked_values = getattr(self, group_name), getattr(other, group_name)
+            if other_checked_values is not None and (checked_values is None or not checked_values <= other_checked_values):
+                return False
+        return True
+
+    # Returns the checked values of a checkbox group in the order of its checkboxes, or an empty list if it filters nothing
+    def get_checked_values(self, group_name):
+        checked_values = getattr(self, group_name)
+        if checked_values is None:
+            return []
+        return [value for _, value in CHECKBOX_GROUPS[group_name] if value in checked_values]
+
+
+# Returns the frozenset of the checked values of a group, or None when the group filters nothing (none or all checked)
+# Raises ValueError for a value that is not in the group
+def get_checkbox_group(group_name, checkboxes, checked_values):
+    checked_values = frozenset(checked_values or ())
+    all_values = frozenset(value for _, value in checkboxes)
+    if not checked_values <= all_values:
+        raise ValueError(f"Unknown {group_name} values: {', '.join(map(str, checked_values - all_values))}")
+    if not checked_values or checked_values == all_values:
+        return None
+    return checked_values
+
+
+# Returns the spec of a search given by the arguments of search_by_model (a dictionary of argument name to value)
+def get_search_spec(arguments):
+    filters = {range_name: (arguments.get(minimum_name), arguments.get(maximum_name))
+               for range_name, (minimum_name, maximum_name) in RANGE_ARGUMENTS.items()}
+    for group_name, checkboxes in CHECKBOX_GROUPS.items():
+        filters[group_name] = [value for argument_name, value in checkboxes if arguments.get(argument_name) == 1]
+    return SearchSpec(arguments.get("brand"), arguments.get("model"), arguments.get("text"), **filters)
+
+
+# Joins the conditions of a search into a WHERE clause (without the WHERE keyword), the or_conditions form a single group
+def get_where_clause(and_conditions, or_conditions):
+    and_clause = " AND ".join(and_conditions)
+    or_clause = " OR ".join(or_conditions)
+    if and_clause and or_clause:
+        return f"({and_clause}) AND ({or_clause})"
+    return and_clause if and_clause else or_clause
+
+
+# Returns the condition (and its parameters) of the seat slider on the raw number_of_seats column, used without the derived table
+# The layouts of a car (such as "5, 7") are read as a range the same way as in the derived table (parse_seat_range), which SQL
+#   cannot do on the text, so the few distinct values of the column are compared here and the matching ones listed in an IN
+# Raises sqlite3.Error if the database cannot be read
+def get_seat_layout_condition(database_path, table_name, seats_min, seats_max):
+    cursor = get_connection_pool(database_path).execute(f"SELECT DISTINCT number_of_seats FROM {table_name}")
+    matching_values = []
+    for (number_of_seats,) in cursor.fetchall():
+        layout_min, layout_max = parse_seat_range(number_of_seats)
+        if layout_min is None:
+            continue
+        if (seats_min is None or layout_max >= seats_min) and (seats_max is None or layout_min <= seats_max):
+            matching_values.append(number_of_seats)
+    cursor.close()
+    return f"number_of_seats IN ({', '.join('?' * len(matching_values))})", matching_values
+
+
+# Returns the WHERE clause (empty for every car) and its parameters that select the cars of a search
+# Raises sqlite3.Error if the slider limits of the database cannot be read
+def compile_search_spec(database_path, table_name, search_spec):
+    with trace_span("build query") as span:
+        # The derived table is built first, as building it changes the database file
+        derived_table_ready = ensure_derived_table(database_path, table_name, car_body_categories)
+        # The text index is never built here (see text_search), searches match the columns themselves until it is
+        text_index_ready = search_spec.text is not None and is_text_index_ready(database_path, table_name)
+        fingerprint = tuple(get_database_fingerprint(database_path) or ())
+        where_clause, paramaters = compile_search_conditions(database_path, table_name, search_spec, derived_table_ready, text_index_ready,
+                                                             fingerprint)
+        span.set(parameters=len(paramaters), derived_table=derived_table_ready)
+    return where_clause, paramaters
+
+
+# Builds the SQL of a search, only once for the same search on the same database file (the fingerprint is part of the key)
+@functools.lru_cache(maxsize=COMPILED_SEARCH_CACHE_SIZE)
+def compile_search_conditions(database_path, table_name, search_spec, derived_table_ready, text_index_ready, fingerprint):
+    # and_paramaters and _and conditions are for searches that should be cars that have x and x and x (such as a V8 AND 400 horsepower AND less than 1200 kilos)
+    # or paramater are conditions that can be or such as Japanese Or Italian OR German car
+    and_paramaters = []
+    and_conditions = []
+    or_paramaters = []
+    or_conditions = []
+
+    # The derived table holds clean numeric copies of the text-encoded specs, with an index on each of them
+    # When it cannot be built (for example on a read-only database) the raw columns are converted on every row instead
+    if derived_table_ready:
+        # All the filters on the derived table are gathered into a single sub-query, added once the checkboxes are done,
+        #   so SQLite picks the best index among them and looks up the matching cars only once
+        derived_conditions = []
+        derived_paramaters = []
+        range_conditions, range_paramaters = derived_conditions, derived_paramaters
+        # A car with several seat layouts (such as "5, 7") is kept as the range from its smallest to its biggest layout,
+        #   and matches when that range overlaps the chosen one: "2, 9" matches 4 to 6 although neither layout is within it
+        seats_min_condition = "seats_max >= ?"
+        seats_max_condition = "seats_min <= ?"
+        power_to_weight_min_condition = "power_to_weight >= ?"
+        power_to_weight_max_condition = "power_to_weight <= ?"
+        top_speed_min_condition = "top_speed_kmh >= ?"
+        top_speed_max_condition = "top_speed_kmh <= ?"
+    else:
+        range_conditions, range_paramaters = and_conditions, and_paramaters
+        # The seat layouts cannot be compared in SQL without the derived table, see get_seat_layout_condition
+        seats_min_condition = seats_max_condition = None
+        power_to_weight_min_condition = "engine_hp / NULLIF(curb_weight_kg, 0) >= ?"
+        power_to_weight_max_condition = "engine_hp / NULLIF(curb_weight_kg, 0) <= ?"
+        top_speed_min_condition = "CAST(REPLACE(REPLACE(max_speed_km_per_h, ' km/h', ''), ',', '') AS REAL) >= ? AND max_speed_km_per_h NOT LIKE '%km/h%'"
+        top_speed_max_condition = "CAST(REPLACE(REPLACE(max_speed_km_per_h, ' km/h', ''), ',', '') AS REAL) <= ? AND max_speed_km_per_h NOT LIKE '%km/h%'"
+
+    # Adds the filter of a checkbox group on a categorical column, from the canonical values that are checked
+    # The synonyms of every value are listed once in categorical_values.json
+    # With the derived table the filter is an IN on small indexed integer codes, otherwise an IN on all the raw spellings
+    def add_categorical_filter(column_name):
+        chosen_values = search_spec.get_checked_values(column_name)
+        if not chosen_values:
+            return
+        if derived_table_ready:
+            condition, paramaters = get_enum_code_condition(column_name, chosen_values)
+            derived_conditions.append(condition)
+            derived_paramaters.extend(paramaters)
+        else:
+            synonyms = get_categorical_synonyms(column_name, chosen_values)
+            and_conditions.append(f"{column_name} IN ({', '.join(['?'] * len(synonyms))})")
+            or_paramaters.extend(synonyms)
+
+    # Returns True if a slider is moved away from the limit of the database, only then does it filter anything
+    def is_moved(value, range_name, min_max_flag):
+        return value is not None and value != get_column_range(database_path, table_name, range_name, min_max_flag)
+
+    if search_spec.brand is not None:
+        and_conditions.append("make = ?")
+        and_paramaters.append(search_spec.brand)
+    if search_spec.model is not None:
+        and_conditions.append("model = ?")
+        and_paramaters.append(search_spec.model)
+    if search_spec.text is not None:
+        text_condition, text_paramaters = get_text_condition(table_name, search_spec.text, text_index_ready)
+        and_conditions.append(text_condition)
+        and_paramaters.extend(text_paramaters)
+
+    year_from, year_to = search_spec.year
+    if is_moved(year_from, "year", "min"):
+        and_conditions.append("year_from >= ? AND year_from != 0.0")
+        and_paramaters.append(year_from)
+    if is_moved(year_to, "year", "max"):
+        and_conditions.append("year_to <= ? AND year_to != 0.0")
+        and_paramaters.append(year_to)
+
+    seating_capacity_min, seating_capacity_max = search_spec.seating_capacity
+    seats_min = int(round(seating_capacity_min)) if is_moved(seating_capacity_min, "seating_capacity", "min") else None
+    seats_max = int(round(seating_capacity_max)) if is_moved(seating_capacity_max, "seating_capacity", "max") else None
+    if not derived_table_ready and (seats_min is not None or seats_max is not None):
+        condition, paramaters = get_seat_layout_condition(database_path, table_name, seats_min, seats_max)
+        and_conditions.append(condition)
+        and_paramaters.extend(paramaters)
+    elif seats_min is not None and seats_max is not None:
+        range_conditions.append(f"{seats_min_condition} AND {seats_max_condition}")
+        range_paramaters.extend([seats_min, seats_max])
+    elif seats_min is not None:
+        range_conditions.append(seats_min_condition)
+        range_paramaters.append(seats_min)
+    elif seats_max is not None:
+        range_conditions.append(seats_max_condition)
+        range_paramaters.append(seats_max)
+
+    engine_hp_min, engine_hp_max = search_spec.engine_hp
+    if is_moved(engine_hp_min, "engine_hp", "min"):
+        and_conditions.append("engine_hp >= ?")
+        and_paramaters.append(int(engine_hp_min))
+    if is_moved(engine_hp_max, "engine_hp", "max"):
+        and_conditions.append("engine_hp <= ?")
+        and_paramaters.append(int(engine_hp_max))
+
+    curb_weight_min, curb_weight_max = search_spec.curb_weight
+    if is_moved(curb_weight_min, "curb_weight", "min"):
+        and_conditions.append("curb_weight_kg >= ?")
+        and_paramaters.append(int(curb_weight_min))
+    if is_moved(curb_weight_max, "curb_weight", "max"):
+        and_conditions.append("curb_weight_kg <= ?")
+        and_paramaters.append(int(curb_weight_max))
+
+    power_to_weight_min, power_to_weight_max = search_spec.power_to_weight_ratio
+    if is_moved(power_to_weight_min, "power_to_weight_ratio", "min"):
+        range_conditions.append(power_to_weight_min_condition)
+        range_paramaters.append(power_to_weight_min)
+    if is_moved(power_to_weight_max, "power_to_weight_ratio", "max"):
+        range_conditions.append(power_to_weight_max_condition)
+        range_paramaters.append(power_to_weight_max)
+
+    displacement_min, displacement_max = search_spec.displacement
+    if is_moved(displacement_min, "displacement", "min"):
+        and_conditions.append("capacity_cm3 >= ?")
+        and_paramaters.append(displacement_min)
+    if is_moved(displacement_max, "displacement", "max"):
+        and_conditions.append("capacity_cm3 <= ?")
+        and_paramaters.append(displacement_max)
+
+    top_speed_min, top_speed_max = search_spec.top_speed
+    if is_moved(top_speed_min, "top_speed", "min"):
+        range_conditions.append(top_speed_min_condition)
+        range_paramaters.append(top_speed_min)
+    if is_moved(top_speed_max, "top_speed", "max"):
+        range_conditions.append(top_speed_max_condition)
+        range_paramaters.append(top_speed_max)
+
+    # Checkboxes:
+    add_categorical_filter("engine_type")
+    add_categorical_filter("engine_placement")
+    add_categorical_filter("drive_wheels")
+    add_categorical_filter("transmission")
+
+    chosen_shapes = search_spec.get_checked_values("bore_stroke")
+    if chosen_shapes:
+        bore_stroke_ratio_conditions = []
+        if derived_table_ready:
+            # The bore/stroke ratio is precomputed, so the three shapes are plain comparisons on an indexed column
+            shape_conditions = {"undersquare": "bore_stroke_ratio < 1", "square": "bore_stroke_ratio = 1", "oversquare": "bore_stroke_ratio > 1"}
+            derived_conditions.append(f"({' OR '.join(shape_conditions[shape] for shape in chosen_shapes)})")
+        else:
+            tolerance = 0.01  # Define a tolerance value for the comparison
+
+            if "undersquare" in chosen_shapes:
+                bore_stroke_ratio_conditions.append("(cylinder_bore_mm / stroke_cycle_mm < ?) AND (cylinder_bore_mm != stroke_cycle_mm) AND (cylinder_bore_mm < "
+                                                    "stroke_cycle_mm)")  # Define undersquare condition
+                or_paramaters.append(1 + tolerance)  # Add tolerance to the condition
+
+            if "square" in chosen_shapes:
+                bore_stroke_ratio_conditions.append("(cylinder_bore_mm = stroke_cycle_mm)")
+
+            if "oversquare" in chosen_shapes:
+                bore_stroke_ratio_conditions.append("(cylinder_bore_mm / stroke_cycle_mm > ?) AND (cylinder_bore_mm != stroke_cycle_mm) AND (cylinder_bore_mm > "
+                                                    "stroke_cycle_mm)")  # Define oversquare condition
+                or_paramaters.append(1 - tolerance)  # Add tolerance to the condition
+
+        if bore_stroke_ratio_conditions:
+            and_conditions.append(f"({' OR '.join(bore_stroke_ratio_conditions)})")
+
+    chosen_countries = search_spec.get_checked_values("country_of_origin")
+    if chosen_countries:
+        and_conditions.append(f"({' OR '.join(['country_of_origin == ?'] * len(chosen_countries))})")
+        or_paramaters.extend(chosen_countries)
+
+    chosen_cylinder_counts = search_spec.get_checked_values("number_of_cylinders")
+    if chosen_cylinder_counts:
+        and_conditions.append(f"({' OR '.join(['number_of_cylinders = ?'] * len(chosen_cylinder_counts))})")
+        or_paramaters.extend(chosen_cylinder_counts)
+
+    add_categorical_filter("cylinder_layout")
+
+    # ALWAYS PUT THIS ONE LAST
+    chosen_body_categories = search_spec.get_checked_values("body_category")
+    if chosen_body_categories:
+        # The body category of every car is precomputed in an indexed table, so this is a single lookup
+        if derived_table_ready:
+            body_category_condition, body_category_paramaters = get_body_category_condition(table_name, chosen_body_categories)
+            or_conditions.append(body_category_condition)
+            or_paramaters.extend(body_category_paramaters)
+        else:
+            # Falls back to listing the names of every series of the chosen categories
+            result = sort_car_series_column_by_keywords(database_path, table_name, car_body_categories)
+            for category in chosen_body_categories:
+                models = result.get(category, [])
+                or_conditions.append(f"series IN ({','.join(['?'] * len(models))})")
+                or_paramaters.extend(models)
+
+    # The checkboxes add their conditions to and_conditions but their parameters to or_paramaters,
+    #   so the derived sub-query goes first to keep every parameter in line with its placeholder
+    if derived_table_ready and derived_conditions:
+        and_conditions.insert(0, get_derived_condition(table_name, " AND ".join(derived_conditions)))
+        and_paramaters[:0] = derived_paramaters
+
+    return get_where_clause(and_conditions, or_conditions), tuple(and_paramaters + or_paramaters)
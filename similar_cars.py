@@ -0,0 +1,240 @@
+import argparse
+import random
+import sqlite3
+import time
+
+from car_search import find_matching_row_ids
+from columnar_snapshot import get_snapshot, np
+
+
+# "Cars like this one": the cars closest to a reference car (or to a target spec) over several numeric specs at once,
+#   instead of hard range filters
+# Every spec is z-normalized (minus its mean, divided by its standard deviation) so that a horsepower and a kilogram weigh
+#   the same, then weighted, and the cars are ranked by their weighted euclidean distance to the target
+# The normalized specs of every car form a single matrix, built from the snapshot once per database version and kept in memory
+# A query is a few vectorized operations over the whole matrix: with 7 specs and a table that fits in memory this is a few
+#   milliseconds, and unlike a KD-tree it handles missing specs and a new set of weights on every query
+# Only the specs of the target are compared, and a spec the car is missing counts as one standard deviation away,
+#   so a car is not found as close as another one just because few of its specs are known
+
+# Specs compared, as (name used by the searches: snapshot column)
+SIMILARITY_FEATURES = {
+    "engine_hp": "engine_hp",
+    "curb_weight_kg": "curb_weight_kg",
+    "capacity_cm3": "capacity_cm3",
+    "top_speed_kmh": "top_speed_kmh",
+    "year": "year_from",
+    "seats": "seats_max",
+    "bore_stroke_ratio": "bore_stroke_ratio",
+    }
+# Columns where 0 stands for a missing value, as in the searches (year_from != 0.0, NULLIF(curb_weight_kg, 0))
+ZERO_MEANS_MISSING_COLUMNS = {"year_from", "curb_weight_kg"}
+# Distance (in standard deviations) counted for a spec of the target that a car is missing
+MISSING_SPEC_DISTANCE = 1.0
+# Number of cars returned by default
+DEFAULT_SIMILAR_CAR_COUNT = 10
+
+# Indexes in use, keyed by (database path, table name), each one built from a snapshot
+similarity_indexes = {}
+
+
+class SimilarityIndex:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.row_ids = snapshot.arrays["row_id"]
+        values = np.column_stack([snapshot.arrays[column] for column in SIMILARITY_FEATURES.values()]) if snapshot.row_count else \
+            np.empty((0, len(SIMILARITY_FEATURES)))
+        # The placeholder zeros would pull the mean down and make their cars look far from every other one
+        for feature_index, column in enumerate(SIMILARITY_FEATURES.values()):
+            if column in ZERO_MEANS_MISSING_COLUMNS:
+                values[values[:, feature_index] == 0, feature_index] = np.nan
+        present = ~np.isnan(values)
+        filled_values = np.where(present, values, 0.0)
+        value_counts = np.maximum(present.sum(axis=0), 1)
+        # Mean and standard deviation of every spec over the cars that have it
+        self.means = filled_values.sum(axis=0) / value_counts
+        deviations = np.sqrt((np.where(present, values - self.means, 0.0) ** 2).sum(axis=0) / value_counts)
+        # A spec with a single value (or none) cannot be normalized, it then counts as is
+        self.deviations = np.where(deviations > 0, deviations, 1.0)
+        # The missing specs are 0 in the matrix and 0 in the mask of present specs
+        # float32 halves the memory read by every query, the distances do not need more precision
+        self.features = np.where(present, (filled_values - self.means) / self.deviations, 0.0).astype(np.float32)
+        self.present = present.astype(np.float32)
+
+    # Returns the specs of the given cars (rowids), as {spec name: value}, averaged over the cars when there are several
+    # Specs that none of the cars have are left out, an empty dictionary means none of the cars is in the table
+    def get_car_specs(self, row_ids):
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        positions = np.searchsorted(self.row_ids, row_ids)
+        positions = positions[(positions < len(self.row_ids)) & (self.row_ids[np.minimum(positions, len(self.row_ids) - 1)] == row_ids)]
+        if len(positions) == 0:
+            return {}
+        present = self.present[positions]
+        value_counts = present.sum(axis=0)
+        specs = self.means + (self.features[positions].sum(axis=0) / np.maximum(value_counts, 1)) * self.deviations
+        return {feature: float(value) for feature, value, value_count in zip(SIMILARITY_FEATURES, specs, value_counts) if value_count > 0}
+
+    # Returns the positions of the cars closest to a target spec ({spec name: value}), with their distance, the closest first
+    # weights: {spec name: weight}, 1 for the specs left out; candidates: a mask of the cars that may be returned
+    def get_nearest_positions(self, target, count, weights=None, candidates=None):
+        weights = weights or {}
+        target_values = np.array([target.get(feature, np.nan) if target.get(feature) is not None else np.nan
+                                  for feature in SIMILARITY_FEATURES], dtype=np.float64)
+        # Only the specs of the target are compared
+        feature_weights = np.array([weights.get(feature, 1.0) for feature in SIMILARITY_FEATURES], dtype=np.float32)
+        feature_weights[np.isnan(target_values)] = 0
+        total_weight = feature_weights.sum()
+        if total_weight <= 0 or len(self.row_ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        normalized_target = np.nan_to_num((target_values - self.means) / self.deviations).astype(np.float32)
+
+        # Weighted mean of the squared differences, so distances stay comparable whatever the weights
+        squared_distances = ((self.features - normalized_target) ** 2 * self.present) @ feature_weights
+        missing_weights = total_weight - self.present @ feature_weights
+        distances = np.sqrt((squared_distances + missing_weights * MISSING_SPEC_DISTANCE ** 2) / total_weight)
+        if candidates is not None:
+            distances[~candidates] = np.inf
+
+        count = min(count, int(np.count_nonzero(np.isfinite(distances))))
+        if count <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        # Only the closest cars are sorted
+        positions = np.argpartition(distances, count - 1)[:count]
+        positions = positions[np.argsort(distances[positions], kind="stable")]
+        return positions, distances[positions]
+
+
+# Returns the similarity index of a table, built from the current snapshot (so it is built again when the database file changed)
+# Returns None without a snapshot (NumPy missing, database unreadable, ...)
+def get_similarity_index(database_path, table_name):
+    snapshot = get_snapshot(database_path, table_name)
+    if snapshot is None:
+        return None
+    similarity_index = similarity_indexes.get((database_path, table_name))
+    if similarity_index is None or similarity_index.snapshot is not snapshot:
+        similarity_index = SimilarityIndex(snapshot)
+        similarity_indexes[(database_path, table_name)] = similarity_index
+    return similarity_index
+
+
+# Returns the cars closest to a target spec ({spec name: value}, the specs left out are not compared) as (rowid, distance) pairs,
+#   the closest first
+# weights: {spec name: weight}, 1 for the specs left out; with a search (a SearchSpec) only the cars it finds are returned,
+#   and the cars in excluded_row_ids are never returned
+# Returns None when the similarity index cannot be used (NumPy missing)
+# Raises sqlite3.Error if the database cannot be searched
+def find_similar_cars(database_path, table_name, target, count=DEFAULT_SIMILAR_CAR_COUNT, weights=None, search_spec=None,
+                      excluded_row_ids=()):
+    similarity_index = get_similarity_index(database_path, table_name)
+    if similarity_index is None:
+        return None
+    candidates = None
+    if search_spec is not None or len(excluded_row_ids):
+        candidates = np.ones(len(similarity_index.row_ids), dtype=bool)
+        if search_spec is not None:
+            candidates[:] = False
+            candidates[np.searchsorted(similarity_index.row_ids, np.asarray(find_matching_row_ids(database_path, table_name, search_spec),
+                                                                            dtype=np.int64))] = True
+        excluded_row_ids = np.asarray(excluded_row_ids, dtype=np.int64)
+        excluded_positions = np.searchsorted(similarity_index.row_ids, excluded_row_ids)
+        in_table = excluded_positions < len(similarity_index.row_ids)
+        in_table[in_table] = similarity_index.row_ids[excluded_positions[in_table]] == excluded_row_ids[in_table]
+        candidates[excluded_positions[in_table]] = False
+    positions, distances = similarity_index.get_nearest_positions(target, count, weights, candidates)
+    return [(int(row_id), float(distance)) for row_id, distance in zip(similarity_index.row_ids[positions], distances)]
+
+
+# Returns the cars most like the given cars (rowids, such as every car of a model), which are left out of the results
+#   along with excluded_row_ids
+# The target is the average of their specs
+# Returns None when the similarity index cannot be used, and an empty list when none of the cars is in the table
+# Raises sqlite3.Error if the database cannot be searched
+def find_cars_like(database_path, table_name, row_ids, count=DEFAULT_SIMILAR_CAR_COUNT, weights=None, search_spec=None,
+                   excluded_row_ids=()):
+    similarity_index = get_similarity_index(database_path, table_name)
+    if similarity_index is None:
+        return None
+    target = similarity_index.get_car_specs(row_ids)
+    if not target:
+        return []
+    excluded_row_ids = np.concatenate([np.asarray(row_ids, dtype=np.int64), np.asarray(excluded_row_ids, dtype=np.int64)])
+    return find_similar_cars(database_path, table_name, target, count, weights, search_spec, excluded_row_ids)
+
+
+# Returns the {spec name: number} given on the command line as name=number items
+# Raises ValueError for an unknown spec or a value that is not a number
+def parse_specs(items):
+    specs = {}
+    for item in items or []:
+        name, _, value = item.partition("=")
+        if name not in SIMILARITY_FEATURES:
+            raise ValueError(f"Unknown spec {name!r}, the specs are: {', '.join(SIMILARITY_FEATURES)}")
+        specs[name] = float(value)
+    return specs
+
+
+# Maintenance command, for example:
+#   python similar_cars.py car_database.db --car 1234  (the cars most like the car with rowid 1234)
+#   python similar_cars.py car_database.db --target engine_hp=300 curb_weight_kg=1400 --weight engine_hp=2 --country-of-origin Japan
+#   python similar_cars.py car_database.db --benchmark 1000  (times queries for random cars)
+if __name__ == "__main__":
+    from car_search import add_search_arguments, get_column_names, get_search_spec_from_arguments, iterate_rows_by_id
+    from search_spec import SearchSpec
+
+    parser = argparse.ArgumentParser(description="Finds the cars most similar to a car or to a target spec")
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("--table", default="car_db_metric")
+    parser.add_argument("--car", type=int, action="append", help="rowid of a reference car (repeat to average several cars)")
+    parser.add_argument("--target", nargs="+", metavar="SPEC=VALUE", help=f"target spec, among: {', '.join(SIMILARITY_FEATURES)}")
+    parser.add_argument("--weight", nargs="+", metavar="SPEC=WEIGHT", help="weight of a spec (1 by default)")
+    parser.add_argument("--count", type=int, default=DEFAULT_SIMILAR_CAR_COUNT)
+    parser.add_argument("--benchmark", type=int, metavar="QUERIES", help="time this many queries for random cars")
+    add_search_arguments(parser)
+    arguments = parser.parse_args()
+    try:
+        search_spec = get_search_spec_from_arguments(arguments)
+        target = parse_specs(arguments.target)
+        weights = parse_specs(arguments.weight)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not arguments.car and not target and not arguments.benchmark:
+        parser.error("give a reference car (--car), a target spec (--target) or --benchmark")
+
+    try:
+        start_time = time.perf_counter()
+        similarity_index = get_similarity_index(arguments.database_path, arguments.table)
+        if similarity_index is None:
+            print("The similarity search needs NumPy")
+            raise SystemExit(1)
+        print(f"Index of {len(similarity_index.row_ids)} cars ready in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+        # The search filters nothing unless search options were given
+        search_spec = search_spec if search_spec != SearchSpec() else None
+
+        if arguments.benchmark:
+            random_generator = random.Random(0)
+            times = []
+            for _ in range(arguments.benchmark):
+                row_id = int(random_generator.choice(similarity_index.row_ids))
+                start_time = time.perf_counter()
+                find_cars_like(arguments.database_path, arguments.table, [row_id], arguments.count, weights, search_spec)
+                times.append(time.perf_counter() - start_time)
+            times.sort()
+            print(f"{len(times)} queries: p50 {times[len(times) // 2] * 1000:.2f} ms, "
+                  f"p95 {times[int(len(times) * 0.95)] * 1000:.2f} ms, max {times[-1] * 1000:.2f} ms")
+        else:
+            if arguments.car:
+                similar_cars = find_cars_like(arguments.database_path, arguments.table, arguments.car, arguments.count, weights, search_spec)
+                target = similarity_index.get_car_specs(arguments.car)
+            else:
+                similar_cars = find_similar_cars(arguments.database_path, arguments.table, target, arguments.count, weights, search_spec)
+            print("Target: " + ", ".join(f"{feature} {value:g}" for feature, value in target.items()))
+            column_names = get_column_names(arguments.database_path, arguments.table)
+            rows = iterate_rows_by_id(arguments.database_path, arguments.table, [row_id for row_id, _ in similar_cars])
+            for (row_id, distance), row in zip(similar_cars, rows):
+                car = dict(zip(column_names, row))
+                specs = similarity_index.get_car_specs([row_id])
+                print(f"{distance:.3f}  {car['make']} {car['model']} {car['trim'] or ''} ({car['year_from']:g}): "
+                      + ", ".join(f"{feature} {value:g}" for feature, value in specs.items()))
+    except sqlite3.Error as e:
+        print("An error occurred while searching:", e)
+        raise SystemExit(1)
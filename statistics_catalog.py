@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from connection_pool import get_connection_pool, get_database_fingerprint
+from tracing import trace_span
+
+
+# The statistics catalog stores every slider range (min/max) of the car table in a small JSON file next to the database,
+#   so that the GUI does not need to scan the whole table every time it needs a range.
+# The catalog is only trusted while the database file has the same modification time and size as when it was computed
+
+# Bumped whenever the layout of the catalog file changes, older files are then simply recomputed
+CATALOG_VERSION = 1
+
+# In-memory copies of the catalogs, keyed by the database path
+loaded_catalogs = {}
+
+
+# Returns the path of the catalog file that belongs to a database
+def get_catalog_path(database_path):
+    return f"{database_path}.catalog.json"
+
+
+# Computes all the slider ranges in one single pass over the table
+# The values are processed the same way the old get_min_max_* methods did, so the sliders keep the same limits
+def compute_column_statistics(database_path, table_name):
+    cursor = get_connection_pool(database_path).execute(
+        f"SELECT MIN(year_from), MAX(year_to), "
+        f"MIN(number_of_seats), MAX(number_of_seats), "
+        f"MIN(engine_hp), MAX(engine_hp), "
+        f"MIN(curb_weight_kg), MAX(curb_weight_kg), "
+        f"MIN(engine_hp / NULLIF(curb_weight_kg, 0)), MAX(engine_hp / NULLIF(curb_weight_kg, 0)), "
+        f"MIN(capacity_cm3), MAX(capacity_cm3), "
+        f"MIN(CASE WHEN max_speed_km_per_h NOT LIKE '%[^0-9.]%' THEN CAST(max_speed_km_per_h AS REAL) END), "
+        f"MAX(CASE WHEN max_speed_km_per_h NOT LIKE '%[^0-9.]%' THEN CAST(max_speed_km_per_h AS REAL) END) "
+        f"FROM {table_name}")
+    row = cursor.fetchone()
+
+    (year_min, year_max, seats_min, seats_max, engine_hp_min, engine_hp_max, curb_weight_min, curb_weight_max,
+     power_to_weight_min, power_to_weight_max, displacement_min, displacement_max, top_speed_min, top_speed_max) = row
+
+    # Seats are stored as text such as "5, 7", so the smallest and biggest number of each value are used
+    if seats_min is not None:
+        seats_min = min(int(number.strip()) for number in str(seats_min).split(','))
+    if seats_max is not None:
+        seats_max = max(int(number.strip()) for number in str(seats_max).split(','))
+
+    return {
+        "year": [round(year_min) if year_min is not None else None, round(year_max) if year_max is not None else None],
+        "seating_capacity": [seats_min, seats_max],
+        "engine_hp": [engine_hp_min, engine_hp_max],
+        "curb_weight": [curb_weight_min, curb_weight_max],
+        "power_to_weight_ratio": [round(power_to_weight_min, 2) if power_to_weight_min is not None else None,
+                                  round(power_to_weight_max, 2) if power_to_weight_max is not None else None],
+        "displacement": [displacement_min, displacement_max],
+        "top_speed": [top_speed_min, top_speed_max],
+        }
+
+
+# Computes the brand catalog: every brand with its number of cars and of distinct models, sorted by brand
+# Stored as a list of [brand, car count, model count] so that the order survives the JSON file
+def compute_brand_catalog(database_path, table_name):
+    cursor = get_connection_pool(database_path).execute(
+        f"SELECT make, COUNT(*), COUNT(DISTINCT model) FROM {table_name} WHERE make IS NOT NULL GROUP BY make ORDER BY make")
+    brands = [list(row) for row in cursor.fetchall()]
+    cursor.close()
+    return brands
+
+
+# Reads the catalog file from the disk, returns None if it is missing, unreadable or from an older version
+def load_catalog_file(database_path):
+    try:
+        with open(get_catalog_path(database_path), "r") as file:
+            catalog = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(catalog, dict) or catalog.get("version") != CATALOG_VERSION:
+        return None
+    return catalog
+
+
+# Writes the catalog file next to the database
+# The file is written under a temporary name first so that a crash can never leave a half written catalog
+def save_catalog_file(database_path, catalog):
+    catalog_path = get_catalog_path(database_path)
+    temporary_path = f"{catalog_path}.tmp"
+    try:
+        with open(temporary_path, "w") as file:
+            json.dump(catalog, file)
+        os.replace(temporary_path, catalog_path)
+    except OSError as e:
+        # The catalog still works from memory if the folder is read-only
+        print("Could not save the statistics catalog:", e)
+
+
+# Returns the catalog of the database, making sure it matches the current database file
+# Order of lookup: memory, then the catalog file, and only if both are stale is the database scanned again
+def get_catalog(database_path):
+    fingerprint = get_database_fingerprint(database_path)
+
+    catalog = loaded_catalogs.get(database_path)
+    if catalog is not None and catalog["fingerprint"] == fingerprint:
+        return catalog
+
+    catalog = load_catalog_file(database_path)
+    if catalog is None or catalog["fingerprint"] != fingerprint:
+        catalog = {"version": CATALOG_VERSION, "fingerprint": fingerprint, "tables": {}}
+
+    loaded_catalogs[database_path] = catalog
+    return catalog
+
+
+# Returns the catalog section of a single table, computing it (and saving the catalog) if it is not present yet
+def get_table_catalog(database_path, table_name):
+    catalog = get_catalog(database_path)
+    table_catalog = catalog["tables"].setdefault(table_name, {})
+    if "statistics" not in table_catalog:
+        table_catalog["statistics"] = compute_column_statistics(database_path, table_name)
+        save_catalog_file(database_path, catalog)
+    return table_catalog
+
+
+# Returns the brand catalog of a table ([brand, car count, model count] sorted by brand), computing it if needed
+# Raises sqlite3.Error if it cannot be computed
+def get_brand_catalog(database_path, table_name):
+    table_catalog = get_table_catalog(database_path, table_name)
+    if "brands" not in table_catalog:
+        table_catalog["brands"] = compute_brand_catalog(database_path, table_name)
+        save_catalog_file(database_path, get_catalog(database_path))
+    return table_catalog["brands"]
+
+
+# Used by the maintenance steps that add their own tables or indexes to the database
+# They change the database file but not the car data, so instead of throwing the catalog away
+#   it is stamped with the new fingerprint (and saved) once the "with" block is done
+@contextmanager
+def keep_catalog_valid(database_path):
+    catalog = get_catalog(database_path)
+    yield catalog
+    catalog["fingerprint"] = get_database_fingerprint(database_path)
+    save_catalog_file(database_path, catalog)
+
+
+# Returns the min or the max of a column range, based on the min_max_flag ("min" or "max")
+# Raises sqlite3.Error if the statistics cannot be computed
+def get_column_range(database_path, table_name, range_name, min_max_flag):
+    with trace_span("column range", range=range_name, flag=min_max_flag):
+        column_range = get_table_catalog(database_path, table_name)["statistics"][range_name]
+    if min_max_flag == "min":
+        return column_range[0]
+    elif min_max_flag == "max":
+        return column_range[1]
+    return None
+
+
+# Forgets the in-memory catalogs, the next lookup reads the catalog file (or the database) again
+def clear_loaded_catalogs():
+    loaded_catalogs.clear()
+
+
+# The way the brand list was read before the brand catalog: every make of the table, deduplicated in Python
+def read_brand_names_from_table(database_path, table_name):
+    rows = get_connection_pool(database_path).execute(f"SELECT make FROM {table_name}").fetchall()
+    return sorted({row[0] for row in rows if row[0] is not None})
+
+
+# Returns the time (ms) and the peak memory (KiB) of loading the brand lists of both pages
+def measure_brand_list_startup(load_brand_names):
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    load_brand_names()
+    elapsed_time = (time.perf_counter() - start_time) * 1000
+    peak_memory = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return elapsed_time, peak_memory
+
+
+# Maintenance command, for example:
+#   python statistics_catalog.py brands car_database.db (prints every brand with its number of cars and models)
+#   python statistics_catalog.py benchmark car_database.db (time and peak memory of the brand lists on startup)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shows the brand catalog or benchmarks the brand lists on startup")
+    parser.add_argument("command", choices=["brands", "benchmark"])
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("--table", default="car_db_metric")
+    arguments = parser.parse_args()
+
+    if arguments.command == "brands":
+        for brand, car_count, model_count in get_brand_catalog(arguments.database_path, arguments.table):
+            print(f"{brand}: {car_count} cars, {model_count} models")
+    elif arguments.command == "benchmark":
+        # Before: both brand dropdowns read the whole make column
+        before = measure_brand_list_startup(
+            lambda: [read_brand_names_from_table(arguments.database_path, arguments.table) for _ in range(2)])
+        # After: the brand catalog is read once from the catalog file and shared by both dropdowns
+        get_brand_catalog(arguments.database_path, arguments.table)
+        clear_loaded_catalogs()
+        after = measure_brand_list_startup(
+            lambda: [brand[0] for brand in get_brand_catalog(arguments.database_path, arguments.table)])
+        print(f"Before: {before[0]:.2f} ms, peak memory {before[1]:.0f} KiB")
+        print(f"After:  {after[0]:.2f} ms, peak memory {after[1]:.0f} KiB")
@@ -0,0 +1,328 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+
+
+# Synthetic car databases: tables shaped like car_db_metric (the same columns, holding the same kinds of values and spellings),
+#   with as many cars as needed, for benchmarks and for checkouts without the car_database.db LFS file
+# The brands, countries, fuel types, ... are skewed the way the real table is (a few big brands and fuel types, a long tail),
+#   and the values that belong together (brand and country, engine size and power, ...) are generated together
+# The cars are generated a chunk at a time, each chunk from its own seed, so a database only depends on its seed and its size,
+#   and a smaller database holds the first cars of a bigger one
+
+# Columns of car_db_metric, in table order
+CAR_COLUMNS = [
+    "id_trim", "make", "model", "generation", "year_from", "year_to", "series", "trim", "body_type", "load_height_mm",
+    "number_of_seats", "length_mm", "width_mm", "height_mm", "wheelbase_mm", "front_track_mm", "rear_track_mm", "curb_weight_kg",
+    "wheel_size_r14", "ground_clearance_mm", "trailer_load_with_brakes_kg", "payload_kg", "back_track_width_mm",
+    "front_track_width_mm", "clearance_mm", "full_weight_kg", "front_rear_axle_load_kg", "max_trunk_capacity_l",
+    "cargo_compartment_length_width_height_mm", "cargo_volume_m3", "minimum_trunk_capacity_l", "maximum_torque_n_m",
+    "turnover_of_maximum_torque_rpm", "injection_type", "overhead_camshaft", "cylinder_layout", "number_of_cylinders",
+    "compression_ratio", "engine_type", "valves_per_cylinder", "boost_type", "cylinder_bore_mm", "stroke_cycle_mm",
+    "engine_placement", "cylinder_bore_and_stroke_cycle_mm", "max_power_kw", "presence_of_intercooler", "capacity_cm3", "engine_hp",
+    "engine_hp_rpm", "drive_wheels", "bore_stroke_ratio", "number_of_gears", "turning_circle_m", "transmission",
+    "mixed_fuel_consumption_per_100_km_l", "range_km", "emission_standards", "fuel_tank_capacity_l", "acceleration_0_100_km_h_s",
+    "max_speed_km_per_h", "city_fuel_per_100km_l", "co2_emissions_g_km", "fuel_grade", "highway_fuel_per_100km_l",
+    "back_suspension", "rear_brakes", "front_brakes", "front_suspension", "steering_type", "car_class", "country_of_origin",
+    "number_of_doors", "safety_assessment", "rating_name", "battery_capacity_kw_per_h", "electric_range_km", "charging_time_h",
+    "website",
+    ]
+# Numeric columns, every other column holds text
+INTEGER_COLUMNS = {"id_trim", "year_from", "year_to", "curb_weight_kg", "full_weight_kg", "number_of_cylinders", "capacity_cm3",
+                   "engine_hp", "engine_hp_rpm", "length_mm", "width_mm", "height_mm", "wheelbase_mm", "ground_clearance_mm",
+                   "maximum_torque_n_m", "max_power_kw", "number_of_gears", "fuel_tank_capacity_l", "max_trunk_capacity_l",
+                   "valves_per_cylinder", "number_of_doors", "co2_emissions_g_km", "range_km", "electric_range_km"}
+REAL_COLUMNS = {"cylinder_bore_mm", "stroke_cycle_mm", "bore_stroke_ratio", "compression_ratio", "acceleration_0_100_km_h_s",
+                "mixed_fuel_consumption_per_100_km_l", "city_fuel_per_100km_l", "highway_fuel_per_100km_l", "turning_circle_m",
+                "battery_capacity_kw_per_h", "charging_time_h"}
+
+# Brands with their country of origin and a few of their models, the biggest brands first
+# The share of cars of a brand falls with its rank (BRAND_SKEW), like in the real table
+BRANDS = [
+    ("Toyota", "Japan", ["Corolla", "Camry", "Land Cruiser", "RAV4", "Hilux", "Yaris", "Supra", "Prius"]),
+    ("Mercedes-Benz", "Germany", ["C-Class", "E-Class", "S-Class", "G-Class", "Sprinter", "SL-Class"]),
+    ("Nissan", "Japan", ["Skyline", "Sunny", "Patrol", "Micra", "Qashqai", "GT-R", "Leaf"]),
+    ("Volkswagen", "Germany", ["Golf", "Passat", "Polo", "Transporter", "Beetle", "Tiguan"]),
+    ("BMW", "Germany", ["3 Series", "5 Series", "7 Series", "X5", "M3", "Z4", "i3"]),
+    ("Ford", "United States", ["Focus", "Mustang", "F-150", "Fiesta", "Transit", "Explorer"]),
+    ("Honda", "Japan", ["Civic", "Accord", "CR-V", "Fit", "NSX", "S2000"]),
+    ("Audi", "Germany", ["A4", "A6", "Q7", "TT", "R8", "e-tron"]),
+    ("Mitsubishi", "Japan", ["Lancer", "Pajero", "Outlander", "Galant"]),
+    ("Chevrolet", "United States", ["Camaro", "Corvette", "Silverado", "Malibu", "Tahoe"]),
+    ("Mazda", "Japan", ["MX-5", "RX-7", "RX-8", "3", "6", "CX-5"]),
+    ("Peugeot", "France", ["206", "307", "405", "508", "Partner"]),
+    ("Renault", "France", ["Clio", "Megane", "Laguna", "Kangoo", "Zoe"]),
+    ("Opel", "Germany", ["Astra", "Corsa", "Vectra", "Zafira"]),
+    ("Hyundai", "South Korea", ["Solaris", "Elantra", "Tucson", "Santa Fe", "Ioniq"]),
+    ("Subaru", "Japan", ["Impreza", "Legacy", "Forester", "BRZ"]),
+    ("Kia", "South Korea", ["Rio", "Ceed", "Sportage", "Sorento"]),
+    ("Lada", "Russia", ["2107", "Niva", "Priora", "Granta", "Vesta"]),
+    ("Fiat", "Italy", ["Punto", "Panda", "500", "Uno", "Ducato"]),
+    ("Volvo", "Sweden", ["240", "XC90", "S60", "V70"]),
+    ("Porsche", "Germany", ["911", "Cayenne", "Boxster", "Panamera", "Taycan"]),
+    ("Citroen", "France", ["C4", "Berlingo", "Xsara", "DS"]),
+    ("Skoda", "Czech Republic", ["Octavia", "Fabia", "Superb"]),
+    ("Land Rover", "United Kingdom", ["Defender", "Discovery", "Range Rover"]),
+    ("Jaguar", "United Kingdom", ["XJ", "E-Type", "F-Type"]),
+    ("Ferrari", "Italy", ["F40", "458", "Testarossa", "Enzo"]),
+    ("Lamborghini", "Italy", ["Countach", "Diablo", "Huracan", "Aventador"]),
+    ("Alfa Romeo", "Italy", ["Giulia", "156", "Spider"]),
+    ("Dodge", "United States", ["Charger", "Challenger", "Viper", "Ram"]),
+    ("Tesla", "United States", ["Model S", "Model 3", "Model X", "Model Y"]),
+    ("Seat", "Spain", ["Ibiza", "Leon", "Toledo"]),
+    ("Dacia", "Romania", ["Logan", "Duster", "Sandero"]),
+    ("Chery", "China", ["Tiggo", "Amulet"]),
+    ("Geely", "China", ["Emgrand", "Atlas"]),
+    ("Tata", "India", ["Nano", "Indica"]),
+    ("Proton", "Malaysia", ["Saga", "Persona"]),
+    ("Rolls-Royce", "United Kingdom", ["Phantom", "Ghost"]),
+    ("Bugatti", "France", ["Veyron", "Chiron"]),
+    ("Koenigsegg", "Sweden", ["Agera", "Regera"]),
+    ("Holden", "Australia", ["Commodore", "Monaro"]),
+    ("Iran Khodro", "Iran", ["Samand", "Paykan"]),
+    ("ZAZ", "Ukraine", ["Zaporozhets", "Lanos"]),
+    ("Luxgen", "Taiwan", ["U6"]),
+    ("Troller", "Brazil", ["T4"]),
+    ("Spyker", "Netherlands", ["C8"]),
+    ("Rimac", "Croatia", ["Nevera"]),
+    ("Tofas", "Turkey", ["Sahin"]),
+    ("Zastava", "Serbia", ["Yugo"]),
+    ]
+BRAND_SKEW = 1.1
+# Share of the models of a brand that are not in its list above, named after the brand and a number
+OTHER_MODEL_SHARE = 0.6
+OTHER_MODEL_COUNT = 40
+
+# Values of the columns read by the checkbox filters, with every spelling of categorical_values.json, as (value, weight)
+# None is a car without the value
+ENGINE_TYPES = [("Gasoline", 58), ("petrol", 6), ("Gas", 1), ("Gasoline, Gas", 1), ("Petrol", 1), ("Diesel", 17), ("diesel", 2),
+                ("Hybrid", 4), ("hybrid", 1), ("Electric", 3), ("Liquefied coal hydrogen gases", 0.1), (None, 6)]
+ENGINE_PLACEMENTS = [("front, cross-section", 35), ("front, longitudinal", 25), ("Front", 8), ("Front, longitudinally", 2),
+                     ("mid-engine", 3), ("central", 1), ("rear", 3), (None, 23)]
+DRIVE_WHEELS = [("Front wheel drive", 45), ("Rear wheel drive", 25), ("full", 10), ("All wheel drive (AWD)", 8),
+                ("Four wheel drive (4WD)", 4), ("Constant all wheel drive", 2), (None, 6)]
+TRANSMISSIONS = [("Manual", 45), ("Automatic", 30), ("robot", 5), ("Continuously variable transmission (CVT)", 6),
+                 ("Electronic with 1 clutch", 1), ("Electronic with 2 clutch", 3), (None, 10)]
+CYLINDER_LAYOUTS = [("Inline", 60), ("inline", 5), ("V-type", 20), ("V-type with small angle", 1), ("Opposed", 3), ("opposed", 1),
+                    ("W-type", 0.5), ("Rotary", 0.3), ("rotor", 0.2), (None, 9)]
+CYLINDER_COUNTS = [(4, 55), (6, 18), (8, 9), (3, 5), (5, 4), (12, 2), (2, 1), (10, 1), (1, 0.2), (7, 0.05), (16, 0.05), (None, 5)]
+SERIES = [("Sedan", 30), ("Hatchback 5 doors", 14), ("Hatchback 3 doors", 6), ("SUV 5 doors", 14), ("Wagon", 8), ("Coupe", 6),
+          ("Cabriolet", 3), ("Minivan", 4), ("Liftback", 2), ("Crossover", 3), ("Pickup", 3), ("Roadster", 1.5), ("Van", 2),
+          ("Fastback", 0.5), ("Spyder", 0.3), ("Targa", 0.3), ("Limousine", 0.3), ("Speedster", 0.1), (None, 2)]
+SEAT_COUNTS = [("5", 60), ("4", 12), ("2", 6), ("7", 6), ("5, 7", 4), ("2, 4", 2), ("8", 2), ("9", 1), (None, 7)]
+# Values of a few descriptive columns, picked without any relation to the rest of the car
+TEXT_VALUES = {
+    "injection_type": ["Multi-point fuel injection", "Direct injection", "Carburettor", "Common Rail", "Monoinjector"],
+    "overhead_camshaft": ["DOHC", "SOHC", "OHV"],
+    "boost_type": ["Turbo", "none", "Supercharger", "Twin-Turbo"],
+    "presence_of_intercooler": ["Intercooler"],
+    "emission_standards": ["EURO III", "EURO IV", "EURO V", "EURO VI"],
+    "fuel_grade": ["95", "92", "98", "DT"],
+    "back_suspension": ["Multi wishbone", "Semi-dependent", "Dependent, spring", "Independent, wishbone"],
+    "front_suspension": ["Independent, Spring", "McPherson", "Double wishbone"],
+    "rear_brakes": ["Disc", "Drum", "Ventilated disc"],
+    "front_brakes": ["Ventilated disc", "Disc"],
+    "steering_type": ["Rack and pinion", "Screw"],
+    "car_class": ["A", "B", "C", "D", "E", "F", "J", "M", "S"],
+    "safety_assessment": ["Euro NCAP", "IIHS"],
+    "rating_name": ["*****", "****", "***"],
+    "body_type": ["Monocoque", "Body-on-frame"],
+    }
+# Ranges of the numbers of a few descriptive columns, the other numbers are between 1 and 5000
+NUMBER_RANGES = {
+    "length_mm": (3000, 5500), "width_mm": (1450, 2100), "height_mm": (1050, 2000), "wheelbase_mm": (2000, 3500),
+    "ground_clearance_mm": (90, 300), "maximum_torque_n_m": (80, 900), "number_of_gears": (4, 9), "fuel_tank_capacity_l": (30, 120),
+    "max_trunk_capacity_l": (100, 2000), "valves_per_cylinder": (2, 5), "number_of_doors": (2, 5), "co2_emissions_g_km": (90, 400),
+    "range_km": (300, 1200), "compression_ratio": (8, 22), "acceleration_0_100_km_h_s": (2.5, 20),
+    "mixed_fuel_consumption_per_100_km_l": (3, 20), "city_fuel_per_100km_l": (4, 25), "highway_fuel_per_100km_l": (3, 15),
+    "turning_circle_m": (9, 14), "charging_time_h": (0.5, 12),
+    }
+# Share of the cars without a value in the columns no filter reads
+OTHER_COLUMN_NULL_SHARE = 0.45
+
+# Cars generated (and inserted) at a time, each chunk has its own seed
+GENERATOR_CHUNK_SIZE = 10000
+# Sizes of the benchmark databases
+ROW_COUNT_PRESETS = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "5m": 5_000_000}
+
+
+# Returns the values and the cumulative weights of a list of (value, weight), for random.choices
+def get_weighted_choices(weighted_values):
+    values = [value for value, _ in weighted_values]
+    cumulative_weights = []
+    total_weight = 0
+    for _, weight in weighted_values:
+        total_weight += weight
+        cumulative_weights.append(total_weight)
+    return values, cumulative_weights
+
+
+# Returns the brands (name, country, models) and the cumulative weights of picking each of them
+def get_brand_choices():
+    brands = []
+    for name, country, known_models in BRANDS:
+        other_models = [f"{name} {number}" for number in range(1, OTHER_MODEL_COUNT + 1)]
+        brands.append((name, country, known_models, other_models))
+    return get_weighted_choices([(brand, 1 / rank ** BRAND_SKEW) for rank, brand in enumerate(brands, 1)])
+
+
+# Returns the value of a descriptive column that no filter reads (a number or a word), or None
+def generate_other_value(generator, column_name):
+    if generator.random() < OTHER_COLUMN_NULL_SHARE:
+        return None
+    if column_name in TEXT_VALUES:
+        return generator.choice(TEXT_VALUES[column_name])
+    low, high = NUMBER_RANGES.get(column_name, (1, 5000))
+    if column_name in REAL_COLUMNS:
+        return round(generator.uniform(low, high), 1)
+    if column_name in INTEGER_COLUMNS:
+        return generator.randint(low, high)
+    return f"{generator.randint(100, 2000)}-{generator.randint(100, 2000)}"
+
+
+# Columns set by generate_car_chunk from the rest of the car, the other columns get unrelated values
+GENERATED_COLUMNS = {
+    "id_trim", "make", "model", "generation", "year_from", "year_to", "series", "trim", "number_of_seats", "curb_weight_kg",
+    "full_weight_kg", "cylinder_layout", "number_of_cylinders", "engine_type", "cylinder_bore_mm", "stroke_cycle_mm", "engine_placement",
+    "cylinder_bore_and_stroke_cycle_mm", "max_power_kw", "capacity_cm3", "engine_hp", "engine_hp_rpm", "drive_wheels",
+    "bore_stroke_ratio", "transmission", "max_speed_km_per_h", "country_of_origin", "battery_capacity_kw_per_h", "electric_range_km",
+    "website",
+    }
+
+
+# Returns the cars of a chunk (tuples in CAR_COLUMNS order), their ids following the ids of the previous chunks
+def generate_car_chunk(seed, chunk_index, car_count):
+    generator = random.Random(f"{seed}-{chunk_index}")
+    brand_choices = get_brand_choices()
+    weighted_columns = {column_name: get_weighted_choices(weighted_values) for column_name, weighted_values in [
+        ("engine_type", ENGINE_TYPES), ("engine_placement", ENGINE_PLACEMENTS), ("drive_wheels", DRIVE_WHEELS),
+        ("transmission", TRANSMISSIONS), ("cylinder_layout", CYLINDER_LAYOUTS), ("number_of_cylinders", CYLINDER_COUNTS),
+        ("series", SERIES), ("number_of_seats", SEAT_COUNTS)]}
+    # The skewed columns are drawn for the whole chunk at once
+    picked_values = {column_name: generator.choices(values, cum_weights=cumulative_weights, k=car_count)
+                     for column_name, (values, cumulative_weights) in weighted_columns.items()}
+    picked_brands = generator.choices(brand_choices[0], cum_weights=brand_choices[1], k=car_count)
+    other_columns = [column_name for column_name in CAR_COLUMNS if column_name not in GENERATED_COLUMNS]
+
+    cars = []
+    for index in range(car_count):
+        brand, country, known_models, other_models = picked_brands[index]
+        car = {column_name: picked_values[column_name][index] for column_name in picked_values}
+        car["id_trim"] = chunk_index * GENERATOR_CHUNK_SIZE + index
+        car["make"] = brand
+        # The first models of a brand are the most common ones
+        models = known_models if generator.random() >= OTHER_MODEL_SHARE else other_models
+        car["model"] = models[int(generator.random() ** 2 * len(models))]
+        car["generation"] = f"{car['model']} {generator.randint(1, 8)} generation"
+        car["country_of_origin"] = country if generator.random() < 0.93 else None
+        # Most cars are recent
+        car["year_from"] = 2024 - int(75 * generator.random() ** 1.8)
+        car["year_to"] = min(2024, car["year_from"] + generator.randint(0, 8)) if generator.random() < 0.8 else None
+        car["trim"] = f"{generator.choice(['1.4', '1.6', '2.0', '2.5', '3.0', '4.4'])} {generator.choice(['MT', 'AT', 'CVT', 'AMT'])}"
+        car["website"] = f"https://www.{brand.lower().replace(' ', '-')}.com"
+
+        if car["engine_type"] == "Electric":
+            car["number_of_cylinders"] = car["cylinder_layout"] = car["cylinder_bore_mm"] = car["stroke_cycle_mm"] = None
+            car["capacity_cm3"] = None
+            car["engine_hp"] = generator.randint(80, 1000)
+            car["battery_capacity_kw_per_h"] = round(generator.uniform(20, 110), 1)
+            car["electric_range_km"] = generator.randint(100, 650)
+        else:
+            cylinder_count = car["number_of_cylinders"] or 4
+            car["capacity_cm3"] = int(cylinder_count * generator.uniform(250, 650)) if generator.random() < 0.95 else None
+            car["engine_hp"] = (int((car["capacity_cm3"] or 1600) * generator.uniform(0.04, 0.13))
+                                if generator.random() < 0.92 else None)
+            if generator.random() < 0.8:
+                car["cylinder_bore_mm"] = round(generator.uniform(65, 105), 1)
+                # A few engines are exactly square
+                car["stroke_cycle_mm"] = (car["cylinder_bore_mm"] if generator.random() < 0.05
+                                          else round(car["cylinder_bore_mm"] * generator.uniform(0.8, 1.2), 1))
+            else:
+                car["cylinder_bore_mm"] = car["stroke_cycle_mm"] = None
+            car["battery_capacity_kw_per_h"] = car["electric_range_km"] = None
+        car["engine_hp_rpm"] = generator.randint(3000, 9000) if car["engine_hp"] is not None and generator.random() < 0.85 else None
+        car["max_power_kw"] = round(car["engine_hp"] * 0.7355) if car["engine_hp"] is not None else None
+        car["curb_weight_kg"] = max(500, int(generator.gauss(1450, 380))) if generator.random() < 0.85 else None
+        car["full_weight_kg"] = car["curb_weight_kg"] + generator.randint(300, 700) if car["curb_weight_kg"] is not None else None
+        # Top speeds are stored as text, a few with a thousands separator or with their unit
+        if car["engine_hp"] is not None and generator.random() < 0.75:
+            top_speed = min(490, int(110 + car["engine_hp"] * generator.uniform(0.2, 0.4)))
+            car["max_speed_km_per_h"] = str(top_speed) if generator.random() < 0.98 else f"{top_speed} km/h"
+        else:
+            car["max_speed_km_per_h"] = None
+        if car["stroke_cycle_mm"] is not None:
+            car["bore_stroke_ratio"] = round(car["cylinder_bore_mm"] / car["stroke_cycle_mm"], 2)
+            car["cylinder_bore_and_stroke_cycle_mm"] = f"{car['cylinder_bore_mm']} x {car['stroke_cycle_mm']}"
+        else:
+            car["bore_stroke_ratio"] = car["cylinder_bore_and_stroke_cycle_mm"] = None
+        for column_name in other_columns:
+            car[column_name] = generate_other_value(generator, column_name)
+        cars.append(tuple(car[column_name] for column_name in CAR_COLUMNS))
+    return cars
+
+
+# Returns the declared type of a column
+def get_column_type(column_name):
+    if column_name in INTEGER_COLUMNS:
+        return "INTEGER"
+    if column_name in REAL_COLUMNS:
+        return "REAL"
+    return "TEXT"
+
+
+# Writes a new database with a car_db_metric shaped table of car_count cars
+# The file is written under a temporary name first, so an interrupted run never leaves a half written database behind
+# Raises FileExistsError if the database already exists, so the real database can never be replaced by a synthetic one
+def generate_database(database_path, car_count, seed=1, table_name="car_db_metric"):
+    if os.path.exists(database_path):
+        raise FileExistsError(f"{database_path} already exists")
+    temporary_path = f"{database_path}.tmp"
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+    connection = sqlite3.connect(temporary_path)
+    try:
+        # Nothing needs to survive a crash until the file is renamed
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute(f"CREATE TABLE {table_name} "
+                           f"({', '.join(f'{column_name} {get_column_type(column_name)}' for column_name in CAR_COLUMNS)})")
+        insert_query = f"INSERT INTO {table_name} VALUES ({', '.join(['?'] * len(CAR_COLUMNS))})"
+        for chunk_index, start in enumerate(range(0, car_count, GENERATOR_CHUNK_SIZE)):
+            connection.executemany(insert_query, generate_car_chunk(seed, chunk_index, min(GENERATOR_CHUNK_SIZE, car_count - start)))
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(temporary_path, database_path)
+
+
+# Returns the number of cars of a size given on the command line, either a preset (10k, 100k, 1m, 5m) or a number
+def parse_row_count(text):
+    if text.lower() in ROW_COUNT_PRESETS:
+        return ROW_COUNT_PRESETS[text.lower()]
+    try:
+        return int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text} (a number or one of {', '.join(ROW_COUNT_PRESETS)})")
+
+
+# Maintenance command, for example:
+#   python synthetic_database.py cars_100k.db --rows 100k
+#   python synthetic_database.py cars_5m.db --rows 5m --seed 2
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes a synthetic car database shaped like car_database.db")
+    parser.add_argument("database_path")
+    parser.add_argument("--rows", type=parse_row_count, default=ROW_COUNT_PRESETS["100k"], help="number of cars or 10k/100k/1m/5m")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--table", default="car_db_metric")
+    arguments = parser.parse_args()
+
+    start_time = time.perf_counter()
+    try:
+        generate_database(arguments.database_path, arguments.rows, arguments.seed, arguments.table)
+    except (OSError, sqlite3.Error) as e:
+        parser.error(str(e))
+    print(json.dumps({"database_path": arguments.database_path, "rows": arguments.rows, "seed": arguments.seed,
+                      "seconds": round(time.perf_counter() - start_time, 1)}))
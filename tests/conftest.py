@@ -0,0 +1,42 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+# The modules of the program sit next to AutoMatch.py, one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columnar_engine import set_columnar_engine_enabled
+from parallel_scan import shutdown_process_pools
+from result_cache import clear_result_caches
+from synthetic_database import generate_database
+
+TABLE_NAME = "car_db_metric"
+# Cars of the test database, enough for every checkbox and slider to find cars, small enough to generate in a second
+TEST_CAR_COUNT = 5000
+
+
+# Database generated once for the whole run, never searched itself so it stays cold (no derived table, catalog or snapshot)
+@pytest.fixture(scope="session")
+def generated_database_path(tmp_path_factory):
+    database_path = str(tmp_path_factory.mktemp("generated") / "cars.db")
+    generate_database(database_path, TEST_CAR_COUNT, table_name=TABLE_NAME)
+    return database_path
+
+
+# A fresh copy of the generated database for every test, as the program finds it the first time it is opened
+# Every cache of the program is keyed by the database path, so nothing searched by another test is reused
+@pytest.fixture
+def database_path(generated_database_path, tmp_path):
+    database_path = str(tmp_path / "cars.db")
+    shutil.copyfile(generated_database_path, database_path)
+    yield database_path
+    set_columnar_engine_enabled(True)
+    clear_result_caches()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def stop_worker_processes():
+    yield
+    shutdown_process_pools()
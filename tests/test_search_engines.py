@@ -0,0 +1,144 @@
+import pytest
+
+from batch_search import get_country_cylinder_specs, search_batch
+from car_search import find_matching_row_ids
+from columnar_engine import check_equivalence, generate_search_parameters, get_columnar_engine, set_columnar_engine_enabled
+from connection_pool import get_database_fingerprint
+from conftest import TABLE_NAME
+from facets import read_facet_counts
+from parallel_scan import read_matching_row_ids_in_parallel
+from result_cache import clear_result_caches, read_matching_row_ids
+from search_spec import SearchSpec, compile_search_conditions, compile_search_spec, get_search_spec
+from text_search import ensure_text_index
+
+# Random searches compared between the engines (see generate_search_parameters)
+SEARCH_COUNT = 40
+# Searches with keywords, which the columnar engine answers from the full-text index
+TEXT_SEARCHES = [SearchSpec(text="Toyota"), SearchSpec(text="cor"), SearchSpec(brand="BMW", text="3"),
+                 SearchSpec(text="GT", engine_hp=(200, None))]
+# Keywords that have to find the same cars before and after the full-text index is built: parts of words that are not their start,
+#   words split on punctuation, several words and a last word that is only the start of one
+TEXT_INDEX_SEARCHES = [SearchSpec(text=text) for text in ["olla", "ruiser", "cor", "Toyota Cor", "land cruiser", "BMW 3", "2.0 mt",
+                                                          "3.0", "Mercedes-Benz", "benz", "GT"]]
+
+
+# Returns the random searches of the tests, as specs
+def get_random_search_specs(database_path):
+    return [get_search_spec(parameters) for parameters in generate_search_parameters(database_path, TABLE_NAME, SEARCH_COUNT)]
+
+
+# Returns the rowids of a search in SQLite or with the columnar engine, without the result cache
+def find_row_ids_with_engine(database_path, search_spec, columnar):
+    set_columnar_engine_enabled(columnar)
+    clear_result_caches()
+    return list(find_matching_row_ids(database_path, TABLE_NAME, search_spec))
+
+
+@pytest.fixture
+def columnar_database_path(database_path):
+    if get_columnar_engine(database_path, TABLE_NAME) is None:
+        pytest.skip("the columnar engine needs NumPy")
+    return database_path
+
+
+# The first search of a database builds its derived table (and the columnar engine its snapshot), it has to find the same cars
+#   as every later one
+def test_first_search_on_cold_database(database_path):
+    search_spec = SearchSpec(brand="Toyota")
+    first_row_ids = list(find_matching_row_ids(database_path, TABLE_NAME, search_spec))
+    assert first_row_ids
+    assert find_row_ids_with_engine(database_path, search_spec, columnar=False) == first_row_ids
+
+
+def test_columnar_engine_matches_sqlite(columnar_database_path):
+    # SQLite searches first, so its first search is the one building the derived table
+    search_specs = get_random_search_specs(columnar_database_path) + TEXT_SEARCHES
+    for search_spec in search_specs:
+        assert find_row_ids_with_engine(columnar_database_path, search_spec, columnar=False) == \
+            find_row_ids_with_engine(columnar_database_path, search_spec, columnar=True), search_spec
+
+
+# Keyword searches use LIKE until the full-text index is built (outside of the searches), then the index
+def test_columnar_engine_matches_sqlite_with_text_index(columnar_database_path):
+    assert ensure_text_index(columnar_database_path, TABLE_NAME)
+    for search_spec in TEXT_SEARCHES:
+        assert find_row_ids_with_engine(columnar_database_path, search_spec, columnar=False) == \
+            find_row_ids_with_engine(columnar_database_path, search_spec, columnar=True), search_spec
+
+
+# Without the index the keywords are matched on the columns themselves, with the same meaning as the index
+def test_text_search_matches_text_index(database_path):
+    row_ids_without_index = [find_row_ids_with_engine(database_path, search_spec, columnar=False) for search_spec in TEXT_INDEX_SEARCHES]
+    assert ensure_text_index(database_path, TABLE_NAME)
+    for search_spec, row_ids in zip(TEXT_INDEX_SEARCHES, row_ids_without_index):
+        assert find_row_ids_with_engine(database_path, search_spec, columnar=False) == row_ids, search_spec
+
+
+# Without the derived table (read-only database) a car with several seat layouts ("5, 7" or "2, 4") is found by the same seat
+#   ranges as with it, including ranges between its layouts
+@pytest.mark.parametrize("seating_capacity", [(6, 6), (3, 3), (3, 6), (6, None), (None, 4), (8, 9)])
+def test_seat_filter_matches_without_derived_table(database_path, seating_capacity):
+    search_spec = SearchSpec(seating_capacity=seating_capacity)
+    compile_search_spec(database_path, TABLE_NAME, search_spec)
+    fingerprint = tuple(get_database_fingerprint(database_path))
+    row_ids = []
+    for derived_table_ready in [True, False]:
+        where_clause, paramaters = compile_search_conditions(database_path, TABLE_NAME, search_spec, derived_table_ready, False, fingerprint)
+        row_ids.append(list(read_matching_row_ids(database_path, TABLE_NAME, where_clause, paramaters)))
+    assert row_ids[0]
+    assert row_ids[0] == row_ids[1]
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_batch_matches_sequential_searches(database_path, columnar):
+    if columnar and get_columnar_engine(database_path, TABLE_NAME) is None:
+        pytest.skip("the columnar engine needs NumPy")
+    search_specs = get_country_cylinder_specs() + get_random_search_specs(database_path)
+    set_columnar_engine_enabled(columnar)
+    clear_result_caches()
+    batch_row_ids = [list(row_ids) for row_ids in search_batch(database_path, TABLE_NAME, search_specs)]
+    assert batch_row_ids == [find_row_ids_with_engine(database_path, search_spec, columnar) for search_spec in search_specs]
+
+
+def test_parallel_scan_matches_serial_scan(database_path):
+    for search_spec in get_random_search_specs(database_path)[:10] + TEXT_SEARCHES:
+        where_clause, paramaters = compile_search_spec(database_path, TABLE_NAME, search_spec)
+        assert list(read_matching_row_ids_in_parallel(database_path, TABLE_NAME, where_clause, paramaters, 2)) == \
+            list(read_matching_row_ids(database_path, TABLE_NAME, where_clause, paramaters)), search_spec
+
+
+def test_facet_counts_match_between_engines(columnar_database_path):
+    columnar_engine = get_columnar_engine(columnar_database_path, TABLE_NAME)
+    for search_spec in [SearchSpec()] + get_random_search_specs(columnar_database_path)[:10]:
+        assert columnar_engine.get_facet_counts(search_spec) == read_facet_counts(columnar_database_path, TABLE_NAME, search_spec), \
+            search_spec
+
+
+# The search of the GUI, the one that used to fail on a cold database while it held a cursor and the derived table was written
+def test_gui_search_on_cold_database(database_path):
+    AutoMatch = pytest.importorskip("AutoMatch")
+    search_spec = SearchSpec(brand="Toyota")
+    results = [AutoMatch.search_cars(database_path, TABLE_NAME, search_spec, AutoMatch.variable_names, "advanced") for _ in range(2)]
+    assert isinstance(results[0], tuple)
+    assert results[0] == results[1]
+    assert results[0][1] == len(find_matching_row_ids(database_path, TABLE_NAME, search_spec))
+
+
+# The check of the columnar engine through the search of the GUI (python columnar_engine.py check)
+def test_check_equivalence(columnar_database_path):
+    pytest.importorskip("AutoMatch")
+    assert check_equivalence(columnar_database_path, TABLE_NAME, generate_search_parameters(columnar_database_path, TABLE_NAME, 20)) == 0
+
+
+# The first keyword search of a database, before the full-text index exists, and the same search once it is built
+def test_first_text_search(database_path):
+    AutoMatch = pytest.importorskip("AutoMatch")
+    search_spec = SearchSpec(text="Toyota")
+    results = [AutoMatch.search_cars(database_path, TABLE_NAME, search_spec, AutoMatch.variable_names, "advanced") for _ in range(2)]
+    assert isinstance(results[0], tuple)
+    assert results[0] == results[1]
+    assert ensure_text_index(database_path, TABLE_NAME)
+    clear_result_caches()
+    result = AutoMatch.search_cars(database_path, TABLE_NAME, search_spec, AutoMatch.variable_names, "advanced")
+    assert isinstance(result, tuple)
+    assert result[1] == results[0][1]
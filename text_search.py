@@ -0,0 +1,211 @@
+import argparse
+import json
+import sqlite3
+import time
+from array import array
+
+from connection_pool import get_connection_pool
+from result_cache import read_matching_row_ids
+from statistics_catalog import get_catalog, get_table_catalog, keep_catalog_valid, save_catalog_file
+from tracing import trace_span
+
+
+# Free-text search over the names of the cars, for keywords such as "GT3 RS" or "Type R" instead of scrolling the model list
+# The words are looked up in an FTS5 full-text index that lives in the database next to the car table
+# Triggers on the car table keep the index in sync when cars are added, changed or removed, so unlike the derived table
+#   it is built once and not every time the database file changes
+# Every word of the search has to be found in one of the columns, the last word may be the start of a word as it may still be typed
+# The index is built outside of the searches (when the window opens, or with the build command), as writing it to the database
+#   in the middle of a search would change the file under the search
+# Until it is built, or when it cannot be (read-only database, SQLite without FTS5), the words are matched with GLOB on every car,
+#   with the same meaning as the index
+
+# Text columns of the car table in the index, with their weight when the matches are ranked (bm25)
+# A word found in the model or the trim says more about the car than the same word in its series or generation
+TEXT_COLUMN_WEIGHTS = {"make": 2.0, "model": 4.0, "series": 1.0, "generation": 1.0, "trim": 2.0}
+# Most cars ranked by how well they match, ranking costs more than finding the matches and says little about a search
+#   as broad as a single letter or a brand name, whose cars are then shown in rowid order
+MAX_RANKED_CARS = 5000
+
+
+# Returns the name of the full-text index that belongs to a car table
+def get_text_index_name(table_name):
+    return f"{table_name}_text"
+
+
+# Returns the words of a free-text search, leaving out the ones without a letter or a digit (such as a lone "-")
+def get_search_words(text):
+    return [word for word in text.split() if any(character.isalnum() for character in word)]
+
+
+# Returns the FTS5 query of a free-text search
+# Every word is quoted, so "-" or "*" typed by the user are never read as operators, and the last one is a prefix
+def get_match_query(text):
+    words = ['"' + word.replace('"', '""') + '"' for word in get_search_words(text)]
+    return " ".join(words) + "*"
+
+
+# Returns the statements creating the index and the triggers that keep it in sync with the car table, by name
+def get_text_index_statements(table_name):
+    text_index_name = get_text_index_name(table_name)
+    columns = ", ".join(TEXT_COLUMN_WEIGHTS)
+    delete_old_values = (f"INSERT INTO {text_index_name} ({text_index_name}, rowid, {columns}) "
+                         f"VALUES ('delete', old.rowid, {', '.join(f'old.{column}' for column in TEXT_COLUMN_WEIGHTS)});")
+    insert_new_values = (f"INSERT INTO {text_index_name} (rowid, {columns}) "
+                         f"VALUES (new.rowid, {', '.join(f'new.{column}' for column in TEXT_COLUMN_WEIGHTS)});")
+    # The index only holds the words, the text itself is read from the car table (an external content table)
+    return {
+        text_index_name: f"CREATE VIRTUAL TABLE {text_index_name} USING fts5({columns}, content='{table_name}', "
+                         f"tokenize='unicode61 remove_diacritics 2')",
+        f"{text_index_name}_insert": f"CREATE TRIGGER {text_index_name}_insert AFTER INSERT ON {table_name} "
+                                     f"BEGIN {insert_new_values} END",
+        f"{text_index_name}_delete": f"CREATE TRIGGER {text_index_name}_delete AFTER DELETE ON {table_name} "
+                                     f"BEGIN {delete_old_values} END",
+        f"{text_index_name}_update": f"CREATE TRIGGER {text_index_name}_update AFTER UPDATE OF {columns} ON {table_name} "
+                                     f"BEGIN {delete_old_values} {insert_new_values} END",
+        }
+
+
+# Returns the statements the index and its triggers were created with in the database, by name (empty if there is no index)
+def read_text_index_statements(database_path, table_name):
+    statements = get_text_index_statements(table_name)
+    cursor = get_connection_pool(database_path).execute(
+        f"SELECT name, sql FROM sqlite_master WHERE name IN ({', '.join(['?'] * len(statements))})", list(statements))
+    return dict(cursor.fetchall())
+
+
+# Builds the index (and its triggers) from every car of the table, replacing the previous index
+def build_text_index(database_path, table_name):
+    text_index_name = get_text_index_name(table_name)
+    with keep_catalog_valid(database_path) as catalog:
+        connection = sqlite3.connect(database_path)
+        try:
+            cursor = connection.cursor()
+            for name in get_text_index_statements(table_name):
+                if name == text_index_name:
+                    cursor.execute(f"DROP TABLE IF EXISTS {name}")
+                else:
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            for statement in get_text_index_statements(table_name).values():
+                cursor.execute(statement)
+            cursor.execute(f"INSERT INTO {text_index_name} ({text_index_name}) VALUES ('rebuild')")
+            connection.commit()
+        finally:
+            connection.close()
+
+        table_catalog = catalog["tables"].setdefault(table_name, {})
+        table_catalog["text_index"] = True
+
+
+# Returns True if the index exists and was created the way the code creates it (the same columns and triggers)
+# Only reads the database, so it can be called by the searches
+def is_text_index_ready(database_path, table_name):
+    try:
+        table_catalog = get_table_catalog(database_path, table_name)
+        if table_catalog.get("text_index"):
+            return True
+        if read_text_index_statements(database_path, table_name) != get_text_index_statements(table_name):
+            return False
+        # The catalog is new because the database changed, but the triggers kept the index in sync
+        table_catalog["text_index"] = True
+        save_catalog_file(database_path, get_catalog(database_path))
+        return True
+    except sqlite3.Error as e:
+        print("Could not read the text index:", e)
+        return False
+
+
+# Builds the index unless it is ready, never called during a search
+# Returns True if the index can be used, False if it could not be built (for example when the database is read-only)
+def ensure_text_index(database_path, table_name):
+    if is_text_index_ready(database_path, table_name):
+        return True
+    try:
+        with trace_span("build text index"):
+            build_text_index(database_path, table_name)
+        return True
+    except sqlite3.Error as e:
+        print("Could not build the text index:", e)
+        return False
+
+
+# Returns the SQL condition (and its parameters) that keeps only the cars matching a free-text search
+def get_text_condition(table_name, text, text_index_ready):
+    if text_index_ready:
+        text_index_name = get_text_index_name(table_name)
+        return f"rowid IN (SELECT rowid FROM {text_index_name} WHERE {text_index_name} MATCH ?)", [get_match_query(text)]
+
+    # Without the index the words are matched the way the index matches them: every word is a whole word of one of the columns,
+    #   and the last word the start of a word
+    # The index splits words on anything that is not a letter or a digit ("Mercedes-Benz" is "mercedes" "benz"), so a search word
+    #   is split the same way and its parts have to follow each other; the columns are padded with spaces so that the first and
+    #   the last word of a column also have a separator around them
+    # Case is only ignored for ASCII letters (SQLite lower), the index also ignores the case and the accents of other letters
+    conditions = []
+    paramaters = []
+    search_words = get_search_words(text)
+    for index, word in enumerate(search_words):
+        parts = "".join(character if character.isalnum() else " " for character in word.lower()).split()
+        pattern = "*[^0-9a-z]" + "[^0-9a-z]".join(parts) + ("*" if index == len(search_words) - 1 else "[^0-9a-z]*")
+        conditions.append("(" + " OR ".join(f"' ' || lower({column}) || ' ' GLOB ?" for column in TEXT_COLUMN_WEIGHTS) + ")")
+        paramaters.extend([pattern] * len(TEXT_COLUMN_WEIGHTS))
+    return " AND ".join(conditions), paramaters
+
+
+# Returns the rowids of the cars matching a free-text search, in rowid order
+# Raises sqlite3.Error if the database cannot be searched
+def read_text_row_ids(database_path, table_name, text):
+    condition, paramaters = get_text_condition(table_name, text, is_text_index_ready(database_path, table_name))
+    return read_matching_row_ids(database_path, table_name, condition, paramaters)
+
+
+# Returns the given cars (rowids of cars matching a free-text search) with the best matches of the text first
+# The cars stay in the given order when there is no text, no index to rank them with or more than MAX_RANKED_CARS cars
+# Raises sqlite3.Error if the database cannot be searched
+def rank_text_matches(database_path, table_name, text, row_ids):
+    if text is None or len(row_ids) > MAX_RANKED_CARS or not is_text_index_ready(database_path, table_name):
+        return row_ids
+    text_index_name = get_text_index_name(table_name)
+    # Only the given cars are scored, their rowids are passed as one JSON array so the statement stays the same for every search
+    # The unary + keeps the rowids out of the index lookup: the index would look the text up again for every rowid in the list,
+    #   it looks it up once and the list is only checked on the cars it finds
+    with trace_span("rank text matches", rows=len(row_ids)):
+        cursor = get_connection_pool(database_path).execute(
+            f"SELECT rowid FROM {text_index_name} WHERE {text_index_name} MATCH ? AND +rowid IN (SELECT value FROM json_each(?)) "
+            f"ORDER BY bm25({text_index_name}, {', '.join(map(str, TEXT_COLUMN_WEIGHTS.values()))}), rowid",
+            [get_match_query(text), json.dumps(list(map(int, row_ids)))])
+        ranked_row_ids = array("q", (row[0] for row in cursor.fetchall()))
+        cursor.close()
+    return ranked_row_ids
+
+
+# Maintenance command, for example:
+#   python text_search.py build car_database.db
+#   python text_search.py search car_database.db "GT3 RS" (timed against the search used without the index)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the full-text index of the car names or times a free-text search")
+    parser.add_argument("command", choices=["build", "search"])
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("text", nargs="?", default="")
+    parser.add_argument("--table", default="car_db_metric")
+    arguments = parser.parse_args()
+
+    try:
+        if arguments.command == "build":
+            start_time = time.perf_counter()
+            build_text_index(arguments.database_path, arguments.table)
+            print(f"Text index built in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+        elif not get_search_words(arguments.text):
+            parser.error("the search needs at least one word")
+        else:
+            ensure_text_index(arguments.database_path, arguments.table)
+            for method, text_index_ready in [("Full-text index", True), ("Without the index", False)]:
+                condition, paramaters = get_text_condition(arguments.table, arguments.text, text_index_ready)
+                start_time = time.perf_counter()
+                row_ids = read_matching_row_ids(arguments.database_path, arguments.table, condition, paramaters)
+                if text_index_ready:
+                    row_ids = rank_text_matches(arguments.database_path, arguments.table, arguments.text, row_ids)
+                print(f"{method}: {len(row_ids)} cars in {(time.perf_counter() - start_time) * 1000:.2f} ms")
+    except sqlite3.Error as e:
+        print("An error occurred:", e)
+        raise SystemExit(1)
@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import time
+
+
+# Tracing: timing spans around the phases of a search (building the query, running it, fetching, formatting, showing the cars)
+#   and around the handlers of the window, to see where the time of a slow search goes
+# Spans are off by default: trace_span then returns a shared span that does nothing, so the spans left in the code cost
+#   a function call and a "with" block each
+# Turned on with set_trace_path (or the AUTOMATCH_TRACE environment variable, for the GUI), the spans are written
+#   to a file in the Chrome trace format, opened with chrome://tracing or https://ui.perfetto.dev
+# Spans of a thread are nested by time, so the viewer shows them as a tree: a search, the queries it ran, their fetches...
+
+# Environment variable naming the trace file, read when the module is imported
+TRACE_PATH_VARIABLE = "AUTOMATCH_TRACE"
+
+# Longest query text attached to a span
+TRACED_QUERY_LENGTH = 200
+
+# File the spans are written to, None when tracing is off (set_trace_path)
+trace_path = None
+# Finished spans not written yet, they are written when the outermost span of a thread ends
+pending_events = []
+trace_lock = threading.Lock()
+# Threads whose name was written to the trace file
+named_threads = set()
+# Number of spans open on each thread
+thread_data = threading.local()
+
+
+class Span:
+    __slots__ = ("name", "args", "start_time")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start_time = 0
+
+    def __enter__(self):
+        thread_data.depth = getattr(thread_data, "depth", 0) + 1
+        self.start_time = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        end_time = time.perf_counter_ns()
+        if exception_type is not None:
+            self.args["error"] = f"{exception_type.__name__}: {exception}"
+        thread_data.depth -= 1
+        add_trace_event(self.name, self.start_time, end_time, self.args, thread_data.depth == 0)
+        return False
+
+    # Attaches values to the span once they are known, such as the number of cars a fetch returned
+    def set(self, **args):
+        self.args.update(args)
+
+
+# Returned by trace_span while tracing is off
+class DisabledSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+DISABLED_SPAN = DisabledSpan()
+
+
+# Returns a span to time a block with ("with trace_span(...) as span:"), the arguments are shown with the span in the viewer
+def trace_span(name, **args):
+    if trace_path is None:
+        return DISABLED_SPAN
+    return Span(name, args)
+
+
+# Turns tracing on, writing the spans to a new trace file (replacing any file at that path), or off when trace_path is None
+def set_trace_path(path):
+    global trace_path
+    with trace_lock:
+        write_pending_events()
+        trace_path = path
+        named_threads.clear()
+        if path is not None:
+            # The closing bracket of the event list may be left out, so spans can be added to the file until the program stops
+            with open(path, "w") as file:
+                file.write("[\n")
+
+
+# Records a finished span, writing the spans of the thread to the file when its outermost span ended
+def add_trace_event(name, start_time, end_time, args, is_outermost):
+    thread_id = threading.get_ident()
+    event = {"name": name, "ph": "X", "ts": start_time / 1000, "dur": (end_time - start_time) / 1000, "pid": os.getpid(),
+             "tid": thread_id, "args": args}
+    with trace_lock:
+        if thread_id not in named_threads:
+            named_threads.add(thread_id)
+            pending_events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread_id,
+                                   "args": {"name": threading.current_thread().name}})
+        pending_events.append(event)
+        if is_outermost:
+            write_pending_events()
+
+
+# Appends the pending spans to the trace file, must be called with trace_lock held
+def write_pending_events():
+    if trace_path is None or not pending_events:
+        pending_events.clear()
+        return
+    try:
+        with open(trace_path, "a") as file:
+            for event in pending_events:
+                file.write(json.dumps(event, default=str))
+                file.write(",\n")
+    except OSError as e:
+        print("Could not write the trace file:", e)
+    pending_events.clear()
+
+
+if os.environ.get(TRACE_PATH_VARIABLE):
+    set_trace_path(os.environ[TRACE_PATH_VARIABLE])
@@ -0,0 +1,129 @@
+import argparse
+import heapq
+import random
+import time
+from array import array
+from collections import Counter
+
+from columnar_snapshot import np
+
+
+# Trigram index for typo-tolerant lookups of names, such as "Lamborgini" for "Lamborghini" or "Mercedez" for "Mercedes-Benz"
+# Every name is cut into the overlapping groups of three characters of its words (padded with spaces, so the start and the end
+#   of a word count too) and names are ranked by the share of trigrams they have in common with the typed text, as in pg_trgm
+# Only the names sharing at least one trigram with the text are scored, they are found through the list of names of every trigram
+# With NumPy the trigrams in common are counted for every name at once (bincount), otherwise name by name with a Counter
+
+# Least similarity (0 to 1) of a name to the typed text before it is suggested
+SIMILARITY_THRESHOLD = 0.3
+# Number of names suggested
+MAX_SUGGESTIONS = 10
+
+
+# Returns the trigrams of a text, ignoring case and punctuation
+def get_trigrams(text):
+    trigrams = set()
+    for word in "".join(character if character.isalnum() else " " for character in text.lower()).split():
+        padded_word = f"  {word} "
+        trigrams.update(padded_word[index:index + 3] for index in range(len(padded_word) - 2))
+    return trigrams
+
+
+class TrigramIndex:
+    def __init__(self, names):
+        # A name is known by its position in this list
+        self.names = list(names)
+        # Number of trigrams of every name
+        self.trigram_counts = array("H")
+        positions_by_trigram = {}
+        for position, name in enumerate(self.names):
+            trigrams = get_trigrams(name)
+            self.trigram_counts.append(min(len(trigrams), 65535))
+            for trigram in trigrams:
+                positions_by_trigram.setdefault(trigram, []).append(position)
+        # Positions of the names having each trigram, as arrays, which take a fraction of the memory of lists of ints
+        self.positions_by_trigram = {trigram: array("i", positions) for trigram, positions in positions_by_trigram.items()}
+        if np is not None:
+            self.trigram_counts = np.frombuffer(self.trigram_counts, dtype=np.uint16).astype(np.int32)
+            self.positions_by_trigram = {trigram: np.frombuffer(positions, dtype=np.int32)
+                                         for trigram, positions in self.positions_by_trigram.items()}
+
+    # Returns the names most similar to a text, as (similarity, name) pairs, the most similar first
+    # With allowed_names (a set), only those names are suggested
+    def get_similar_names(self, text, count=MAX_SUGGESTIONS, threshold=SIMILARITY_THRESHOLD, allowed_names=None):
+        trigrams = get_trigrams(text)
+        positions = [self.positions_by_trigram[trigram] for trigram in trigrams if trigram in self.positions_by_trigram]
+        if not positions:
+            return []
+
+        # Similarity of a name: its trigrams in common with the text out of all the trigrams of both
+        if np is not None:
+            shared_counts = np.bincount(np.concatenate(positions), minlength=len(self.names))
+            similarities = shared_counts / (len(trigrams) + self.trigram_counts - shared_counts)
+            similar_positions = np.flatnonzero(similarities >= threshold)
+            similar_names = [(float(similarities[position]), self.names[position]) for position in similar_positions.tolist()]
+        else:
+            # Only the names with a trigram in common get a count
+            shared_counts = Counter()
+            for name_positions in positions:
+                shared_counts.update(name_positions)
+            similar_names = []
+            for position, shared_count in shared_counts.items():
+                similarity = shared_count / (len(trigrams) + self.trigram_counts[position] - shared_count)
+                if similarity >= threshold:
+                    similar_names.append((similarity, self.names[position]))
+
+        if allowed_names is not None:
+            similar_names = [similar_name for similar_name in similar_names if similar_name[1] in allowed_names]
+        # The most similar first, then in alphabetical order
+        return heapq.nsmallest(count, similar_names, key=lambda similar_name: (-similar_name[0], similar_name[1]))
+
+
+# Returns a copy of a name with one typo: a character left out, doubled, replaced or swapped with the next one
+def add_typo(name, random_generator):
+    index = random_generator.randrange(len(name))
+    typo = random_generator.choice(["left out", "doubled", "replaced", "swapped"])
+    if typo == "left out":
+        return name[:index] + name[index + 1:]
+    if typo == "doubled":
+        return name[:index] + name[index] + name[index:]
+    if typo == "replaced":
+        return name[:index] + random_generator.choice("abcdefghijklmnopqrstuvwxyz") + name[index + 1:]
+    return name[:index] + name[index + 1:index + 2] + name[index] + name[index + 2:]
+
+
+# Maintenance command, for example:
+#   python trigram_index.py car_database.db  (times lookups of misspelled models and brands, and how often the right one comes first)
+if __name__ == "__main__":
+    from model_index import get_model_index
+
+    parser = argparse.ArgumentParser(description="Times the typo-tolerant lookups of the brands and models")
+    parser.add_argument("database_path", nargs="?", default="car_database.db")
+    parser.add_argument("--table", default="car_db_metric")
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    start_time = time.perf_counter()
+    model_index = get_model_index(arguments.database_path, arguments.table)
+    if model_index is None:
+        raise SystemExit(1)
+    print(f"Built the indexes of {len(model_index.models_by_make)} brands and {len(model_index.model_trigram_index.names)} models "
+          f"in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+
+    random_generator = random.Random(arguments.seed)
+    for kind, trigram_index in [("brands", model_index.make_trigram_index), ("models", model_index.model_trigram_index)]:
+        names = [name for name in trigram_index.names if len(name) >= 4]
+        if not names:
+            continue
+        misspelled_names = [(name, add_typo(name, random_generator)) for name in random_generator.choices(names, k=arguments.lookups)]
+        times = []
+        found_first = 0
+        for name, misspelled_name in misspelled_names:
+            start_time = time.perf_counter()
+            similar_names = trigram_index.get_similar_names(misspelled_name)
+            times.append(time.perf_counter() - start_time)
+            found_first += bool(similar_names) and similar_names[0][1] == name
+        times.sort()
+        print(f"{kind}: p50 {times[len(times) // 2] * 1000:.3f} ms, p95 {times[int(len(times) * 0.95)] * 1000:.3f} ms, "
+              f"max {times[-1] * 1000:.3f} ms, right name first for {found_first / len(times):.0%} of the typos")